@@ -4,13 +4,19 @@
 #  - game: Game itself.
 
 import abc
-import queue
+import collections
+import functools
+import itertools
+import threading
 import time
-from typing import List, Tuple, Set
+from typing import Iterator, List, Tuple, Set
 
 import actions
 import game_client
 import shape
+from agents import placement
+from agents import reachability
+from agents import surface
 
 
 class Env:
@@ -18,23 +24,56 @@ class Env:
     self.game = game
 
 
+# RunGame gives each decision this fraction of the gravity interval of the
+# game, so the actions are sent before the piece falls from the position they
+# were computed for.
+DEADLINE_GRAVITY_FRACTION = 0.8
+
+
 class Agent:
   def __init__(self, env: Env, decision_interval: float = 0.1):
     self.env = env
     # Time interval between making two decisions
     self.decision_interval = decision_interval
+    # Counters of the decisions with a deadline, see RunGame.
+    self.decisions = 0
+    self.deadline_misses = 0
+    # Search depth reached by the last decision, set by the agents.
+    self.search_depth = 0
+    # Search depth -> number of decisions with a deadline which reached it.
+    self.search_depths = collections.Counter()
 
   @abc.abstractmethod
-  def MakeDecision(self) -> List[actions.Action]:
-    """Returns a list of actions based on the current game state."""
+  def MakeDecision(self, deadline: float = None) -> List[actions.Action]:
+    """Returns a list of actions based on the current game state.
+    :param deadline: time.time() by which the actions must be returned.  Agents
+           that search refine a best answer so far and return it once the
+           deadline is reached.  None for no time limit.
+    """
     raise NotImplementedError()
 
+  def DecisionDeadline(self, start: float) -> float:
+    """Returns the deadline of a decision started at start, derived from the
+    gravity speed of the game."""
+    interval = self.env.game._current_spawn_interval / 1000
+    return start + DEADLINE_GRAVITY_FRACTION * interval
+
+  def Decide(self, deadline: float) -> List[actions.Action]:
+    """Makes a decision with a deadline and updates the counters."""
+    acts = self.MakeDecision(deadline)
+    self.decisions += 1
+    if time.time() > deadline:
+      self.deadline_misses += 1
+    self.search_depths[self.search_depth] += 1
+    return acts
+
   def RunGame(self):
     while True:
       start = time.time()
-      actions = self.MakeDecision()
+      actions = self.Decide(self.DecisionDeadline(start))
       self.env.game.ProcessActions(actions)
-      print(f"{(time.time() - start) * 1000} ms")
+      print(f"{(time.time() - start) * 1000} ms, depth {self.search_depth}, "
+            f"{self.deadline_misses}/{self.decisions} deadline misses")
       time.sleep(self.decision_interval)
 
 
@@ -42,30 +81,100 @@ def _AtBottom(piece: shape.Shape, game: game_client.GameClient):
   return not game.CheckValidity(piece, offset=(1, 0))
 
 
+class _VisitedArray:
+  """Visited flags of the (x, y, state) of a piece, reused by the searches.
+
+  The flag of a position is at
+    state * H * W + (x + map_height_padding) * W + (y + map_side_padding)
+  where H and W cover all the valid positions.  A position is visited when its
+  stamp equals the current epoch, so clearing the flags is O(1).
+  """
+
+  def __init__(self):
+    self.stamps = []
+    self.epoch = 0
+    self.dims = None
+    self.h_stride = 0
+    self.state_stride = 0
+    self.x0 = 0
+    self.y0 = 0
+
+  def Reset(self, game: game_client.GameClient):
+    # A piece is valid from x = -3 (its last row on the first row) to the
+    # last row, and from y = -map_side_padding (the left padding) to width.
+    dims = (len(game.bit_map), game.width, game.map_side_padding)
+    if dims != self.dims:
+      self.dims = dims
+      self.x0 = 3
+      self.y0 = game.map_side_padding
+      self.h_stride = game.width + self.y0
+      self.state_stride = (len(game.bit_map) + self.x0) * self.h_stride
+      self.stamps = 4 * self.state_stride * [0]
+    self.epoch += 1
+
+  def Index(self, piece: shape.Shape) -> int:
+    return (piece.state * self.state_stride +
+            (piece.x + self.x0) * self.h_stride + piece.y + self.y0)
+
+
+# Each thread reuses its own visited array.
+_thread_local = threading.local()
+
+
+def _GetVisitedArray(game: game_client.GameClient) -> _VisitedArray:
+  visited = getattr(_thread_local, "visited", None)
+  if visited is None:
+    visited = _thread_local.visited = _VisitedArray()
+  visited.Reset(game)
+  return visited
+
+
+def _ActionsFromParents(parents: List[int], moves: List[actions.Action],
+                        node: int) -> List[actions.Action]:
+  """Returns the cleaned actions from the start node (0) to the node, then
+  the hard drop.  The search records the parent node and the action of each
+  node."""
+  path = [actions.Action(dir=actions.HARD_DROP)]
+  while node > 0:
+    path.append(moves[node])
+    node = parents[node]
+  path.reverse()
+  return _CleanPath(path)
+
+
+def IsSwap(move) -> bool:
+  """Returns True if a result of the generators is the swap, without finding
+  the actions of a lazy placement."""
+  return not isinstance(move, placement.Placement) and move[1][0].swap
+
+
 def _GetHardDroppedPiece(game, piece) -> shape.Shape:
   hard_drop_piece = piece.copy()
-  while game.CheckValidity(hard_drop_piece, (1, 0)):
-    hard_drop_piece.x += 1
+  hard_drop_piece.x += game.DropDistance(piece)
   return hard_drop_piece
 
 
+def _CleanPath(p: List[actions.Action]) -> List[actions.Action]:
+  """Removes the moves that cancel out from a path."""
+  cleaned_path = []
+  i = 0
+  while i < len(p) - 1:
+    if p[i].direction == actions.LEFT and p[i + 1].direction == actions.RIGHT:
+      i += 1
+    elif p[i].direction == actions.RIGHT and p[i + 1].direction == actions.LEFT:
+      i += 1
+    elif p[i].direction == actions.SOFT_DROP and p[i + 1].direction == actions.HARD_DROP:
+      pass
+    else:
+      cleaned_path.append(p[i])
+    i += 1
+  cleaned_path.append(p[i])
+  return cleaned_path
+
+
 def CleanRst(rst: List[Tuple[shape.Shape, List[actions.Action]]]):
   for x in range(len(rst)):
-    p = rst[x][1]
-    cleaned_path = []
-    i = 0
-    while i < len(p) - 1:
-      if p[i].direction == actions.LEFT and p[i + 1].direction == actions.RIGHT:
-        i += 1
-      elif p[i].direction == actions.RIGHT and p[i + 1].direction == actions.LEFT:
-        i += 1
-      elif p[i].direction == actions.SOFT_DROP and p[i + 1].direction == actions.HARD_DROP:
-        pass
-      else:
-        cleaned_path.append(p[i])
-      i += 1
-    cleaned_path.append(p[i])
-    rst[x] = (rst[x][0], cleaned_path)
+    rst[x] = (rst[x][0], _CleanPath(rst[x][1]))
 
 
 def DFS(game: game_client.GameClient, piece: shape.Shape,
@@ -91,11 +200,10 @@ def DFS(game: game_client.GameClient, piece: shape.Shape,
     ret.append((piece.copy(), cur_path + [actions.Action(dir=actions.HARD_DROP)]))
 
   # SoftDrop
-  piece_to_expand = piece.copy()
-  if game.CheckValidity(piece_to_expand, (1, 0)):
-    piece_to_expand.x += 1
-    while game.CheckValidity(piece_to_expand, (1, 0)):
-      piece_to_expand.x += 1
+  distance = game.DropDistance(piece)
+  if distance > 0:
+    piece_to_expand = piece.copy()
+    piece_to_expand.x += distance
     action = actions.Action(dir=actions.SOFT_DROP)
     DFS(game, piece_to_expand, ret, visited, cur_path, action)
 
@@ -134,7 +242,7 @@ def GetPossiblePositionsQuickVersion2(piece: shape.Shape, game_: game_client.Gam
   :returns (piece inish state, [actions to this state])
   """
   ret = []
-  game = game_.copy()
+  game = game_.SearchClone()
   # visited[x,y,state]
   visited = set()
   cur_path = []
@@ -143,8 +251,21 @@ def GetPossiblePositionsQuickVersion2(piece: shape.Shape, game_: game_client.Gam
     action = actions.Action(swap=True)
     ret.append((game.piece_list[0], [action]))
 
-  DFS(game, piece, ret, visited, cur_path)
-  CleanRst(ret)
+  found = []
+  DFS(game, piece, found, visited, cur_path)
+
+  # Keeps the shortest path of each footprint, or the one ending with a
+  # rotation for the spins.
+  best = {}
+  for (p, path) in found:
+    footprint = game.GetFootprint(p)
+    key = (len(path), path[-2].rotation == 0 if len(path) > 1 else True)
+    if footprint not in best or key < best[footprint][0]:
+      best[footprint] = (key, p, path)
+
+  # The paths are cleaned when accessed.
+  for (_, p, path) in best.values():
+    ret.append(placement.Placement(p, find_actions=functools.partial(_CleanPath, path)))
   return ret
 
 
@@ -157,70 +278,80 @@ def GetPossiblePositionsQuickVersion(piece: shape.Shape, game_: game_client.Game
   """
   ret = []
 
-  game = game_.copy()
+  game = game_.SearchClone()
   game.SpawnPiece(piece)
 
   if game.can_swap:
     action = actions.Action(swap=True)
     ret.append((game.piece_list[0], [action]))
 
-  # visit[x,y,state]
-  visit = set()
+  if not game.CheckValidity(piece):
+    return ret
+
+  visited = _GetVisitedArray(game)
+  stamps = visited.stamps
+  epoch = visited.epoch
 
-  # Element is (piece, [Actions])
+  # Footprints of the placements found.  The nodes are popped by increasing
+  # number of moves, so the first placement of a footprint has the shortest
+  # path.  The T placements all have different footprints, so their spins
+  # are kept.
+  footprints = set()
 
-  q = queue.Queue()
-  q.put((piece.copy(), []))
+  # Element is (piece, node).  The actions of the placements are built from
+  # the parent and the action of each node when accessed.
+  parents = [-1]
+  moves = [None]
+  q = collections.deque()
+  q.append((piece.copy(), 0))
 
   # This is used to detect if the cur shape is O: rotations can be skipped.
   shape_o_id = shape.O().id
 
-  while not q.empty():
-    (cur, path) = q.get()
-    if (cur.x, cur.y, cur.state) in visit:
+  while q:
+    (cur, node) = q.popleft()
+    index = visited.Index(cur)
+    if stamps[index] == epoch:
       continue
 
-    visit.add((cur.x, cur.y, cur.state))
+    stamps[index] = epoch
 
-    if _AtBottom(cur, game):
-      ret.append((cur.copy(), path + [actions.Action(dir=actions.HARD_DROP)]))
+    at_bottom = _AtBottom(cur, game)
+    if at_bottom:
+      footprint = game.GetFootprint(cur)
+      if footprint not in footprints:
+        footprints.add(footprint)
+        ret.append(placement.Placement(cur, find_actions=functools.partial(
+          _ActionsFromParents, parents, moves, node)))
 
     # SoftDrop
     piece_to_expand = cur.copy()
-    while game.CheckValidity(piece_to_expand, (1, 0)):
-      piece_to_expand.x += 1
-    action = actions.Action(dir=actions.SOFT_DROP)
-    if (piece_to_expand.x, piece_to_expand.y,
-        piece_to_expand.state) not in visit:
-      q.put((piece_to_expand, path + [action]))
+    piece_to_expand.x += game.DropDistance(cur)
+    if stamps[visited.Index(piece_to_expand)] != epoch:
+      parents.append(node)
+      moves.append(actions.Action(dir=actions.SOFT_DROP))
+      q.append((piece_to_expand, len(moves) - 1))
 
     # Left or Right
-    for (x, y) in [(0, 1), (0, -1)]:
-      if (cur.x + x, cur.y + y, cur.state) not in visit:
-        if game.CheckValidity(cur, (x, y)):
-          piece_to_expand = cur.copy()
-          piece_to_expand.x += x
-          piece_to_expand.y += y
-
-          action = actions.Action()
-          if y == 1:
-            action.direction = actions.RIGHT
-          else:
-            action.direction = actions.LEFT
-          if (piece_to_expand.x, piece_to_expand.y,
-              piece_to_expand.state) not in visit:
-            q.put((piece_to_expand, path + [action]))
+    for y in (1, -1):
+      if game.CheckValidity(cur, (0, y)):
+        piece_to_expand = cur.copy()
+        piece_to_expand.y += y
+        if stamps[visited.Index(piece_to_expand)] != epoch:
+          parents.append(node)
+          moves.append(actions.Action(dir=actions.RIGHT if y == 1 else actions.LEFT))
+          q.append((piece_to_expand, len(moves) - 1))
 
     # Expands rotations
-    if _AtBottom(cur, game) and cur.id != shape_o_id:
+    if at_bottom and cur.id != shape_o_id:
       for rotate in [1, 2, 3]:
         game.SpawnPiece(cur.copy())
         if game.Rotate(rotate):
-          if (game.current_piece.x, game.current_piece.y,
-              game.current_piece.state) not in visit:
-            q.put((game.current_piece.copy(), path + [actions.Action(rotation=rotate)]))
+          if stamps[visited.Index(game.current_piece)] != epoch:
+            parents.append(node)
+            moves.append(actions.Action(rotation=rotate))
+            q.append((game.current_piece.copy(), len(moves) - 1))
 
-  CleanRst(ret)
   return ret
 
 
@@ -236,39 +367,56 @@ def GetAllPossiblePositions(piece: shape.Shape,
 
   ret = []
 
-  game = game_.copy()
+  game = game_.SearchClone()
   game.SpawnPiece(piece)
 
   if game.can_swap:
     action = actions.Action(swap=True)
     ret.append((game.piece_list[0], [action]))
 
-  # visit[x,y,state]
-  visit = set()
-
-  # Element is (piece, [Actions])
-
-  q = queue.Queue()
-  q.put((piece.copy(), []))
-
-  while not q.empty():
-    (cur, path) = q.get()
-    if (cur.x, cur.y, cur.state) in visit:
+  if not game.CheckValidity(piece):
+    return ret
+
+  visited = _GetVisitedArray(game)
+  stamps = visited.stamps
+  epoch = visited.epoch
+
+  # Footprints of the placements found.  The nodes are popped by increasing
+  # number of moves, so the first placement of a footprint has the shortest
+  # path.  The T placements all have different footprints, so their spins
+  # are kept.
+  footprints = set()
+
+  # Element is (piece, node).  The actions of the placements are built from
+  # the parent and the action of each node when accessed.
+  parents = [-1]
+  moves = [None]
+  q = collections.deque()
+  q.append((piece.copy(), 0))
+
+  while q:
+    (cur, node) = q.popleft()
+    index = visited.Index(cur)
+    if stamps[index] == epoch:
       continue
 
-    visit.add((cur.x, cur.y, cur.state))
+    stamps[index] = epoch
 
-    if _AtBottom(cur, game):
-      ret.append((cur.copy(), path + [actions.Action(dir=actions.HARD_DROP)]))
+    at_bottom = _AtBottom(cur, game)
+    if at_bottom:
+      footprint = game.GetFootprint(cur)
+      if footprint not in footprints:
+        footprints.add(footprint)
+        ret.append(placement.Placement(cur, find_actions=functools.partial(
+          _ActionsFromParents, parents, moves, node)))
 
     # Exapands Q
     for (x, y) in [(1, 0), (0, 1), (0, -1)]:
-      if (cur.x + x, cur.y + y, cur.state) not in visit:
-        if game.CheckValidity(cur, (x, y)):
-          piece_to_expand = cur.copy()
-          piece_to_expand.x += x
-          piece_to_expand.y += y
-
+      if game.CheckValidity(cur, (x, y)):
+        piece_to_expand = cur.copy()
+        piece_to_expand.x += x
+        piece_to_expand.y += y
+        if stamps[visited.Index(piece_to_expand)] != epoch:
           action = actions.Action()
           if x == 1:
             action.down = True
@@ -276,17 +424,128 @@ def GetAllPossiblePositions(piece: shape.Shape,
             action.direction = actions.RIGHT
           else:
             action.direction = actions.LEFT
-          if (piece_to_expand.x, piece_to_expand.y,
-              piece_to_expand.state) not in visit:
-            q.put((piece_to_expand, path + [action]))
+          parents.append(node)
+          moves.append(action)
+          q.append((piece_to_expand, len(moves) - 1))
 
-    if _AtBottom(cur, game) and cur.id != 4:
+    if at_bottom and cur.id != 4:
       for rotate in [1, 2, 3]:
         game.SpawnPiece(cur.copy())
         if game.Rotate(rotate):
-          if (game.current_piece.x, game.current_piece.y,
-              game.current_piece.state) not in visit:
-            q.put((game.current_piece.copy(), path + [actions.Action(rotation=rotate)]))
+          if stamps[visited.Index(game.current_piece)] != epoch:
+            parents.append(node)
+            moves.append(actions.Action(rotation=rotate))
+            q.append((game.current_piece.copy(), len(moves) - 1))
 
-  CleanRst(ret)
   return ret
+
+
+def GetPossiblePositionsBitboard(piece: shape.Shape, game_: game_client.GameClient) -> (
+    List[Tuple[shape.Shape, List[actions.Action]]]):
+  """Gets the same positions as GetAllPossiblePositions, with the bitboard
+  flood fill in reachability.py.
+
+  The actions of a position are only searched when they are accessed, see
+  placement.Placement.
+  :returns (piece inish state, [actions to this state])
+  """
+  ret = []
+  if game_.can_swap:
+    action = actions.Action(swap=True)
+    ret.append((game_.piece_list[0], [action]))
+
+  ret.extend(reachability.GetPlacements(piece, game_, full_spin=False))
+  return ret
+
+
+def GetPossiblePositionsFullSpin(piece: shape.Shape, game_: game_client.GameClient) -> (
+    List[Tuple[shape.Shape, List[actions.Action]]]):
+  """Gets all possible positions of a piece, including the ones that need a
+  rotation in mid-air or under an overhang (tucks, T-spin setups).
+
+  This is the default generator of the agents.  The actions of a position are
+  only searched when they are accessed, and T paths end with the rotation when
+  possible, so that the spins are scored.
+  :returns (piece inish state, [actions to this state])
+  """
+  ret = []
+  if game_.can_swap:
+    action = actions.Action(swap=True)
+    ret.append((game_.piece_list[0], [action]))
+
+  ret.extend(reachability.GetPlacements(piece, game_))
+  return ret
+
+
+def IterPossiblePositions(piece: shape.Shape, game_: game_client.GameClient,
+                          max_count: int = None, deadline: float = None) -> (
+    Iterator[Tuple[shape.Shape, List[actions.Action]]]):
+  """Yields the positions of GetPossiblePositionsFullSpin one by one: the swap
+  first, then the placements by lowest landing first.
+
+  The caller can stop at any time, the remaining positions are not built.
+  :param max_count: If set, yields at most this many positions.
+  :param deadline: If set, a time.time() after which no more positions are
+         yielded.  At least one position is yielded if there is any, so that a
+         late caller still gets a move.
+  """
+  moves = reachability.IterPlacements(piece, game_)
+  if game_.can_swap:
+    action = actions.Action(swap=True)
+    moves = itertools.chain([(game_.piece_list[0], [action])], moves)
+
+  if max_count is not None:
+    moves = itertools.islice(moves, max_count)
+
+  for (count, move) in enumerate(moves):
+    if deadline is not None and count > 0 and time.time() >= deadline:
+      return
+    yield move
+
+
+def GetPossiblePositionsSurface(piece: shape.Shape, game_: game_client.GameClient) -> (
+    List[Tuple[shape.Shape, List[actions.Action]]]):
+  """Gets the positions from the column heights when the board has no
+  overhangs, see surface.py.  Otherwise, falls back to
+  GetPossiblePositionsFullSpin.
+  :returns (piece inish state, [actions to this state])
+  """
+  placements = surface.GetPlacements(piece, game_)
+  if placements is None:
+    return GetPossiblePositionsFullSpin(piece, game_)
+
+  ret = []
+  if game_.can_swap:
+    action = actions.Action(swap=True)
+    ret.append((game_.piece_list[0], [action]))
+  ret.extend(placements)
+  return ret
+
+
+def GetPossiblePositionsWithHold(piece: shape.Shape, game_: game_client.GameClient) -> (
+    List[Tuple[shape.Shape, List[actions.Action]]]):
+  """Gets the positions of the piece, then the positions of the piece a swap
+  brings in, whose actions start with the swap (see placement.Placement.swap),
+  instead of the single swap entry of the other generators.
+
+  Boards without overhangs use surface.py for both pieces.  Otherwise, the
+  pieces are searched with the same collision masks, see
+  reachability.GetHoldPlacements.  A swap for the same piece only adds the
+  footprints the current piece can't reach.
+  :returns (piece inish state, [actions to this state])
+  """
+  swapped = reachability.SwappedPiece(game_)
+  placements = surface.GetPlacements(piece, game_)
+  swapped_placements = [] if swapped is None else surface.GetPlacements(swapped, game_)
+  if placements is None or swapped_placements is None:
+    (placements, swapped_placements) = reachability.GetHoldPlacements(piece, game_)
+    return placements + swapped_placements
+
+  if swapped is not None and swapped.id == piece.id:
+    footprints = set(game_.GetFootprint(p.piece) for p in placements)
+    swapped_placements = [p for p in swapped_placements
+                          if game_.GetFootprint(p.piece) not in footprints]
+  swap = actions.Action(swap=True)
+  return placements + [
+    placement.Placement(p.piece, actions=[swap] + p.actions, swap=True)
+    for p in swapped_placements]
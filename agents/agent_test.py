@@ -7,6 +7,7 @@ import actions
 import game_client
 import shape
 from agents import agent
+from agents import reachability
 
 
 class AgentTest(unittest.TestCase):
@@ -31,6 +32,7 @@ class AgentTest(unittest.TestCase):
     [agent.GetAllPossiblePositions],
     [agent.GetPossiblePositionsQuickVersion],
     [agent.GetPossiblePositionsQuickVersion2],
+    [agent.GetPossiblePositionsBitboard],
   ])
   def test_GetAllPossiblePositions(self, test_fn):
     t = shape.T()
@@ -71,6 +73,7 @@ class AgentTest(unittest.TestCase):
     [agent.GetAllPossiblePositions],
     [agent.GetPossiblePositionsQuickVersion],
     [agent.GetPossiblePositionsQuickVersion2],
+    [agent.GetPossiblePositionsBitboard],
   ])
   def test_GetAllPossiblePositions_BTCanon(self, test_fn):
     self.game = game_client.GameClient(height=8, width=4)
@@ -119,6 +122,7 @@ class AgentTest(unittest.TestCase):
     [agent.GetAllPossiblePositions],
     [agent.GetPossiblePositionsQuickVersion],
     [agent.GetPossiblePositionsQuickVersion2],
+    [agent.GetPossiblePositionsBitboard],
   ])
   def test_GetAllPossiblePositions_BTCanon2(self, test_fn):
     t = shape.T()
@@ -161,6 +165,7 @@ class AgentTest(unittest.TestCase):
     [agent.GetAllPossiblePositions],
     [agent.GetPossiblePositionsQuickVersion],
     [agent.GetPossiblePositionsQuickVersion2],
+    [agent.GetPossiblePositionsBitboard],
   ])
   def test_GetAllPossiblePositions_Quick_T(self, test_fn):
     t = shape.T(start_x=0, start_y=0)
@@ -200,6 +205,7 @@ class AgentTest(unittest.TestCase):
     [agent.GetAllPossiblePositions],
     [agent.GetPossiblePositionsQuickVersion],
     [agent.GetPossiblePositionsQuickVersion2],
+    [agent.GetPossiblePositionsBitboard],
   ])
   def test_GetAllPossiblePositions_Quick_O(self, test_fn):
     o = shape.O(start_x=2, start_y=0)
@@ -232,6 +238,7 @@ class AgentTest(unittest.TestCase):
     [agent.GetAllPossiblePositions],
     [agent.GetPossiblePositionsQuickVersion],
     [agent.GetPossiblePositionsQuickVersion2],
+    [agent.GetPossiblePositionsBitboard],
   ])
   def test_GetAllPossiblePositions_Quick_Z(self, test_fn):
     z = shape.Z(start_x=0, start_y=0)
@@ -257,6 +264,7 @@ class AgentTest(unittest.TestCase):
     [agent.GetAllPossiblePositions],
     [agent.GetPossiblePositionsQuickVersion],
     [agent.GetPossiblePositionsQuickVersion2],
+    [agent.GetPossiblePositionsBitboard],
   ])
   def test_GetAllPossiblePositions_Quick_RotSlideRotSlide(self, test_fn):
     """Tests rotation -> slide -> rotation -> slide."""
@@ -274,6 +282,120 @@ class AgentTest(unittest.TestCase):
     rst_set = set([(p.x, p.y, p.state) for (p, path) in rst])
     self.assertIn((8, 1, 0), rst_set)
 
+  @parameterized.expand([
+    [agent.GetAllPossiblePositions],
+    [agent.GetPossiblePositionsQuickVersion],
+  ])
+  def test_VisitedArrayReused(self, test_fn):
+    small = game_client.GameClient(height=6, width=5)
+    big = game_client.GameClient(height=20, width=10)
+    positions = []
+    for game in [small, big, small]:
+      t = shape.T(start_y=1)
+      positions.append(set((p.x, p.y, p.state) for (p, _) in test_fn(t, game)))
+    self.assertEqual(positions[0], positions[2])
+    self.assertGreater(len(positions[1]), len(positions[0]))
+
+  @parameterized.expand([
+    [agent.GetAllPossiblePositions],
+    [agent.GetPossiblePositionsQuickVersion],
+    [agent.GetPossiblePositionsQuickVersion2],
+  ])
+  def test_LazyPaths(self, test_fn):
+    t = shape.T(start_y=0)
+    self.game.SpawnPiece(t)
+    rst = test_fn(t, self.game)
+    moves = [move for move in rst if not agent.IsSwap(move)]
+    self.assertGreater(len(moves), 0)
+    for move in moves:
+      self.assertIsNone(move._actions)
+
+    # The paths are cleaned when built.
+    (p, path) = moves[-1]
+    self.assertEqual(path, agent._CleanPath(path))
+    self._CheckPath(p, path)
+
+  @parameterized.expand([
+    [agent.GetAllPossiblePositions],
+    [agent.GetPossiblePositionsQuickVersion],
+    [agent.GetPossiblePositionsQuickVersion2],
+    [agent.GetPossiblePositionsBitboard],
+  ])
+  def test_UniqueFootprints(self, test_fn):
+    game = game_client.GameClient(height=8, width=6)
+    for piece in [shape.I(start_y=1), shape.S(start_y=1), shape.Z(start_y=1)]:
+      game.SpawnPiece(piece)
+      moves = [move for move in test_fn(piece, game) if not agent.IsSwap(move)]
+      footprints = [game.GetFootprint(p) for (p, _) in moves]
+      self.assertEqual(len(footprints), len(set(footprints)))
+      # 3 + 6 for I, 5 + 4 for S and Z.
+      self.assertEqual(len(footprints), 9)
+      for (p, path) in moves:
+        another = game.copy()
+        another.ProcessActions(path, post_processing=False)
+        self.assertEqual(p, another.current_piece)
+
+  def test_IterPossiblePositions(self):
+    game = game_client.GameClient(height=8, width=6, seed=0)
+    t = shape.T(start_y=1)
+    game.SpawnPiece(t)
+    streamed = list(agent.IterPossiblePositions(t, game))
+    self.assertTrue(agent.IsSwap(streamed[0]))
+    self.assertEqual(
+      set((p.x, p.y, p.state) for (p, _) in streamed),
+      set((p.x, p.y, p.state) for (p, _) in agent.GetPossiblePositionsFullSpin(t, game)))
+
+    self.assertEqual(len(list(agent.IterPossiblePositions(t, game, max_count=3))), 3)
+    # Past the deadline, only the first position.
+    self.assertEqual(len(list(agent.IterPossiblePositions(t, game, deadline=0))), 1)
+    for (p, path) in list(agent.IterPossiblePositions(t, game, max_count=4))[1:]:
+      another = game.copy()
+      another.ProcessActions(path, post_processing=False)
+      self.assertEqual(p, another.current_piece)
+
+  @parameterized.expand([(False,), (True,)])
+  def test_GetPossiblePositionsWithHold(self, overhang):
+    game = game_client.GameClient(height=8, width=6, seed=0)
+    if overhang:
+      game.SetMap((game.height + game.map_height_padding - 1, 3), 1)
+      game.SetMap((game.height + game.map_height_padding - 2, 2), 1)
+    t = shape.T(start_y=1)
+    game.SpawnPiece(t)
+    moves = agent.GetPossiblePositionsWithHold(t, game)
+    swapped = [m for m in moves if m.swap]
+    next_piece = game.piece_list[0]
+    self.assertEqual(
+      set(game.GetFootprint(m.piece) for m in moves if not m.swap),
+      set(game.GetFootprint(p) for (p, _) in agent.GetPossiblePositionsFullSpin(t, game)
+          if not agent.IsSwap((p, _))))
+    self.assertEqual(
+      set(game.GetFootprint(m.piece) for m in swapped),
+      set(game.GetFootprint(p) for p in
+          reachability.Reachability(game, reachability.SwappedPiece(game)).Placements()))
+    for (p, path) in swapped:
+      self.assertTrue(path[0].swap)
+      self.assertEqual(p.id, next_piece.id)
+      another = game.copy()
+      another.ProcessActions(path, post_processing=False)
+      self.assertEqual(p, another.current_piece)
+
+    # No swap.
+    game.can_swap = False
+    self.assertFalse(any(m.swap for m in agent.GetPossiblePositionsWithHold(t, game)))
+
+  @parameterized.expand([(False,), (True,)])
+  def test_GetPossiblePositionsWithHold_SamePiece(self, overhang):
+    game = game_client.GameClient(height=8, width=6, seed=0)
+    if overhang:
+      game.SetMap((game.height + game.map_height_padding - 1, 3), 1)
+      game.SetMap((game.height + game.map_height_padding - 2, 2), 1)
+    game.held_piece = game.current_piece.copy()
+    moves = agent.GetPossiblePositionsWithHold(game.current_piece, game)
+    # The swap only brings the same piece back.
+    self.assertFalse(any(m.swap for m in moves))
+    self.assertEqual(len(set(game.GetFootprint(m.piece) for m in moves)),
+                     len(moves))
+
   def test_CleanedPath(self):
     rst = [
       (shape.T(), [actions.Action(dir=actions.SOFT_DROP), actions.Action(dir=actions.HARD_DROP)]),
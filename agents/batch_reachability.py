@@ -0,0 +1,293 @@
+# Reachable positions of N pieces on N boards at once, with NumPy.
+#
+# This is the same flood fill as reachability.py, but for a batch of boards
+# (e.g. environments running in lockstep), so that the python overhead is paid
+# once per batch instead of once per board:
+#  - The positions of a piece are int rows indexed by [board, state, x].  The
+#    position (x, y) is bit Y0 - y of a row, the bit of the column y in the
+#    bit_map rows shifted by 3, so the rows of the board are used as they are.
+#    Left / right moves are bit shifts, down moves are shifts along the x axis.
+#  - The fill alternates the down / left / right fills (doubling the shift at
+#    each step) and the SRS rotations of all the boards, until no board
+#    changes.
+#  - The rotations are applied as one gather over all the (rotation, kick)
+#    pairs of all the boards.  Which kick of a rotation wins at each position
+#    only depends on the board, so it is computed once per batch.
+#
+# The paths are not searched: use reachability.Reachability(...).FindPath on
+# the positions an agent picks.
+from typing import List, Sequence
+
+import numpy as np
+
+import bitboard
+import game_client
+import shape
+
+# The first row and column of the piece box.  Above / left of them, the piece
+# is out of the board.
+MIN_X = -3
+MIN_Y = -3
+_SHAPE_I_ID = 1
+_SHAPE_O_ID = 4
+_SHAPE_T_ID = 6
+# The largest move along x of a kick or between two states with the same
+# footprint.
+_MAX_DX = 3
+
+
+def _BuildPatterns() -> np.ndarray:
+  """[piece id, state] -> ((row, column) of the cells) of the piece box."""
+  ret = np.zeros((bitboard.NUM_PIECE_IDS, bitboard.NUM_STATES, 4, 2),
+                 dtype=np.int64)
+  for piece_id in range(1, bitboard.NUM_PIECE_IDS):
+    for (state, cells) in enumerate(shape.SHAPES[piece_id]):
+      ret[piece_id, state] = cells
+  return ret
+
+
+def _BuildSameFootprints() -> np.ndarray:
+  """[piece id, state a, state b] -> (a valid flag, di, dj) such that state b at
+  (x, y) covers the same cells as state a at (x + di, y + dj)."""
+  ret = np.zeros((bitboard.NUM_PIECE_IDS, bitboard.NUM_STATES,
+                  bitboard.NUM_STATES, 3), dtype=np.int64)
+  for piece_id in range(1, bitboard.NUM_PIECE_IDS):
+    cells = [sorted(map(tuple, c.tolist())) for c in shape.SHAPES[piece_id]]
+    for a in range(bitboard.NUM_STATES):
+      for b in range(bitboard.NUM_STATES):
+        (di, dj) = (cells[b][0][0] - cells[a][0][0], cells[b][0][1] - cells[a][0][1])
+        if a != b and [(i + di, j + dj) for (i, j) in cells[a]] == cells[b]:
+          ret[piece_id, a, b] = (1, di, dj)
+  return ret
+
+
+def _BuildKicks():
+  """Returns the (rotation, kick) pairs, sorted by the state they rotate to:
+  (state, new state, rotation index, kick index) arrays, the first pair of
+  each new state, and the [kick table, pair] -> (dx, dy, valid) arrays.  The
+  kick tables are JLSTZ, I and none (O)."""
+  tables = [game_client.SRS_KICKS[_SHAPE_T_ID], game_client.SRS_KICKS[_SHAPE_I_ID]]
+  pairs = []
+  starts = []
+  for new_state in range(bitboard.NUM_STATES):
+    starts.append(len(pairs))
+    for n in (1, 2, 3):
+      state = (new_state - n) % 4
+      n_kicks = max(len(t[state][n]) for t in tables)
+      pairs.extend((state, new_state, state * 3 + n - 1, k) for k in range(n_kicks))
+  kicks = np.zeros((len(tables) + 1, len(pairs), 3), dtype=np.int64)
+  for (i, table) in enumerate(tables):
+    for (c, (state, new_state, _, k)) in enumerate(pairs):
+      n = (new_state - state) % 4
+      if k < len(table[state][n]):
+        kicks[i, c] = table[state][n][k] + (1,)
+  return (np.array(pairs).T, np.array(starts), kicks)
+
+
+_PATTERNS = _BuildPatterns()
+_SAME_FOOTPRINTS = _BuildSameFootprints()
+((_PAIR_STATE, _PAIR_NEW_STATE, _PAIR_ROTATION, _PAIR_KICK),
+ _PAIR_STARTS, _KICKS) = _BuildKicks()
+# Piece id -> row of _KICKS.
+_KICK_TABLE = np.array([2, 1, 0, 0, 2, 0, 0, 0])
+# The pairs (a, b) of states in the order of preference of the footprint
+# dedup, sorted by b, and the first pair of each b.
+(_DEDUP_A, _DEDUP_B) = np.array([(a, b) for b in range(1, 4) for a in range(b)]).T
+_DEDUP_STARTS = np.array([0, 1, 3])
+
+
+class BatchReachability:
+  """The positions reachable by N pieces, each on its own board."""
+
+  def __init__(self, boards: np.ndarray, pieces: np.ndarray, width: int,
+               side_padding: int, full_spin: bool = True):
+    """
+    :param boards: Shape (N, rows), the bit_map rows of each board.
+    :param pieces: Shape (N, 4), each row is (id, x, y, state), the start
+           position of the piece of each board.
+    :param full_spin: See reachability.Reachability.
+    """
+    self.boards = np.asarray(boards, dtype=np.int64)
+    self.pieces = np.asarray(pieces, dtype=np.int64).reshape(-1, 4)
+    self.width = width
+    self.full_spin = full_spin
+    self.n_rows = self.boards.shape[1]
+    # Positions x in [MIN_X, n_rows), y in [MIN_Y, width).
+    self.n_x = self.n_rows - MIN_X
+    self.n_y = width - MIN_Y
+    # The bit of y = 0, see the layout above.
+    self._y0 = width + side_padding - 1 - MIN_Y
+    self._y_mask = ((1 << self.n_y) - 1) << (self._y0 - width + 1)
+    # The position rows of the usual widths fit in 32 bits, which halves the
+    # memory traffic of the fill.
+    self._dtype = np.int32 if self._y0 - MIN_Y < 31 else np.int64
+    self.fits = self._BuildFits(side_padding)
+    self.reach = self._Fill()
+
+  def _BuildFits(self, side_padding: int) -> np.ndarray:
+    n = len(self.boards)
+    # The rows shifted to the layout, with the walls out of the bit_map and
+    # PIECE_BOX_SIZE - 1 full rows above and below the board.
+    row_bits = self.width + 2 * side_padding - MIN_Y
+    rows = (self.boards << -MIN_Y) | ~((1 << row_bits) - 1 - ((1 << -MIN_Y) - 1))
+    full = np.full((n, -MIN_X), -1, dtype=np.int64)
+    rows = np.concatenate([full, rows, full], axis=1)
+    # [board, column of the cell, x + row of the cell]: the rows with the
+    # column j of the piece box moved to the bit of the position.
+    shifted = rows[:, None, :] << np.arange(bitboard.PIECE_BOX_SIZE)[:, None]
+
+    # [board, state, cell, x]: the row of each cell of the piece at x.
+    cells = _PATTERNS[self.pieces[:, 0]]
+    index = (cells[..., 1, None] * shifted.shape[-1] + cells[..., 0, None] +
+             np.arange(self.n_x))
+    index += (np.arange(n) * shifted[0].size)[:, None, None, None]
+    collide = np.bitwise_or.reduce(np.take(shifted, index), axis=2)
+    return (~collide & self._y_mask).astype(self._dtype)
+
+  def _MoveIndex(self, shape_: tuple, dx: np.ndarray) -> np.ndarray:
+    """Returns the flat indices of _Move for arrays of shape_ (..., n_x)
+    padded by _MAX_DX on both sides of x, moved by dx (shape_[:-1])."""
+    padded = self.n_x + 2 * _MAX_DX
+    base = np.arange(int(np.prod(shape_[:-1]))).reshape(shape_[:-1]) * padded
+    return (base + _MAX_DX - dx)[..., None] + np.arange(self.n_x)
+
+  def _Move(self, a: np.ndarray, index: np.ndarray, dy: np.ndarray) -> np.ndarray:
+    """Moves the positions (x, y) of a to (x + dx, y + dy), dx being the one
+    of index (see _MoveIndex) and dy with one value per row of a.  The bits
+    moved out of the positions are not cleared."""
+    padded = np.zeros(a.shape[:-1] + (self.n_x + 2 * _MAX_DX,), dtype=a.dtype)
+    padded[..., _MAX_DX:-_MAX_DX] = a
+    moved = np.take(padded, index)
+    dy = dy[..., None].astype(a.dtype)
+    return (moved >> np.maximum(dy, 0)) << np.maximum(-dy, 0)
+
+  def _FillMoves(self, reach: np.ndarray, fits: np.ndarray) -> np.ndarray:
+    """Extends reach with the down, left and right moves inside fits."""
+    n_y_steps = int(self.n_y).bit_length()
+    n_x_steps = int(self.n_x).bit_length()
+    while True:
+      old = reach
+      (gen, pro, k) = (reach, fits, 1)
+      for _ in range(n_x_steps):
+        moved = np.zeros_like(gen)
+        moved[..., k:] = gen[..., :-k]
+        gen = gen | (pro & moved)
+        moved[...] = 0
+        moved[..., k:] = pro[..., :-k]
+        pro = pro & moved
+        k *= 2
+      for (pro, k) in ((fits, 1), (fits, -1)):
+        for _ in range(n_y_steps):
+          if k > 0:
+            (gen, pro) = (gen | (pro & (gen << k)), pro & (pro << k))
+          else:
+            (gen, pro) = (gen | (pro & (gen >> -k)), pro & (pro >> -k))
+          k *= 2
+      reach = gen
+      if np.array_equal(reach, old):
+        return reach
+
+  def _Fill(self) -> np.ndarray:
+    n = len(self.pieces)
+    reach = np.zeros_like(self.fits)
+    (ids, xs, ys, states) = self.pieces.T
+    ix = xs - MIN_X
+    inside = (ix >= 0) & (ix < self.n_x) & (ys >= MIN_Y) & (ys < self.width)
+    index = np.arange(n)
+    start = (1 << np.clip(self._y0 - ys, 0, self._y0 - MIN_Y)) * inside
+    reach[index, states, np.clip(ix, 0, self.n_x - 1)] = start
+    reach &= self.fits
+
+    # [board, (rotation, kick) pair]: the kick, and the positions of the
+    # rotation's state that the kick moves: it fits there, and no previous
+    # kick of the rotation does.
+    (dx, dy, valid) = _KICKS[_KICK_TABLE[ids]].transpose(2, 0, 1)
+    n_pairs = len(_PAIR_STATE)
+    target = self.fits[:, _PAIR_NEW_STATE]
+    fits = self._Move(target, self._MoveIndex(target.shape, -dx), -dy)
+    fits &= np.where(valid[..., None] != 0, self._y_mask, 0).astype(self._dtype)
+    # [board, rotation, kick] -> the positions of the previous kicks.
+    by_kick = np.zeros((n, 12, _PAIR_KICK.max() + 2, self.n_x), dtype=self._dtype)
+    by_kick[:, _PAIR_ROTATION, _PAIR_KICK + 1] = fits
+    previous = np.bitwise_or.accumulate(by_kick, axis=2)
+    kicked = fits & ~previous[:, _PAIR_ROTATION, _PAIR_KICK]
+
+    # The positions already rotated.
+    done = np.zeros_like(reach)
+    # The boards whose positions changed in the last round.  Most boards are
+    # done after a few rounds, the next ones only fill the others.
+    active = np.arange(n)
+    while len(active):
+      fits = self.fits[active]
+      filled = self._FillMoves(reach[active], fits)
+      reach[active] = filled
+      source = filled if self.full_spin else self._Resting(filled, fits)
+      source &= ~done[active]
+      rotating = np.any(source, axis=(1, 2))
+      (active, source) = (active[rotating], source[rotating])
+      done[active] |= source
+      moved = self._Move(source[:, _PAIR_STATE] & kicked[active],
+                         self._MoveIndex((len(active), n_pairs, self.n_x), dx[active]),
+                         dy[active])
+      reach[active] |= np.bitwise_or.reduceat(moved, _PAIR_STARTS, axis=1)
+    return reach
+
+  def Resting(self, reach: np.ndarray = None) -> np.ndarray:
+    """Returns the reachable positions where the piece can't move down."""
+    if reach is None:
+      reach = self.reach
+    return self._Resting(reach, self.fits)
+
+  @staticmethod
+  def _Resting(reach: np.ndarray, fits: np.ndarray) -> np.ndarray:
+    below = np.zeros_like(fits)
+    below[..., :-1] = fits[..., 1:]
+    return reach & ~below
+
+  def Placements(self, unique: bool = True) -> np.ndarray:
+    """Returns the resting positions of all the boards.
+    :param unique: If True, one position per footprint and board, preferring
+           the start state, then the next ones in rotation order.
+    :returns Shape (M, 5), each row is (board index, id, x, y, state).
+    """
+    n = len(self.pieces)
+    index = np.arange(n)[:, None]
+    # States in the order of preference of each board.
+    order = (self.pieces[:, 3:4] + np.arange(bitboard.NUM_STATES)) % 4
+    rest = self.Resting()[index, order]
+    if unique:
+      # A position of b is dropped if a preferred state a covers the same
+      # cells.  Removing the ones of a that are themselves covered doesn't
+      # matter: the state covering them covers the position of b too.
+      (same, di, dj) = _SAME_FOOTPRINTS[
+        self.pieces[:, :1], order[:, _DEDUP_A], order[:, _DEDUP_B]].transpose(2, 0, 1)
+      covered = rest[:, _DEDUP_A]
+      covered = self._Move(covered, self._MoveIndex(covered.shape, -di), -dj)
+      covered &= np.where(same[..., None] != 0, -1, 0).astype(self._dtype)
+      rest[:, 1:] &= ~np.bitwise_or.reduceat(covered, _DEDUP_STARTS, axis=1)
+
+    bits = ((rest[..., None] >> (self._y0 - np.arange(MIN_Y, self.width))) & 1).astype(bool)
+    (board, r, ix, iy) = np.nonzero(bits)
+    return np.stack([board, self.pieces[board, 0], ix + MIN_X, iy + MIN_Y,
+                     order[board, r]], axis=1)
+
+
+def GetBatchPlacements(games: Sequence[game_client.GameClient],
+                       pieces: Sequence[shape.Shape] = None,
+                       full_spin: bool = True) -> List[List[shape.Shape]]:
+  """Returns the placements of each game's piece (its current piece by
+  default), one per footprint.  All the games must have the same size."""
+  if pieces is None:
+    pieces = [game.current_piece for game in games]
+  game = games[0]
+  batch = BatchReachability(
+    np.array([g.bit_map for g in games], dtype=np.int64),
+    [(p.id, p.x, p.y, p.state) for p in pieces],
+    game.width, game.map_side_padding, full_spin)
+
+  ret = [[] for _ in games]
+  for (i, _, x, y, state) in batch.Placements().tolist():
+    p = pieces[i].copy()
+    (p.x, p.y, p.state) = (x, y, state)
+    ret[i].append(p)
+  return ret
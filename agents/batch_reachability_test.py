@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+import game_client
+import shape
+from agents import batch_reachability
+from agents import reachability
+
+
+class BatchReachabilityTest(unittest.TestCase):
+  def _RandomGames(self, n, seed):
+    rng = np.random.default_rng(seed)
+    games = []
+    for i in range(n):
+      game = game_client.GameClient(height=10, width=6, seed=i)
+      m = np.zeros(game.color_map.shape, dtype=int)
+      # Random cells in the bottom rows so there are overhangs and holes.
+      m[8:] = rng.random((6, game.width)) < 0.5
+      game.SetWholeMap(m)
+      games.append(game)
+    return games
+
+  @parameterized.expand([
+    [True, True],
+    [True, False],
+    [False, True],
+    [False, False],
+  ])
+  def test_MatchesReachability(self, full_spin, unique):
+    games = self._RandomGames(28, 0)
+    # All the pieces, in all the start states.
+    pieces = [shape.GetShapeFromId(i % 7 + 1, start_y=games[0]._start_y)
+              for i in range(len(games))]
+    for (i, p) in enumerate(pieces):
+      p.state = i // 7
+
+    batch = batch_reachability.BatchReachability(
+      np.array([g.bit_map for g in games]),
+      [(p.id, p.x, p.y, p.state) for p in pieces],
+      games[0].width, games[0].map_side_padding, full_spin)
+    placements = batch.Placements(unique)
+    self.assertTrue(np.all(placements[:, 1] == [pieces[i].id for i in placements[:, 0]]))
+    for (i, (game, piece)) in enumerate(zip(games, pieces)):
+      expected = reachability.Reachability(game, piece, full_spin).Placements(unique)
+      self.assertEqual(
+        set(tuple(row[2:]) for row in placements[placements[:, 0] == i].tolist()),
+        set((p.x, p.y, p.state) for p in expected))
+
+  def test_GetBatchPlacements(self):
+    games = self._RandomGames(5, 1)
+    for (game, placements) in zip(games, batch_reachability.GetBatchPlacements(games)):
+      expected = reachability.Reachability(game, game.current_piece).Placements()
+      self.assertEqual(sorted((p.id, p.x, p.y, p.state) for p in placements),
+                       sorted((p.id, p.x, p.y, p.state) for p in expected))
+
+  def test_InvalidStart(self):
+    game = game_client.GameClient(height=8, width=6)
+    piece = shape.T()
+    piece.y = -3
+    valid = shape.T(start_y=1)
+    placements = batch_reachability.GetBatchPlacements([game, game], [piece, valid])
+    self.assertEqual(placements[0], [])
+    self.assertGreater(len(placements[1]), 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
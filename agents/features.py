@@ -0,0 +1,54 @@
+# Board features of a batch of boards, computed with NumPy reductions.
+#
+# The boards are bool arrays of shape (N, H, W) marking the occupied cells of
+# the playfield (e.g. bitboard.RowsToCells of the rows of GameClient.PutPieces
+# without the bottom padding rows), row 0 being the top.  Each feature is an
+# array with one value per board, so the candidates of a move are all scored
+# in one call.
+import numpy as np
+
+# The columns of GetFeatures(), in the order of
+# TheNearPerfectAgent.weights.
+AGGREGATE_HEIGHT = 0
+COMPLETE_LINES = 1
+HOLES = 2
+BUMPINESS = 3
+NUM_FEATURES = 4
+
+
+def ColumnHeights(cells: np.ndarray) -> np.ndarray:
+  """Returns the (N, W) heights of the columns: the number of rows from the
+  first occupied cell to the bottom, 0 for an empty column."""
+  n_rows = cells.shape[-2]
+  top = np.argmax(cells, axis=-2)
+  return np.where(np.any(cells, axis=-2), n_rows - top, 0)
+
+
+def Holes(cells: np.ndarray, thickness_weight: float = 0.0) -> np.ndarray:
+  """Returns the (N,) number of empty cells under an occupied cell of their
+  column.  Each hole also counts thickness_weight per occupied cell above it.
+  """
+  # Occupied cells above each cell, the cell included.
+  above = np.cumsum(cells, axis=-2)
+  holes = ~cells & (above > 0)
+  return np.sum(holes * (1 + thickness_weight * above), axis=(-2, -1))
+
+
+def Bumpiness(heights: np.ndarray) -> np.ndarray:
+  """Returns the (N,) sums of the height differences of adjacent columns."""
+  return np.sum(np.abs(np.diff(heights, axis=-1)), axis=-1)
+
+
+def GetFeatures(cells: np.ndarray, lines_cleared: np.ndarray,
+                thickness_weight: float = 0.0) -> np.ndarray:
+  """Returns the (N, NUM_FEATURES) features of the boards.
+  :param cells: The boards after the line clears.
+  :param lines_cleared: The (N,) number of lines cleared to get the boards.
+  """
+  heights = ColumnHeights(cells)
+  ret = np.empty((cells.shape[0], NUM_FEATURES))
+  ret[:, AGGREGATE_HEIGHT] = np.sum(heights, axis=-1)
+  ret[:, COMPLETE_LINES] = lines_cleared
+  ret[:, HOLES] = Holes(cells, thickness_weight)
+  ret[:, BUMPINESS] = Bumpiness(heights)
+  return ret
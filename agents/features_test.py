@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+import bitboard
+import game_client
+import shape
+from agents import features
+
+
+class FeaturesTest(unittest.TestCase):
+  def _Heights(self, board):
+    """Per column loop, as a reference."""
+    ret = []
+    for col in board.T:
+      nonzero = np.nonzero(col)[0]
+      ret.append(len(col) - nonzero[0] if len(nonzero) else 0)
+    return ret
+
+  def _Holes(self, board, thickness_weight):
+    ret = 0
+    for col in board.T:
+      thick = 0
+      for cell in col:
+        if cell:
+          thick += 1
+        elif thick:
+          ret += 1 + thickness_weight * thick
+    return ret
+
+  def test_Board(self):
+    cells = np.array([[
+      [0, 0, 0, 0, 0],
+      [0, 1, 0, 0, 0],
+      [0, 0, 0, 1, 0],
+      [1, 1, 0, 1, 0],
+      [1, 0, 0, 1, 1],
+    ]], dtype=bool)
+    np.testing.assert_array_equal(features.ColumnHeights(cells), [[2, 4, 0, 3, 1]])
+    np.testing.assert_array_equal(features.Holes(cells), [2])
+    np.testing.assert_array_equal(features.Holes(cells, 0.5), [2 + 0.5 + 1])
+    np.testing.assert_array_equal(features.Bumpiness(np.array([[2, 4, 0, 3, 1]])), [11])
+    np.testing.assert_array_equal(features.GetFeatures(cells, np.array([3])),
+                                  [[10, 3, 2, 11]])
+
+  @parameterized.expand([(0.0,), (0.5,)])
+  def test_MatchesLoops(self, thickness_weight):
+    rng = np.random.default_rng(0)
+    cells = rng.random((50, 12, 6)) < 0.4
+    cells[:5] = False
+    heights = features.ColumnHeights(cells)
+    holes = features.Holes(cells, thickness_weight)
+    for (i, board) in enumerate(cells):
+      self.assertEqual(heights[i].tolist(), self._Heights(board))
+      self.assertAlmostEqual(holes[i], self._Holes(board, thickness_weight))
+
+  def test_PutPieces(self):
+    game = game_client.GameClient(height=8, width=6)
+    for j in range(5):
+      game.SetMap((game.height + game.map_height_padding - 1, j), 1)
+    # A vertical I in the last column and a T pointing up on the left.
+    pieces = [shape.I(start_y=3), shape.T(start_y=0)]
+    pieces[0].state = 1
+    for p in pieces:
+      p.x += game.DropDistance(p)
+    (boards, lines_cleared, _) = game.PutPieces(pieces)
+    n_rows = game.height + game.map_height_padding
+    cells = bitboard.RowsToCells(boards[:, :n_rows], game.width,
+                                 game.map_side_padding)
+    feats = features.GetFeatures(cells, lines_cleared)
+    # The vertical I in the last column clears the bottom line.
+    np.testing.assert_array_equal(feats[0], [3, 1, 0, 3])
+    np.testing.assert_array_equal(feats[1], [9, 0, 0, 4])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -11,11 +11,12 @@
 # To have a good coverage of a 3 depth search, we need to search maybe at least 5000
 # times, this would take 10 mins to generate a move.
 
+import concurrent.futures
 import time
 
 import numpy as np
 
-from agents import agent, mcts_algorithm
+from agents import agent, mcts_algorithm, move_cache
 import actions
 import game_client
 import shape
@@ -31,39 +32,47 @@ from typing import List, Set, Dict, Tuple
 class MCTSNode(mcts_algorithm.Node):
   def __init__(self, game:game_client.GameClient=None,
                init_piece_dropped:int=0,
-               saved_solutions:
-               Dict[mcts_algorithm.Node,
-                    Tuple[shape.Shape, List[actions.Action]]] = None,
-               root_score : float = 0.0):
+               root_score : float = 0.0,
+               state: game_client.GameState = None):
+    """
+    :param state: Instead of game, the state of the game, which is only
+           created when it is first accessed.  Most nodes are never selected,
+           so their games are never created.
+    """
     super().__init__()
 
-    self.saved_solutions = saved_solutions
-    if self.saved_solutions is None:
-      self.saved_solutions = dict()
-
     self.action_list = []
-    self.game = game
+    self._game = game
+    self._state = state
     # game used for simulation
     self.init_piece_dropped = init_piece_dropped
     self.root_score = root_score
 
+  @property
+  def game(self) -> game_client.GameClient:
+    if self._game is None and self._state is not None:
+      self._game = game_client.CreateGameFromState(self._state, headless=True)
+    return self._game
+
+  def GetState(self) -> game_client.GameState:
+    """Returns the state of the game, without creating the game."""
+    if self._state is not None:
+      return self._state
+    return self.game.GetState()
+
   def FindChildren(self)->Set[mcts_algorithm.Node]:
     if self.game is None:
       return set()
 
-    all_possible_solutions = (None, [])
-    if self in self.saved_solutions.keys():
-      all_possible_solutions = self.saved_solutions[self]
-
-    else:
-      all_possible_solutions = agent.GetAllPossiblePositions(
-        self.game.current_piece, self.game)
-      self.saved_solutions[self] = all_possible_solutions
+    # The same board is reached by different paths of the tree, and again
+    # by the next moves' trees.
+    all_possible_solutions = move_cache.GetPositions(
+      agent.GetPossiblePositionsFullSpin, self.game.current_piece, self.game)
 
     ret = set()
 
     for solution in all_possible_solutions:
-      game = self.game.copy()
+      game = self.game.SearchClone()
       game.ProcessActions(solution[1])
       node = MCTSNode(game, self.init_piece_dropped, root_score=self.root_score)
       node.action_list = solution[1]
@@ -74,15 +83,19 @@ class MCTSNode(mcts_algorithm.Node):
   def FindRandomChild(self):
     "Random successor of this board state (for more efficient simulation)"
 
-    game = self.game.copy()
-#    all_possible_actions = agent.GetAllPossiblePositions(
-#      game.current_piece, game)
-    all_possible_actions = agent.GetPossiblePositionsQuickVersion(
-      game.current_piece, game)
-    acts = random.choice(all_possible_actions)[1]
+    game = self.game.SearchClone()
+    # A uniform choice by reservoir sampling: only the actions of the chosen
+    # placement are found.
+    move = None
+    for (count, candidate) in enumerate(
+        agent.IterPossiblePositions(game.current_piece, game)):
+      if random.randrange(count + 1) == 0:
+        move = candidate
+    acts = move[1]
     game.ProcessActions(acts)
 
     ret = MCTSNode(game, self.init_piece_dropped)
+    ret.action_list = acts
     return ret
 
   def _Connected0Area(self, map: np.array) -> int:
@@ -92,10 +105,20 @@ class MCTSNode(mcts_algorithm.Node):
   def _CountHoles(self, map: np.array) -> int:
     return self._Connected0Area(map) - 1
 
-  def _CountSubHoles(self, map: np.array) -> int:
+  def _CountSubHoles(self, game: game_client.GameClient) -> int:
+    """Sums the empty segments minus one of every other row, from the bit_map.
+    """
+    playfield = game._full_row ^ game._empty_row
+    row_fills = game.row_fills
     sum = 0
     for i in range(0, self.game.height, 2):
-      sum += self._CountHoles(map[i:i+1, :])
+      # An empty row is one segment.
+      if row_fills[i] == 0:
+        continue
+      row = game.bit_map[i]
+      # The first cell of a segment is empty with an occupied cell (or the
+      # wall) on its left.
+      sum += (~row & (row >> 1) & playfield).bit_count() - 1
     return sum
 
   def _Compactness(self, map: np.array) -> int:
@@ -116,7 +139,7 @@ class MCTSNode(mcts_algorithm.Node):
 
   def Reward(self, game: game_client.GameClient)->float:
 #    holes = self._CountHoles(game.color_map)
-    sub_holes = self._CountSubHoles(game.color_map)
+    sub_holes = self._CountSubHoles(game)
 #    compactness = self._Compactness(game.color_map)
     if game.is_gameover:
       return -10000
@@ -132,42 +155,143 @@ class MCTSNode(mcts_algorithm.Node):
 
 
   def PlayUntilTermination(self)->float:
-    game = self.game.copy()
+    game = self.game.SearchClone()
     while not game.is_gameover and game.piece_dropped - self.init_piece_dropped < 4:
-      all_possible_actions = agent.GetAllPossiblePositions(
-        game.current_piece, game.GetState())
+      all_possible_actions = agent.GetPossiblePositionsFullSpin(
+        game.current_piece, game)
       acts = random.choice(all_possible_actions)[1]
       game.ProcessActions(acts)
     return self.Reward(game)
 
   def __hash__(self):
     "Nodes must be hashable"
+    if self._state is not None:
+      # Doesn't create the game.
+      return hash(self._state) ^ hash(len(self.action_list))
     return (int.from_bytes(self.game.color_map.data.tobytes(), "little") ^
             hash(self.game.current_piece) ^ hash(self.game.held_piece) ^
             hash(len(self.action_list)))
 
   def __eq__(node1, node2):
     "Nodes must be comparable"
+    # The nodes created from a state are only compared by their states.
+    if (node1._state is None) != (node2._state is None):
+      return False
     if len(node1.action_list) != len(node2.action_list):
       return False
     for i in range(len(node1.action_list)):
       if node1.action_list[i] != node2.action_list[i]:
         return False
 
-    return (np.array_equal(node1.game.color_map, node2.game.map) and
+    if node1._state is not None:
+      return node1._state == node2._state
+    return (np.array_equal(node1.game.color_map, node2.game.color_map) and
             node1.game.current_piece == node2.game.current_piece and
             node1.game.held_piece == node2.game.held_piece)
 
 
+def _Expired(deadline: float | None) -> bool:
+  return deadline is not None and time.time() >= deadline
+
+
+def _ExpandAndSimulate(state: game_client.GameState, init_piece_dropped: int,
+                       seed: int):
+  """Expands and simulates a leaf in a worker process.
+  :returns ([(child state, child action_list)], reward)
+  """
+  # The workers are forked with the same random state.
+  random.seed(seed)
+  node = MCTSNode(game_client.CreateGameFromState(state, headless=True),
+                  init_piece_dropped)
+  children = [(child.game.GetState(), child.action_list)
+              for child in node.FindChildren()]
+  return (children, node.PlayUntilTermination())
+
+
 class MCTSAgent(agent.Agent):
   def __init__(self, env: agent.Env,
-               thread_num:int=1, iterations_per_move:int=100):
+               thread_num:int=1, iterations_per_move:int=100,
+               process_num:int=0):
+    """
+    :param process_num: If > 0, the expansions and the simulations run in a
+           pool of this many processes instead of thread_num threads, see
+           ParallelRollouts.  Call Close() to stop the pool.
+    """
     super().__init__(env)
     self.thread_num = thread_num
     self.iterations_per_move = iterations_per_move
-
-  def MakeDecision(self) -> List[actions.Action]:
-    game = self.env.game.copy()
+    self.process_num = process_num
+    self._pool = None
+
+  def Close(self):
+    if self._pool is not None:
+      self._pool.shutdown()
+      self._pool = None
+
+  def ParallelRollouts(self, tree: MCTSNode, mcts: mcts_algorithm.MCTS,
+                       deadline: float = None):
+    """Runs iterations_per_move rollouts, or less if the deadline is reached,
+    keeping process_num of them running: a new leaf is selected as soon as
+    any rollout completes.  The rollouts not completed at the deadline are
+    dropped.
+
+    The selection and the tree updates stay in this process.  The leaves are
+    sent to the workers as GameState, and their children come back as
+    GameState, so only small picklable objects cross the processes.  The
+    games of the children are only created if they are used.
+    """
+    if self._pool is None:
+      self._pool = concurrent.futures.ProcessPoolExecutor(self.process_num)
+
+    start_time = time.time()
+    (submitted, done) = (0, 0)
+    # The rollouts running in the pool: future -> path to the leaf.
+    running = {}
+    while True:
+      n = min(self.process_num - len(running),
+              self.iterations_per_move - submitted)
+      if n > 0 and not _Expired(deadline):
+        for path in mcts.SelectLeaves(tree, n):
+          leaf = path[-1]
+          future = self._pool.submit(_ExpandAndSimulate, leaf.GetState(),
+                                     leaf.init_piece_dropped,
+                                     random.getrandbits(32))
+          running[future] = path
+          submitted += 1
+      if not running:
+        break
+
+      timeout = None if deadline is None else max(0, deadline - time.time())
+      (finished, _) = concurrent.futures.wait(
+        running, timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+      if not finished:
+        # The deadline is reached: the rollouts still running are dropped.
+        for (future, path) in running.items():
+          future.cancel()
+          mcts.Abandon(path)
+        break
+      for future in finished:
+        path = running.pop(future)
+        (children, reward) = future.result()
+        leaf = path[-1]
+        nodes = set()
+        for (state, action_list) in children:
+          node = MCTSNode(init_piece_dropped=leaf.init_piece_dropped,
+                          root_score=leaf.root_score, state=state)
+          node.action_list = action_list
+          nodes.add(node)
+        mcts.Complete(path, nodes, reward)
+        self.search_depth = max(self.search_depth, len(path) - 1)
+        done += 1
+
+    elapsed = time.time() - start_time
+    print(f"{done} iterations, {done / max(elapsed, 1e-9):.1f} iterations/s")
+
+  def MakeDecision(self, deadline: float = None) -> List[actions.Action]:
+    """Runs iterations_per_move rollouts, or less if the deadline is reached,
+    and returns the actions of the best child so far."""
+    self.search_depth = 0
+    game = self.env.game.SearchClone()
     if game.CheckGameOver():
       return []
 
@@ -178,11 +302,19 @@ class MCTSAgent(agent.Agent):
     print(game.piece_dropped)
     print(game.score)
 
+    if self.process_num > 0:
+      tree.root_score = game.score
+      self.ParallelRollouts(tree, mcts, deadline)
+      return mcts.Choose(tree).action_list
+
     def SingleThreadRollout():
       for _ in range(self.iterations_per_move):
+        if _Expired(deadline):
+          break
         start_time = time.time()
         tree.root_score = game.score
-        mcts.Rollout(tree)
+        path = mcts.Rollout(tree)
+        self.search_depth = max(self.search_depth, len(path) - 1)
         print(f"iteration: {_}, {(time.time() - start_time) * 1000}ms")
 
     threads = []
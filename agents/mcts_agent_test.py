@@ -0,0 +1,141 @@
+import collections
+import concurrent.futures
+import contextlib
+import io
+import random
+import time
+import unittest
+
+import numpy as np
+
+import actions
+import game_client
+from agents import agent
+from agents import mcts_agent
+from agents import mcts_algorithm
+
+
+class MCTSAgentTest(unittest.TestCase):
+  def setUp(self):
+    self.game = game_client.GameClient(height=8, width=6, seed=0, headless=True)
+
+  def test_SelectLeaves(self):
+    tree = mcts_agent.MCTSNode(self.game.SearchClone(), self.game.piece_dropped)
+    mcts = mcts_algorithm.MCTS()
+    mcts.Rollout(tree)
+    q = mcts.q[tree]
+
+    paths = mcts.SelectLeaves(tree, 4)
+    leaves = [path[-1] for path in paths]
+    self.assertEqual(len(paths), 4)
+    self.assertEqual(len(set(leaves)), 4)
+    # The virtual visits.
+    self.assertEqual(mcts.n[tree], 5)
+
+    for path in paths:
+      mcts.Complete(path, path[-1].FindChildren(), 1.0)
+    self.assertEqual(mcts.n[tree], 5)
+    self.assertEqual(mcts.q[tree], q + 4.0)
+    for leaf in leaves:
+      self.assertEqual(mcts.n[leaf], 1)
+      self.assertEqual(mcts.q[leaf], 1.0)
+      self.assertGreater(len(mcts.children[leaf]), 0)
+
+  def test_SelectLeaves_SkipsPending(self):
+    tree = mcts_agent.MCTSNode(self.game.SearchClone(), self.game.piece_dropped)
+    mcts = mcts_algorithm.MCTS()
+    mcts.Rollout(tree)
+    leaves = set(path[-1] for path in mcts.SelectLeaves(tree, 2))
+    for path in mcts.SelectLeaves(tree, 2):
+      self.assertNotIn(path[-1], leaves)
+
+  def test_Abandon(self):
+    tree = mcts_agent.MCTSNode(self.game.SearchClone(), self.game.piece_dropped)
+    mcts = mcts_algorithm.MCTS()
+    mcts.Rollout(tree)
+    paths = mcts.SelectLeaves(tree, 2)
+    for path in paths:
+      mcts.Abandon(path)
+    self.assertEqual(mcts.n[tree], 1)
+    self.assertFalse(mcts._pending)
+    for path in paths:
+      self.assertNotIn(path[-1], mcts.children)
+    # The leaves can be selected again.
+    leaves = set(path[-1] for path in mcts.SelectLeaves(tree, 2))
+    self.assertEqual(leaves, set(path[-1] for path in paths))
+
+  def test_StateNode(self):
+    state = self.game.GetState()
+    node = mcts_agent.MCTSNode(state=state)
+    another = mcts_agent.MCTSNode(state=self.game.GetState())
+    self.assertEqual(len({node, another}), 1)
+    self.assertIsNone(node._game)
+    self.assertIs(node.GetState(), state)
+    self.assertEqual(node.game.GetState(), state)
+    self.assertIs(node.game, node.game)
+
+  def test_FindRandomChild_Uniform(self):
+    node = mcts_agent.MCTSNode(self.game)
+    moves = list(agent.IterPossiblePositions(self.game.current_piece, self.game))
+    random.seed(0)
+    key = lambda acts: tuple(str(a) for a in acts)
+    counts = collections.Counter(
+      key(node.FindRandomChild().action_list) for _ in range(50 * len(moves)))
+    # Every placement is picked, not only the lowest ones.
+    self.assertEqual(set(counts), set(key(acts) for (_, acts) in moves))
+    self.assertGreater(min(counts.values()), 25)
+
+  def test_CountSubHoles(self):
+    node = mcts_agent.MCTSNode(self.game)
+    rng = np.random.default_rng(1)
+    for _ in range(10):
+      self.game.SetWholeMap(
+        (rng.random(self.game.color_map.shape) < 0.5).astype(int))
+      expected = sum(node._CountHoles(self.game.color_map[i:i + 1, :])
+                     for i in range(0, self.game.height, 2))
+      self.assertEqual(node._CountSubHoles(self.game), expected)
+
+  def test_Deadline(self):
+    bot = mcts_agent.MCTSAgent(agent.Env(self.game), iterations_per_move=4)
+    with contextlib.redirect_stdout(io.StringIO()):
+      # No rollout: a random placement.
+      acts = bot.Decide(time.time() - 1)
+      self.assertEqual(bot.search_depth, 0)
+      self.assertTrue(acts[-1].direction == actions.HARD_DROP or acts[0].swap)
+      bot.Decide(time.time() + 60)
+    self.assertGreater(bot.search_depth, 0)
+    self.assertEqual((bot.decisions, bot.deadline_misses), (2, 1))
+
+  def test_ProcessPool(self):
+    bot = mcts_agent.MCTSAgent(agent.Env(self.game), iterations_per_move=6,
+                               process_num=2)
+    try:
+      with contextlib.redirect_stdout(io.StringIO()):
+        acts = bot.MakeDecision()
+    finally:
+      bot.Close()
+    # A placement, or a swap.
+    self.assertTrue(acts[-1].direction == actions.HARD_DROP or acts[0].swap)
+
+
+  def test_ProcessPool_Deadline(self):
+    class _StuckPool:
+      def submit(self, *args):
+        return concurrent.futures.Future()
+
+    bot = mcts_agent.MCTSAgent(agent.Env(self.game), iterations_per_move=6,
+                               process_num=2)
+    bot._pool = _StuckPool()
+    tree = mcts_agent.MCTSNode(self.game.SearchClone(), self.game.piece_dropped)
+    mcts = mcts_algorithm.MCTS()
+    mcts.Rollout(tree)
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+      bot.ParallelRollouts(tree, mcts, start + 0.05)
+    self.assertLess(time.time() - start, 1)
+    # The rollouts still running are undone.
+    self.assertEqual(mcts.n[tree], 1)
+    self.assertFalse(mcts._pending)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -51,7 +51,8 @@ class MCTS():
     self.n = defaultdict(int)  # total visit count for each node
     self.children = dict()  # children of each node
     self.exploration_weight = exploration_weight
-    self.saved_solutions = dict()
+    # Leaves selected by SelectLeaves() and not completed yet.
+    self._pending = set()
 
 
   def Choose(self, node:Node):
@@ -74,7 +75,8 @@ class MCTS():
 
   def Rollout(self, node):
     import time
-    "Make the tree one layer better. (Train for one iteration.)"
+    """Make the tree one layer better. (Train for one iteration.)
+    :returns The path from node to the expanded leaf."""
     path = self._Select(node)
     leaf = path[-1]
     start_time = time.time()
@@ -84,6 +86,54 @@ class MCTS():
     reward = self._Simulate(leaf)
     print("Simulate: ", (time.time() - start_time) * 1000)
     self._Backpropagate(path, reward)
+    return path
+
+  def SelectLeaves(self, node, max_count: int):
+    """Selects up to max_count paths to distinct leaves, whose expansion and
+    simulation can run in parallel.  Finish each path with Complete(), or
+    Abandon() if it won't be completed.  The
+    leaves of the paths not completed yet are not selected again.
+
+    Each selected path gets a virtual visit (with no reward) until it is
+    completed, and its leaf is marked as being expanded, so that the next
+    selections go elsewhere.
+    """
+    paths = []
+    leaves = set()
+    for _ in range(max_count):
+      path = self._Select(node)
+      leaf = path[-1]
+      if leaf in leaves or leaf in self._pending:
+        break
+      leaves.add(leaf)
+      paths.append(path)
+      for n in path:
+        self.n[n] += 1
+      if leaf not in self.children:
+        self.children[leaf] = set()
+        self._pending.add(leaf)
+    return paths
+
+  def Complete(self, path, children, reward: float):
+    """Adds the children of the leaf of a path from SelectLeaves(), and
+    back-propagates the reward of its simulation."""
+    for n in path:
+      self.n[n] -= 1
+    leaf = path[-1]
+    if leaf in self._pending:
+      self._pending.remove(leaf)
+      self.children[leaf] = children
+    self._Backpropagate(path, reward)
+
+  def Abandon(self, path):
+    """Undoes the SelectLeaves() of a path that won't be completed: removes
+    its virtual visit, and its leaf can be selected again."""
+    for n in path:
+      self.n[n] -= 1
+    leaf = path[-1]
+    if leaf in self._pending:
+      self._pending.remove(leaf)
+      del self.children[leaf]
 
   def _Select(self, node):
     "Find an unexplored descendent of `node`"
@@ -0,0 +1,110 @@
+# Process-wide cache of the move generators' results.
+#
+# The same (board, piece) is searched many times: by the MCTS nodes reaching
+# the same state through different paths, by an agent deciding again on a
+# state it already saw, or by several agents running in the same process.
+# MoveCache keeps the placement lists of the last max_size searches, keyed by
+#   (generator, board rows, piece id, state, x, y, can_swap, next piece id,
+#    held piece id)
+# which is everything the generators in agent.py read from the game.
+#
+# The cached lists are shared by all the callers and must not be modified.
+# The placements' actions are still built lazily, on the first access.
+#
+# Until all the actions of a list are built, its placements keep their
+# reachability.Reachability alive, with the search tree of the paths once one
+# is found: about 40 KB per entry, 120 KB once a path is found, on a 10 wide
+# board.  So the cache is kept small, a few decisions' worth of boards, and
+# the pool workers of MCTSAgent that fork the process don't inherit a big one.
+import collections
+import threading
+from typing import Callable, List
+
+import game_client
+import shape
+
+# The counters of a cache.
+#  - hits: Number of lookups served from the cache.
+#  - misses: Number of lookups that ran the generator.
+#  - evictions: Number of entries dropped to stay within max_size.
+#  - size: Number of entries.
+CacheStats = collections.namedtuple(
+  "CacheStats", ["hits", "misses", "evictions", "size"])
+
+# About 60 MB at most, see above.
+DEFAULT_MAX_SIZE = 512
+
+
+class MoveCache:
+  """LRU cache of placement lists, safe to share between threads."""
+
+  def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+    """
+    :param max_size: Most entries kept.  Each one can cost up to ~120 KB, see
+           the top of the file.
+    """
+    self.max_size = max_size
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._misses = 0
+    self._evictions = 0
+
+  @staticmethod
+  def Key(generator: Callable, piece: shape.Shape,
+          game: game_client.GameClient) -> tuple:
+    (next_id, held_id) = (0, 0)
+    if game.can_swap:
+      next_id = game.piece_list[0].id
+      held_id = 0 if game.held_piece is None else game.held_piece.id
+    return (generator, tuple(game.bit_map), piece.id, piece.state, piece.x,
+            piece.y, game.can_swap, next_id, held_id)
+
+  def Get(self, generator: Callable, piece: shape.Shape,
+          game: game_client.GameClient) -> List:
+    """Returns generator(piece, game), from the cache if possible."""
+    key = self.Key(generator, piece, game)
+    with self._lock:
+      ret = self._entries.get(key)
+      if ret is not None:
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return ret
+      self._misses += 1
+
+    # Searches outside of the lock, two threads might search the same key at
+    # the same time, which only costs time.
+    ret = generator(piece, game)
+    with self._lock:
+      self._entries[key] = ret
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_size:
+        self._entries.popitem(last=False)
+        self._evictions += 1
+    return ret
+
+  def Stats(self) -> CacheStats:
+    with self._lock:
+      return CacheStats(self._hits, self._misses, self._evictions,
+                        len(self._entries))
+
+  def Clear(self):
+    """Drops all the entries and resets the counters."""
+    with self._lock:
+      self._entries.clear()
+      self._hits = self._misses = self._evictions = 0
+
+
+_cache = MoveCache()
+
+
+def GetMoveCache() -> MoveCache:
+  """Returns the cache shared by the whole process."""
+  return _cache
+
+
+def GetPositions(generator: Callable, piece: shape.Shape,
+                 game: game_client.GameClient) -> List:
+  """Returns generator(piece, game) through the shared cache.  generator is
+  any of the GetPossiblePositions* / GetAllPossiblePositions of agent.py."""
+  return _cache.Get(generator, piece, game)
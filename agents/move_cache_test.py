@@ -0,0 +1,75 @@
+import threading
+import unittest
+
+import game_client
+import shape
+from agents import agent
+from agents import move_cache
+
+
+class MoveCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.game = game_client.GameClient(height=8, width=6)
+    self.cache = move_cache.MoveCache(max_size=2)
+    self.calls = 0
+
+  def _Generator(self, piece, game):
+    self.calls += 1
+    return agent.GetAllPossiblePositions(piece, game)
+
+  def test_Hit(self):
+    t = shape.T(start_y=1)
+    first = self.cache.Get(self._Generator, t, self.game)
+    self.assertIs(self.cache.Get(self._Generator, t.copy(), self.game.copy()), first)
+    self.assertEqual(self.calls, 1)
+    self.assertEqual(self.cache.Stats(), move_cache.CacheStats(1, 1, 0, 1))
+
+  def test_Miss(self):
+    t = shape.T(start_y=1)
+    self.cache.Get(self._Generator, t, self.game)
+    # Another position, board or generator.
+    moved = t.copy()
+    moved.y += 1
+    self.cache.Get(self._Generator, moved, self.game)
+    game = self.game.copy()
+    game.SetMap((game.height - 1, 0), 1)
+    self.cache.Get(self._Generator, t, game)
+    self.cache.Get(agent.GetAllPossiblePositions, t, self.game)
+    self.assertEqual(self.calls, 3)
+    self.assertEqual(self.cache.Stats().misses, 4)
+
+  def test_Eviction(self):
+    pieces = [shape.T(start_y=y) for y in range(3)]
+    for p in pieces:
+      self.cache.Get(self._Generator, p, self.game)
+    # The least recently used one is dropped.
+    self.cache.Get(self._Generator, pieces[2], self.game)
+    self.cache.Get(self._Generator, pieces[0], self.game)
+    self.assertEqual(self.calls, 4)
+    self.assertEqual(self.cache.Stats(), move_cache.CacheStats(1, 4, 2, 2))
+
+  def test_Clear(self):
+    self.cache.Get(self._Generator, shape.T(start_y=1), self.game)
+    self.cache.Clear()
+    self.assertEqual(self.cache.Stats(), move_cache.CacheStats(0, 0, 0, 0))
+
+  def test_Threads(self):
+    cache = move_cache.MoveCache()
+    games = [game_client.GameClient(height=8, width=6, seed=0) for _ in range(4)]
+
+    def Run(game):
+      for y in range(3):
+        cache.Get(agent.GetPossiblePositionsQuickVersion, shape.T(start_y=y), game)
+
+    threads = [threading.Thread(target=Run, args=(g,)) for g in games]
+    for th in threads:
+      th.start()
+    for th in threads:
+      th.join()
+    stats = cache.Stats()
+    self.assertEqual(stats.hits + stats.misses, 12)
+    self.assertEqual(stats.size, 3)
+
+
+if __name__ == "__main__":
+  unittest.main()
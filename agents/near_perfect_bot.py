@@ -1,109 +1,152 @@
 # Ref: https://codemyroad.wordpress.com/2013/04/14/tetris-ai-the-near-perfect-player/
 
+import collections
+import time
 from typing import List, Tuple
 
 import numpy as np
 
 import actions
+import bitboard
 import game_client
 from agents import agent
+from agents import features
+from agents import move_cache
+
+# Each hole also counts this much per occupied cell above it.
+HOLE_THICKNESS_WEIGHT = 0.5
 
 
 class InternalException(Exception):
   """Raises upon any errors."""
 
 
+class SearchStats(collections.namedtuple(
+    "SearchStats", ["decisions", "nodes", "seconds"])):
+  """Accumulated search statistics of an agent.
+  decisions: Number of MakeDecision calls.
+  nodes: Number of boards evaluated, one per placement.
+  seconds: Time spent in the searches.
+  """
+
+  @property
+  def nodes_per_second(self) -> float:
+    return self.nodes / self.seconds if self.seconds else 0.0
+
+  @property
+  def seconds_per_decision(self) -> float:
+    return self.seconds / self.decisions if self.decisions else 0.0
+
+
 class TheNearPerfectAgent(agent.Agent):
   def __init__(self, env: agent.Env,
                weights: Tuple[float, float, float, float] =
                (-0.510066, 0.760666, -0.35663, -0.184483),
-               decision_interval: float = 0.1):
+               decision_interval: float = 0.1,
+               beam_width: int = 1, beam_depth: int = 0):
+    """
+    :param beam_width: Number of boards kept at each level of the search.
+    :param beam_depth: Number of pieces of the piece list to look ahead.  0
+           only places the current piece, greedily.
+    """
     super().__init__(env, decision_interval)
     self.weights = weights
-
-
-  def GetColHeight(self, col: np.array)->int:
-    """Returns the height of a column.
-    :param row: A 1-D array
-    :returns height of this column.
+    self.beam_width = beam_width
+    self.beam_depth = beam_depth
+    self.search_stats = SearchStats(0, 0, 0.0)
+
+  def _ScoreMoves(self, game: game_client.GameClient, lines: int):
+    """Scores the placements of the current piece and of the piece a swap
+    brings in, all at once.
+    :param lines: Lines cleared before getting to the game.
+    :returns (moves, scores, lines), lines including the ones of each move.
     """
-    row_height = len(col)
-    for i in range(len(col)):
-      if col[i] != 0:
-        row_height = i
+    moves = move_cache.GetPositions(
+      agent.GetPossiblePositionsWithHold, game.current_piece, game)
+    if not moves:
+      return (moves, np.empty(0), np.empty(0, dtype=int))
+
+    # A resting piece lies on a cell, so it covers no row more than
+    # PIECE_BOX_SIZE rows above the stack: the rows above are empty on every
+    # board and don't change the features.
+    (boards, lines_cleared, valid) = game.PutPieces([m[0] for m in moves])
+    n_rows = game.height + game.map_height_padding
+    first_row = max(0, n_rows - int(game.column_heights.max()) -
+                    bitboard.PIECE_BOX_SIZE)
+    cells = bitboard.RowsToCells(boards[:, first_row:n_rows], game.width,
+                                 game.map_side_padding)
+    lines_cleared = lines_cleared + lines
+    scores = features.GetFeatures(
+      cells, lines_cleared, thickness_weight=HOLE_THICKNESS_WEIGHT) @ self.weights
+    scores[~valid] = -np.inf
+    return (moves, scores, lines_cleared)
+
+  def _BeamSearch(self, ori_game: game_client.GameClient,
+                  deadline: float = None):
+    """Returns (score, first move) of the best sequence of placements of the
+    current piece and the next beam_depth pieces, the number of evaluated
+    boards and the depth reached.  The score is the one of the last board,
+    with all the lines cleared by the sequence.
+
+    The current piece is always searched.  Once the deadline is reached, the
+    level being searched is dropped and the best sequence of the previous
+    level is returned.
+    """
+    # A swap with no held piece takes a piece of the piece list.
+    depth = max(0, min(self.beam_depth,
+                       len(ori_game.piece_list) - (ori_game.held_piece is None)))
+    # (game, first move, lines cleared since ori_game)
+    beam = [(ori_game, None, 0)]
+    (best_score, best_move) = (-np.inf, ())
+    nodes = 0
+    reached = 0
+    for level in range(depth + 1):
+      # (score, beam index, move, lines), the best beam_width of each game.
+      candidates = []
+      for (i, (game, _, lines)) in enumerate(beam):
+        if level and deadline is not None and time.time() >= deadline:
+          return (best_score, best_move, nodes, reached)
+        (moves, scores, all_lines) = self._ScoreMoves(game, lines)
+        nodes += len(moves)
+        for k in np.argsort(-scores, kind="stable")[:self.beam_width]:
+          if scores[k] == -np.inf:
+            break
+          candidates.append((scores[k], i, moves[k], int(all_lines[k])))
+      if not candidates:
+        break
+      # Stable, so the first best one wins as in a greedy search.
+      candidates.sort(key=lambda c: -c[0])
+      candidates = candidates[:self.beam_width]
+      (score, i, move, _) = candidates[0]
+      (best_score, best_move) = (score, beam[i][1] or move)
+      reached = level
+      if level == depth:
         break
-    return len(col) - row_height
-
-  def _UpdateHoles(self, rst, start_pos, end_pos, game: game_client.GameClient):
-    start_pos = max(0, start_pos)
-    end_pos = min(end_pos, game.width)
-    for i in range(start_pos, end_pos):
-      cnt = 0
-      has_block = False
-      thick = 0
-      for r in range(game.height + game.map_height_padding):
-        if game.color_map[r, i] != 0:
-          has_block = True
-          thick += 1
-        if game.color_map[r, i] == 0:
-          if has_block:
-            cnt += 1 + 0.5 * thick
-      rst[i] = cnt
-
-  def MakeDecision(self) -> List[actions.Action]:
-
-    def FindBestMove(ori_game):
-      if ori_game.CheckGameOver():
-        return (None, None)
-
-      all_possible_solutions = agent.GetPossiblePositionsQuickVersion(
-        ori_game.current_piece, ori_game)
-
-      best_move = ()
-      best_move_score = -np.inf
-
-      ori_col_holes = ori_game.width * [0]
-      self._UpdateHoles(ori_col_holes, 0, ori_game.width, ori_game)
-
-      for move in all_possible_solutions:
-        game = ori_game.copy()
-        if move[1][0].swap:
-          continue
-
-        # Puts piece
-        prev_eliminated = game.accumulated_lines_eliminated
-        game.PutPiece(move[0])
-
-        # holes
-        col_holes = ori_col_holes.copy()
-        self._UpdateHoles(col_holes, move[0].y, move[0].y + 4, game)
-        holes = np.sum(col_holes)
-
-        # Height of each col
-        col_heights = [self.GetColHeight(game.color_map[:, i]) for i in range(ori_game.width)]
-
-        # aggregate_height
-        aggregate_height = np.sum(col_heights)
-
-        # complete lines
-        complete_lines = game.accumulated_lines_eliminated - prev_eliminated
-
-        # Bumpiness
-        bumpiness = 0
-        for i in range(game.width-1):
-          bumpiness += np.abs(col_heights[i] - col_heights[i+1])
-
-        score = np.dot(self.weights,
-                       [aggregate_height, complete_lines, holes, bumpiness])
-
-        if score > best_move_score:
-          best_move = move
-          best_move_score = score
-
-      return (best_move_score, best_move)
-
-    ori_game = self.env.game.copy()
-    (best_move_score, best_move) = FindBestMove(ori_game)
+
+      next_beam = []
+      for (_, i, move, lines) in candidates:
+        child = beam[i][0].SearchClone()
+        if move.swap:
+          child.Swap()
+        child.PutPiece(move[0])
+        if not child.is_gameover and child.SpawnPiece():
+          next_beam.append((child, beam[i][1] or move, lines))
+      if not next_beam:
+        break
+      beam = next_beam
+    return (best_score, best_move, nodes, reached)
+
+  def MakeDecision(self, deadline: float = None) -> List[actions.Action]:
+    ori_game = self.env.game.SearchClone()
+    start = time.time()
+    (best_move_score, best_move, nodes, self.search_depth) = (None, None, 0, 0)
+    if not ori_game.CheckGameOver():
+      (best_move_score, best_move, nodes, self.search_depth) = self._BeamSearch(
+        ori_game, deadline)
+    (decisions, total_nodes, seconds) = self.search_stats
+    self.search_stats = SearchStats(decisions + 1, total_nodes + nodes,
+                                    seconds + time.time() - start)
+
     print("line eliminated:", ori_game.accumulated_lines_eliminated)
     if best_move:
       return best_move[1]
@@ -4,6 +4,7 @@ from os.path import abspath, join, dirname
 # caution: path[0] is reserved for script path (or '' in REPL)
 sys.path.append(abspath(join(dirname(__file__), "..")))
 
+import time
 import unittest
 
 import numpy as np
@@ -97,3 +98,77 @@ class NearPerfectBotTest(unittest.TestCase):
 
     for a in actions:
       print(a)
+
+  def test_BeamSearch(self):
+    self.SetUpGame(height=10, width=6)
+    greedy = self.bot.MakeDecision()
+    self.assertEqual(self.bot.search_stats.decisions, 1)
+    greedy_nodes = self.bot.search_stats.nodes
+    self.assertGreater(greedy_nodes, 0)
+
+    bot = near_perfect_bot.TheNearPerfectAgent(self.env, beam_width=1)
+    self.assertEqual(bot.MakeDecision(), greedy)
+
+    bot = near_perfect_bot.TheNearPerfectAgent(self.env, beam_width=3,
+                                               beam_depth=2)
+    acts = bot.MakeDecision()
+    self.assertGreater(bot.search_stats.nodes, greedy_nodes)
+    self.assertGreater(bot.search_stats.nodes_per_second, 0)
+    # The lookahead doesn't change the game.
+    self.assertEqual(self.game.piece_dropped, 0)
+    self.game.ProcessActions(acts)
+    self.assertEqual(self.game.piece_dropped, 1)
+
+  def test_BeamSearch_Lookahead(self):
+    self.SetUpGame(height=10, width=6)
+    rng = np.random.default_rng(0)
+    color_map = (rng.random(self.game.color_map.shape) < 0.5).astype(int)
+    color_map[:-4] = 0
+    self.game.SetWholeMap(color_map)
+    greedy = self.bot
+
+    # Wide enough to keep all the placements: an exhaustive 2 pieces search.
+    bot = near_perfect_bot.TheNearPerfectAgent(self.env, beam_width=1000,
+                                               beam_depth=1)
+    (score, move, _, depth) = bot._BeamSearch(self.game)
+    (_, greedy_move, _, _) = greedy._BeamSearch(self.game)
+    # The best second placement after the greedy one.
+    game = self.game.SearchClone()
+    if greedy_move.swap:
+      game.Swap()
+    game.PutPiece(greedy_move[0])
+    game.SpawnPiece()
+    (_, scores, _) = greedy._ScoreMoves(
+      game, game.accumulated_lines_eliminated - self.game.accumulated_lines_eliminated)
+    self.assertGreaterEqual(score, np.max(scores))
+    self.assertTrue(move)
+    self.assertEqual(depth, 1)
+
+  def test_Deadline(self):
+    self.SetUpGame(height=10, width=6)
+    greedy = self.bot.MakeDecision()
+    bot = near_perfect_bot.TheNearPerfectAgent(self.env, beam_width=4,
+                                               beam_depth=2)
+    # Too late for the lookahead: the greedy answer.
+    self.assertEqual(bot.Decide(time.time() - 1), greedy)
+    self.assertEqual(bot.search_depth, 0)
+    self.assertEqual((bot.decisions, bot.deadline_misses), (1, 1))
+
+    bot.Decide(time.time() + 60)
+    self.assertEqual(bot.search_depth, 2)
+    self.assertEqual((bot.decisions, bot.deadline_misses), (2, 1))
+    self.assertEqual(bot.search_depths, {0: 1, 2: 1})
+
+  def test_Hold(self):
+    # Only an I clears the lines, and the next piece is an I.
+    self.SetUpGame(height=10, width=6)
+    color_map = np.zeros(self.game.color_map.shape, dtype=int)
+    color_map[-4:, 1:] = 1
+    self.game.SetWholeMap(color_map)
+    self.game.SpawnPiece(shape.O(start_y=self.game._start_y))
+    self.game.piece_list = [shape.I(start_y=self.game._start_y)] + self.game.piece_list
+    acts = self.bot.MakeDecision()
+    self.assertTrue(acts[0].swap)
+    self.game.ProcessActions(acts)
+    self.assertEqual(self.game.accumulated_lines_eliminated, 4)
+    self.assertEqual(self.game.held_piece.id, shape.O().id)
@@ -0,0 +1,52 @@
+# A final position of a piece and the actions to reach it.
+#
+# The move generators return lists of (piece, [actions]).  Placement can be
+# used in place of the tuple: placement[0], placement[1] and
+# (piece, path) = placement all work, but the actions are only computed when
+# they are accessed, since an agent usually executes one placement out of
+# many.
+from typing import Callable, List
+
+import actions
+import shape
+
+
+class Placement:
+  __slots__ = ("piece", "swap", "_actions", "_find_actions")
+
+  def __init__(self, piece: shape.Shape, actions: List[actions.Action] = None,
+               find_actions: Callable[[], List[actions.Action]] = None,
+               swap: bool = False):
+    """
+    :param piece: The final position of the piece.
+    :param actions: The actions to reach the piece.  If None, find_actions is
+           called on the first access.
+    :param swap: True if the actions start with a swap, and the piece is the
+           one the swap brings in.
+    """
+    self.piece = piece
+    self.swap = swap
+    self._actions = actions
+    self._find_actions = find_actions
+
+  @property
+  def actions(self) -> List[actions.Action]:
+    if self._actions is None:
+      self._actions = self._find_actions()
+      self._find_actions = None
+    return self._actions
+
+  def __getitem__(self, i):
+    if i == 0 or i == -2:
+      return self.piece
+    return (self.piece, self.actions)[i]
+
+  def __iter__(self):
+    yield self.piece
+    yield self.actions
+
+  def __len__(self):
+    return 2
+
+  def __repr__(self):
+    return f"Placement({self.piece.id}, {self.piece.x}, {self.piece.y}, {self.piece.state})"
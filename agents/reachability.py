@@ -0,0 +1,424 @@
+# Reachable positions of a piece, computed on bitboards.
+#
+# For each rotation state, the positions (x, y) of the piece are bits of one
+# python int: position (x, y) is bit (x - MIN_X) * stride + (width +
+# side_padding - 1 - y).  With this layout:
+#  - Moving down is a left shift by stride, moving left / right is a shift by
+#    1, and a kick (dx, dy) is a shift by dx * stride - dy.
+#  - "The piece fits at (x, y)" is a mask per state, built from the bit_map
+#    rows: a row with a pattern of piece cells collides where the OR of the
+#    board row shifted by the pattern's columns is set.
+#  - The positions reachable with left, right and down moves are a flood fill
+#    of the start position inside the fits mask.  The fill doubles the shift at
+#    each step (Kogge-Stone), so a move across the board takes a few ops.
+#  - The states are linked by the SRS rotations, which are applied to all the
+#    resting positions of a state at once: each kick moves the positions that
+#    no previous kick could place.
+#
+# With full_spin, the piece rotates at every reachable position, including
+# mid-air after a soft drop, which finds the tucks and spins under overhangs.
+# Otherwise, as GetAllPossiblePositions, the piece only rotates when it rests
+# on the stack.  The path to a placement is only searched on demand, see
+# FindPath.
+import collections
+from typing import Dict, Iterator, List, Set, Tuple
+
+import actions
+import game_client
+import shape
+from agents import placement
+
+# The first row of the piece box.  Above it, the piece is out of the board.
+MIN_X = -3
+# O doesn't rotate.
+_SHAPE_O_ID = 4
+# The T placements reached by a last rotation are spins.
+_SHAPE_T_ID = 6
+# The moves of FindPath, the actions are only created for the path found.
+# Rotating n times is the move _ROTATE + n.
+(_LEFT, _RIGHT, _DOWN, _SOFT_DROP, _ROTATE) = range(5)
+_MOVE_ACTIONS = (dict(dir=actions.LEFT), dict(dir=actions.RIGHT),
+                 dict(down=True), dict(dir=actions.SOFT_DROP), None,
+                 dict(rotation=1), dict(rotation=2), dict(rotation=3))
+# The row of the bottom cell in the piece box, by piece id and state.
+_BOTTOM_ROWS = (None,) + tuple(
+  tuple(max(i for (i, _) in states[state].tolist()) for state in range(4))
+  for states in shape.SHAPES[1:])
+
+
+def _ShiftFill(gen: int, pro: int, shift: int, n_steps: int) -> int:
+  """Extends gen along +shift (left shift) while staying in pro."""
+  for _ in range(n_steps):
+    gen |= pro & (gen << shift)
+    pro &= pro << shift
+    shift <<= 1
+  return gen
+
+
+def _ShiftFillBack(gen: int, pro: int, shift: int, n_steps: int) -> int:
+  """Extends gen along -shift (right shift) while staying in pro."""
+  for _ in range(n_steps):
+    gen |= pro & (gen >> shift)
+    pro &= pro >> shift
+    shift <<= 1
+  return gen
+
+
+def _Shift(v: int, delta: int) -> int:
+  return v << delta if delta >= 0 else v >> -delta
+
+
+class Reachability:
+  """The positions reachable by one piece from its current position."""
+
+  def __init__(self, game: game_client.GameClient, piece: shape.Shape,
+               full_spin: bool = True, free_rows: Dict[int, int] = None):
+    """
+    :param full_spin: If True, the piece rotates anywhere.  Otherwise, it only
+           rotates where it can't move down.
+    :param free_rows: The free positions of each row pattern of the pieces on
+           this board, filled on demand.  Pass the same dict to the pieces
+           searched on the same board to share the collision masks: most
+           patterns are used by several pieces.
+    """
+    self.piece = piece
+    self.full_spin = full_spin
+    self.width = game.width
+    self.side_padding = game.map_side_padding
+    self.stride = game.width + 2 * game.map_side_padding + 4
+    self._n_rows = len(game.bit_map)
+    self._kicks = game_client.SRS_KICKS[piece.id]
+    self._can_rotate = piece.id != _SHAPE_O_ID
+    # (state, column) -> row masks of the piece, see GameClient.GetFootprint.
+    # The table is shared by the games of this width, so the placements kept
+    # in a move cache don't keep the game alive.
+    self._masks = game._piece_masks[piece.id]
+    self.fits = self._BuildFits(game.bit_map,
+                                {} if free_rows is None else free_rows)
+    self.reach = self._Fill()
+    self._resting = [self.Resting(state) for state in range(4)]
+    # See _SearchTree.
+    self._tree = None
+    # The bits of the positions under position 0, at the same y.
+    self._column = sum(1 << (i * self.stride)
+                       for i in range(self._n_rows - MIN_X + 1))
+
+  def _BuildFits(self, bit_map: List[int], free: Dict[int, int]) -> List[int]:
+    width = self.width
+    padding = self.side_padding
+    stride = self.stride
+    # The bits of a row where a piece box column y is inside the board's
+    # representable columns, y in [-3, width - 1].
+    band = ((1 << (width + 3)) - 1) << padding
+
+    # free: Row pattern -> the free positions of the pattern in all the rows,
+    # laid out as the positions: row i at (i - MIN_X) * stride.
+    fits = []
+    for bit_shape in shape.BIT_SHAPES[self.piece.id]:
+      # (row, 4 bits of the row) of the non-empty rows of the piece box.
+      patterns = [(r, int(v)) for (r, v) in enumerate(bit_shape) if v]
+      state_fits = -1
+      for (r, pattern) in patterns:
+        if pattern not in free:
+          cols = [c for c in range(4) if pattern & (8 >> c)]
+          # Most of the rows are empty, computes each distinct row once.
+          free_of_row = {}
+          v = 0
+          for row in reversed(bit_map):
+            f = free_of_row.get(row)
+            if f is None:
+              collide = 0
+              for c in cols:
+                collide |= row << c
+              f = free_of_row[row] = band & ~collide
+            v = (v << stride) | f
+          free[pattern] = v << (-MIN_X * stride)
+        state_fits &= free[pattern] >> (r * stride)
+      fits.append(state_fits)
+    return fits
+
+  def _Fill(self) -> List[int]:
+    reach = [0, 0, 0, 0]
+    start = self.piece
+    pos = self.PositionOf(start.x, start.y)
+    if pos < 0 or not (self.fits[start.state] >> pos) & 1:
+      return reach
+
+    stride = self.stride
+    n_down_steps = (self._n_rows - MIN_X).bit_length()
+    n_side_steps = (self.width + 3).bit_length()
+    reach[start.state] = 1 << pos
+    # The resting positions already rotated.
+    rotated = [0, 0, 0, 0]
+    pending = {start.state}
+    while pending:
+      state = pending.pop()
+      fits = self.fits[state]
+      r = reach[state]
+      while True:
+        old = r
+        r = _ShiftFill(r, fits, stride, n_down_steps)
+        r = _ShiftFill(r, fits, 1, n_side_steps)
+        r = _ShiftFillBack(r, fits, 1, n_side_steps)
+        if r == old:
+          break
+      reach[state] = r
+
+      if not self._can_rotate:
+        continue
+      rest = r & ~rotated[state]
+      if not self.full_spin:
+        rest &= ~(fits >> stride)
+      rotated[state] |= rest
+      for n in (1, 2, 3):
+        new_state = (state + n) % 4
+        new = self._Rotate(rest, state, n) & ~reach[new_state]
+        if new:
+          reach[new_state] |= new
+          pending.add(new_state)
+    return reach
+
+  def _Rotate(self, positions: int, state: int, n: int) -> int:
+    """Rotates all the positions of state n times, with the SRS kicks."""
+    fits = self.fits[(state + n) % 4]
+    stride = self.stride
+    ret = 0
+    for (dx, dy) in self._kicks[state][n]:
+      delta = dx * stride - dy
+      moved = _Shift(positions, delta) & fits
+      if moved:
+        ret |= moved
+        positions &= ~_Shift(moved, -delta)
+        if not positions:
+          break
+    return ret
+
+  def PositionOf(self, x: int, y: int) -> int:
+    """Returns the bit of (x, y), or -1 if it is out of the layout."""
+    b = self.width + self.side_padding - 1 - y
+    if x < MIN_X or b < 0 or b >= self.stride:
+      return -1
+    return (x - MIN_X) * self.stride + b
+
+  def Resting(self, state: int) -> int:
+    """Returns the reachable positions of state where the piece can't move
+    down."""
+    return self.reach[state] & ~(self.fits[state] >> self.stride)
+
+  def Placements(self, unique: bool = True) -> List[shape.Shape]:
+    """Returns all the reachable positions where the piece rests, see
+    IterPlacements."""
+    return list(self.IterPlacements(unique))
+
+  def IterPlacements(self, unique: bool = True,
+                     footprints: Set = None) -> Iterator[shape.Shape]:
+    """Yields the reachable positions where the piece rests, the lowest
+    landing first: by decreasing row of the bottom cell of the piece.
+    :param unique: If True, yields one position per footprint (see
+           GameClient.GetFootprint), the one in the start state if any, which
+           needs no rotation.
+    :param footprints: The footprints already yielded, updated with the new
+           ones.  Pass the same set to several pieces on the same board to
+           skip the placements that put the same cells.
+    """
+    if footprints is None:
+      footprints = set()
+    stride = self.stride
+    row_mask = (1 << stride) - 1
+    y0 = self.width + self.side_padding - 1
+    start_state = self.piece.state
+    # (state, row of the bottom cell in the piece box, resting positions) of
+    # the states with resting positions, and the range of their bottom rows.
+    sweeps = []
+    (first, last) = (self._n_rows, MIN_X - 1)
+    for n in range(4):
+      state = (start_state + n) % 4
+      rest = self._resting[state]
+      if not rest:
+        continue
+      bottom = _BOTTOM_ROWS[self.piece.id][state]
+      sweeps.append((state, bottom, rest))
+      first = min(first, ((rest & -rest).bit_length() - 1) // stride + MIN_X + bottom)
+      last = max(last, (rest.bit_length() - 1) // stride + MIN_X + bottom)
+
+    for bottom_row in range(last, first - 1, -1):
+      for (state, bottom, rest) in sweeps:
+        x = bottom_row - bottom
+        if x < MIN_X:
+          continue
+        row = (rest >> ((x - MIN_X) * stride)) & row_mask
+        while row:
+          low = row & -row
+          row ^= low
+          y = y0 - (low.bit_length() - 1)
+          if unique:
+            masks = self._masks[state][y + self.side_padding]
+            footprint = tuple((x + r, mask) for (r, mask) in masks)
+            if footprint in footprints:
+              continue
+            footprints.add(footprint)
+          piece = self.piece.copy()
+          (piece.x, piece.y, piece.state) = (x, y, state)
+          yield piece
+
+  def _RotateOne(self, pos: int, state: int, n: int) -> int:
+    """Returns the position of the piece at pos rotated n times, or -1."""
+    fits = self.fits[(state + n) % 4]
+    stride = self.stride
+    for (dx, dy) in self._kicks[state][n]:
+      p = pos + dx * stride - dy
+      if p >= 0 and (fits >> p) & 1:
+        return p
+    return -1
+
+  def _Neighbors(self, state: int, pos: int):
+    """Yields (move, state, pos) of the moves from a position."""
+    fits = self.fits[state]
+    stride = self.stride
+    for (delta, move) in ((1, _LEFT), (-1, _RIGHT), (stride, _DOWN)):
+      p = pos + delta
+      if p >= 0 and (fits >> p) & 1:
+        yield (move, state, p)
+
+    # The drop ends at the first resting position under pos.
+    below = (self._resting[state] >> pos) & self._column
+    p = pos + ((below & -below).bit_length() - 1)
+    if p != pos:
+      yield (_SOFT_DROP, state, p)
+    if self._can_rotate and (p == pos or self.full_spin):
+      for n in (1, 2, 3):
+        rotated = self._RotateOne(pos, state, n)
+        if rotated >= 0:
+          yield (_ROTATE + n, (state + n) % 4, rotated)
+
+  def _SpinEntries(self, state: int, pos: int) -> Dict[Tuple[int, int], int]:
+    """Returns {(state, pos): rotation move} of the reachable positions that
+    a rotation moves to (state, pos)."""
+    ret = {}
+    stride = self.stride
+    for n in (1, 2, 3):
+      from_state = (state - n) % 4
+      allowed = self.reach[from_state]
+      if not self.full_spin:
+        allowed = self._resting[from_state]
+      for (dx, dy) in self._kicks[from_state][n]:
+        p = pos - (dx * stride - dy)
+        if (p >= 0 and (allowed >> p) & 1 and
+            self._RotateOne(p, from_state, n) == pos):
+          ret.setdefault((from_state, p), _ROTATE + n)
+    return ret
+
+  def _SearchTree(self) -> Dict[Tuple[int, int], Tuple]:
+    """Returns the breadth first search tree of the moves from the start
+    position: {(state, pos): (order, parent node, move)}, order being the
+    index of the node in the search.  Built on the first call and shared by
+    the paths to all the targets."""
+    if self._tree is None:
+      start = (self.piece.state, self.PositionOf(self.piece.x, self.piece.y))
+      tree = {start: (0, None, None)}
+      q = collections.deque([start])
+      while q:
+        node = q.popleft()
+        for (move, new_state, new_pos) in self._Neighbors(*node):
+          child = (new_state, new_pos)
+          if child not in tree:
+            tree[child] = (len(tree), node, move)
+            q.append(child)
+      self._tree = tree
+    return self._tree
+
+  def FindPath(self, target: shape.Shape) -> List[actions.Action] | None:
+    """Returns a shortest list of actions that moves the piece to the target
+    and hard drops it, or None if the target is not reachable.
+
+    For T, a path whose last move is a rotation is preferred, so that the
+    placement counts as a T-spin.
+    """
+    (state, pos) = (target.state, self.PositionOf(target.x, target.y))
+    if pos < 0 or not (self._resting[state] >> pos) & 1:
+      return None
+
+    # The path ends at a node of ends, whose value is the last move to the
+    # target, if any.
+    ends = {}
+    if self.piece.id == _SHAPE_T_ID and self._can_rotate:
+      ends = self._SpinEntries(state, pos)
+    if not ends:
+      ends = {(state, pos): None}
+
+    tree = self._SearchTree()
+    # The first node of ends the search reaches, at the smallest depth.
+    node = min((end for end in ends if end in tree), key=lambda n: tree[n][0],
+               default=None)
+    if node is None:
+      return None
+
+    moves = []
+    if ends[node] is not None:
+      moves.append(ends[node])
+    while True:
+      (_, parent, move) = tree[node]
+      if parent is None:
+        break
+      moves.append(move)
+      node = parent
+    moves.reverse()
+    return [actions.Action(**_MOVE_ACTIONS[move]) for move in moves] + [
+      actions.Action(dir=actions.HARD_DROP)]
+
+
+def GetPlacements(piece: shape.Shape, game: game_client.GameClient,
+                  full_spin: bool = True,
+                  free_rows: Dict[int, int] = None) -> List[placement.Placement]:
+  """Returns all the placements of the piece, the actions are found when
+  accessed."""
+  return list(IterPlacements(piece, game, full_spin, free_rows))
+
+
+def IterPlacements(piece: shape.Shape, game: game_client.GameClient,
+                   full_spin: bool = True,
+                   free_rows: Dict[int, int] = None) -> Iterator[placement.Placement]:
+  """Yields the placements of the piece, the lowest landing first.  The actions
+  are found when accessed.
+  :param free_rows: See Reachability.
+  """
+  reachability = Reachability(game, piece, full_spin, free_rows)
+  for p in reachability.IterPlacements():
+    yield placement.Placement(p, find_actions=lambda p=p: reachability.FindPath(p))
+
+
+def GetHoldPlacements(piece: shape.Shape, game: game_client.GameClient,
+                      full_spin: bool = True) -> Tuple[
+                        List[placement.Placement], List[placement.Placement]]:
+  """Returns the placements of the piece and the ones of the piece a swap
+  brings in (the held piece, or the next one), whose actions start with the
+  swap.  The second list is empty if the game can't swap.
+
+  The pieces share the collision masks of the board and the footprints: a
+  swap for the same piece yields no placement the current one doesn't.  Each
+  piece still has its own flood fill and sweep, so the cost is about twice
+  the one of GetPlacements.
+  """
+  free_rows = {}
+  footprints = set()
+  current = Reachability(game, piece, full_spin, free_rows)
+  ret = [placement.Placement(p, find_actions=lambda p=p: current.FindPath(p))
+         for p in current.IterPlacements(footprints=footprints)]
+  swapped = SwappedPiece(game)
+  if swapped is None:
+    return (ret, [])
+  held = Reachability(game, swapped, full_spin, free_rows)
+  swap = actions.Action(swap=True)
+  return (ret, [placement.Placement(
+    p, find_actions=lambda p=p: [swap] + held.FindPath(p), swap=True)
+    for p in held.IterPlacements(footprints=footprints)])
+
+
+def SwappedPiece(game: game_client.GameClient) -> shape.Shape | None:
+  """Returns the piece that a swap makes the current one, at its start
+  position, or None if the game can't swap."""
+  if not game.can_swap:
+    return None
+  ret = (game.piece_list[0] if game.held_piece is None else game.held_piece).copy()
+  ret.Init()
+  return ret
@@ -0,0 +1,221 @@
+import gc
+import unittest
+import weakref
+
+import numpy as np
+
+import actions
+import game_client
+import shape
+from agents import agent
+from agents import placement
+from agents import reachability
+
+
+class ReachabilityTest(unittest.TestCase):
+  def _RandomGame(self, rng):
+    game = game_client.GameClient(height=10, width=6, seed=1)
+    m = np.zeros(game.color_map.shape, dtype=int)
+    # Random cells in the bottom rows so there are overhangs and holes.
+    m[8:] = rng.random((6, game.width)) < 0.5
+    game.SetWholeMap(m)
+    return game
+
+  def test_MatchesGetAllPossiblePositions(self):
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+      game = self._RandomGame(rng)
+      for piece_id in range(1, 8):
+        piece = shape.GetShapeFromId(piece_id, start_y=game._start_y)
+        # Both return one placement per footprint, but not necessarily the
+        # same one.
+        expected = [game.GetFootprint(p) for (p, path) in
+                    agent.GetAllPossiblePositions(piece, game) if not path[0].swap]
+        r = reachability.Reachability(game, piece, full_spin=False)
+        got = [game.GetFootprint(p) for p in r.Placements()]
+        self.assertEqual(len(got), len(set(got)))
+        self.assertEqual(len(expected), len(set(expected)))
+        self.assertEqual(set(got), set(expected))
+        self.assertEqual(
+          set(game.GetFootprint(p) for p in r.Placements(unique=False)), set(got))
+
+  def test_FindPath(self):
+    rng = np.random.default_rng(1)
+    for _ in range(3):
+      game = self._RandomGame(rng)
+      for piece_id in range(1, 8):
+        piece = shape.GetShapeFromId(piece_id, start_y=game._start_y)
+        for p in reachability.GetPlacements(piece, game):
+          another = game.copy()
+          another.SpawnPiece(piece.copy())
+          another.ProcessActions(p.actions, post_processing=False)
+          self.assertEqual(
+            (another.current_piece.x, another.current_piece.y,
+             another.current_piece.state), (p.piece.x, p.piece.y, p.piece.state))
+          self.assertEqual(p.actions[-1].direction, actions.HARD_DROP)
+
+  def test_FindPath_SharedTree(self):
+    game = self._RandomGame(np.random.default_rng(4))
+    r = reachability.Reachability(game, shape.T(start_y=game._start_y))
+    placements = r.Placements()
+    r.FindPath(placements[0])
+    tree = r._tree
+    for p in placements:
+      r.FindPath(p)
+    self.assertIs(r._tree, tree)
+    # One node per reachable position.
+    self.assertEqual(len(tree), sum(v.bit_count() for v in r.reach))
+
+  def test_FindPath_Unreachable(self):
+    game = game_client.GameClient(height=8, width=6)
+    piece = shape.T(start_y=1)
+    target = piece.copy()
+    target.x = 4
+    self.assertIsNone(reachability.Reachability(game, piece).FindPath(target))
+
+  def test_FullSpin(self):
+    rng = np.random.default_rng(2)
+    n_more = 0
+    for _ in range(10):
+      game = self._RandomGame(rng)
+      for piece_id in range(1, 8):
+        piece = shape.GetShapeFromId(piece_id, start_y=game._start_y)
+        at_rest = set(
+          game.GetFootprint(p) for p in
+          reachability.Reachability(game, piece, full_spin=False).Placements())
+        r = reachability.Reachability(game, piece)
+        placements = r.Placements()
+        footprints = set(game.GetFootprint(p) for p in placements)
+        self.assertLessEqual(at_rest, footprints)
+        n_more += len(footprints) > len(at_rest)
+        for p in placements:
+          if game.GetFootprint(p) in at_rest:
+            continue
+          another = game.copy()
+          another.SpawnPiece(piece.copy())
+          another.ProcessActions(r.FindPath(p), post_processing=False)
+          self.assertEqual(
+            (another.current_piece.x, another.current_piece.y,
+             another.current_piece.state), (p.x, p.y, p.state))
+    self.assertGreater(n_more, 0)
+
+  def test_FindPath_TSpin(self):
+    game = game_client.GameClient(height=8, width=6, headless=True)
+    game.SetWholeMap(np.array([
+      # 0  1  2  3  4  5
+      [0, 0, 0, 0, 0, 0],  # -4
+      [0, 0, 0, 0, 0, 0],  # -3
+      [0, 0, 0, 0, 0, 0],  # -2
+      [0, 0, 0, 0, 0, 0],  # -1
+      [0, 0, 0, 0, 0, 0],  # 0
+      [0, 0, 0, 0, 0, 0],  # 1
+      [0, 0, 0, 0, 0, 0],  # 2
+      [0, 0, 0, 0, 0, 0],  # 3
+      [0, 0, 0, 0, 0, 0],  # 4
+      [1, 1, 1, 0, 0, 0],  # 5
+      [1, 1, 0, 0, 0, 1],  # 6
+      [1, 1, 1, 0, 1, 1]]  # 7
+    ))
+    t = shape.T(start_y=game._start_y)
+    game.SpawnPiece(t)
+    r = reachability.Reachability(game, t)
+    target = t.copy()
+    (target.x, target.y, target.state) = (9, 2, 2)
+    path = r.FindPath(target)
+    self.assertNotEqual(path[-2].rotation, 0)
+
+    spin = game.copy()
+    spin.ProcessActions(path)
+    # The same piece put without the spin.
+    no_spin = game.copy()
+    no_spin.PutPiece(target)
+    self.assertEqual(spin.accumulated_lines_eliminated, 2)
+    self.assertEqual(no_spin.accumulated_lines_eliminated, 2)
+    self.assertGreater(spin.score, no_spin.score)
+
+  def test_IterPlacements_LowestFirst(self):
+    rng = np.random.default_rng(3)
+    for _ in range(5):
+      game = self._RandomGame(rng)
+      for piece_id in range(1, 8):
+        piece = shape.GetShapeFromId(piece_id, start_y=game._start_y)
+        r = reachability.Reachability(game, piece)
+        bottoms = [p.x + max(i for (i, _) in p.GetShape()) for p in r.IterPlacements()]
+        self.assertEqual(bottoms, sorted(bottoms, reverse=True))
+        self.assertEqual(len(bottoms), len(r.Placements()))
+
+  def test_Placements_Unique(self):
+    game = game_client.GameClient(height=8, width=6)
+    piece = shape.I(start_y=1)
+    r = reachability.Reachability(game, piece)
+    # 3 horizontal and 6 vertical footprints, each reached in 2 states.
+    self.assertEqual(len(r.Placements(unique=False)), 18)
+    placements = r.Placements()
+    self.assertEqual(len(placements), 9)
+    # The horizontal ones keep the start state.
+    self.assertEqual(
+      sorted(p.y for p in placements if p.state == piece.state), [0, 1, 2])
+
+  def test_Placements_DontKeepGame(self):
+    game = game_client.GameClient(height=8, width=6)
+    game_ref = weakref.ref(game)
+    placements = reachability.GetPlacements(game.current_piece, game)
+    del game
+    gc.collect()
+    self.assertIsNone(game_ref())
+    self.assertTrue(placements[0].actions)
+
+  def test_InvalidStart(self):
+    game = game_client.GameClient(height=8, width=6)
+    piece = shape.T()
+    piece.y = -3
+    self.assertEqual(reachability.Reachability(game, piece).Placements(), [])
+
+  def test_SharedFreeRows(self):
+    rng = np.random.default_rng(2)
+    game = self._RandomGame(rng)
+    free_rows = {}
+    n_patterns = 0
+    for piece_id in range(1, 8):
+      piece = shape.GetShapeFromId(piece_id, start_y=game._start_y)
+      own_rows = {}
+      self.assertEqual(
+        reachability.Reachability(game, piece, free_rows=free_rows).fits,
+        reachability.Reachability(game, piece, free_rows=own_rows).fits)
+      n_patterns += len(own_rows)
+    # Most of the patterns are shared by several pieces.
+    self.assertLess(len(free_rows), n_patterns / 2)
+
+  def test_GetHoldPlacements(self):
+    game = self._RandomGame(np.random.default_rng(3))
+    game.held_piece = shape.I()
+    (placements, swapped) = reachability.GetHoldPlacements(game.current_piece, game)
+    self.assertFalse(any(p.swap for p in placements))
+    self.assertTrue(all(p.swap and p.piece.id == 1 for p in swapped))
+    self.assertEqual(
+      [(p.piece.x, p.piece.y, p.piece.state) for p in swapped],
+      [(p.x, p.y, p.state) for p in reachability.Reachability(game, shape.I()).Placements()])
+    game.can_swap = False
+    self.assertEqual(reachability.GetHoldPlacements(game.current_piece, game)[1], [])
+
+
+class PlacementTest(unittest.TestCase):
+  def test_Lazy(self):
+    calls = []
+    piece = shape.T()
+
+    def _FindActions():
+      calls.append(1)
+      return [actions.Action(dir=actions.HARD_DROP)]
+
+    p = placement.Placement(piece, find_actions=_FindActions)
+    self.assertIs(p[0], piece)
+    self.assertEqual(calls, [])
+    (got_piece, path) = p
+    self.assertIs(got_piece, piece)
+    self.assertIs(p[1], path)
+    self.assertEqual(calls, [1])
+
+
+if __name__ == "__main__":
+  unittest.main()
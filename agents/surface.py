@@ -0,0 +1,99 @@
+# Placements on boards without overhangs, from the column heights only.
+#
+# When no column has an empty cell under its top, every position where a piece
+# fits has only empty cells above it, so the resting positions are exactly the
+# hard drops of each (state, column): no search is needed.  If the rows of the
+# piece box are also empty, the piece reaches each of them by rotating in place,
+# shifting and hard dropping.
+#
+# The placements are memoized by (piece id, start state, start column, relative
+# column heights), where the heights are relative to the highest column and
+# clipped at CLIP_DEPTH.  The clipping keeps the table small and is exact for
+# the pieces that touch a column close to the highest one: a column 4 rows
+# deeper than another one of the piece can't stop it.  The landing row of the
+# other pieces (e.g. an I in a deep well) is computed per board.
+import functools
+from typing import List, Tuple
+
+import actions
+import bitboard
+import game_client
+import shape
+from agents import placement
+
+# Relative heights are clipped at this depth.
+CLIP_DEPTH = 8
+# A piece within the first CLIP_DEPTH - _MIN_UNCLIPPED rows under the highest
+# column only touches unclipped columns in its drop.
+_MIN_UNCLIPPED = bitboard.PIECE_BOX_SIZE
+_SHAPE_O_ID = 4
+
+
+def HasOverhangs(game: game_client.GameClient) -> bool:
+  """Returns True if a column has an empty cell under an occupied one."""
+  return bool(game.column_holes.any())
+
+
+@functools.lru_cache(maxsize=1 << 14)
+def _Table(piece_id: int, start_state: int, start_y: int, width: int,
+           depths: Tuple[int, ...]) -> Tuple:
+  """Returns ((state, y, landing row relative to the highest column or None,
+  rotation), ...), one per footprint, or None if a state doesn't fit in the
+  columns at the start position."""
+  profiles = bitboard.BOTTOM_PROFILES[piece_id]
+  table = []
+  footprints = set()
+  # The start state first, it needs no rotation.  O doesn't rotate.
+  for n in ((0,) if piece_id == _SHAPE_O_ID else (0, 1, 3, 2)):
+    state = (start_state + n) % 4
+    cols = [col for (col, _) in profiles[state]]
+    if start_y + cols[0] < 0 or start_y + cols[-1] >= width:
+      return None
+    cells = shape.SHAPES[piece_id][state].tolist()
+    min_row = min(i for (i, _) in cells)
+    for y in range(-cols[0], width - cols[-1]):
+      # The same cells in two states land on the same rows.
+      footprint = frozenset((i - min_row, j + y) for (i, j) in cells)
+      if footprint in footprints:
+        continue
+      footprints.add(footprint)
+      landing = None
+      if min(depths[y + col] for col in cols) <= CLIP_DEPTH - _MIN_UNCLIPPED:
+        landing = min(depths[y + col] - bottom - 1
+                      for (col, bottom) in profiles[state])
+      table.append((state, y, landing, n))
+  return tuple(table)
+
+
+def GetPlacements(piece: shape.Shape,
+                  game: game_client.GameClient) -> List[placement.Placement] | None:
+  """Returns the placements of the piece, or None if the board has overhangs
+  or the stack reaches the rows of the piece."""
+  heights = game.column_heights.tolist()
+  max_height = max(heights)
+  # The row of the highest column top.
+  highest = game.height + game.map_height_padding - max_height
+  if highest < piece.x + bitboard.PIECE_BOX_SIZE or HasOverhangs(game):
+    return None
+  depths = tuple(min(max_height - h, CLIP_DEPTH) for h in heights)
+  table = _Table(piece.id, piece.state, piece.y, game.width, depths)
+  if table is None:
+    return None
+
+  ret = []
+  for (state, y, landing, rotation) in table:
+    p = piece.copy()
+    (p.y, p.state) = (y, state)
+    if landing is None:
+      p.x += game.DropDistance(p)
+    else:
+      p.x = highest + landing
+
+    path = []
+    if rotation:
+      path.append(actions.Action(rotation=rotation))
+    direction = actions.RIGHT if y > piece.y else actions.LEFT
+    path.extend(actions.Action(dir=direction) for _ in range(abs(y - piece.y)))
+    path.append(actions.Action(dir=actions.HARD_DROP))
+    ret.append(placement.Placement(p, actions=path))
+  return ret
@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+
+import game_client
+import shape
+from agents import agent
+from agents import reachability
+from agents import surface
+
+
+class SurfaceTest(unittest.TestCase):
+  def _Game(self, heights):
+    game = game_client.GameClient(height=20, width=10, seed=0, headless=True)
+    color_map = np.zeros((game.height + game.map_height_padding, game.width),
+                         dtype=int)
+    for (col, h) in enumerate(heights):
+      if h:
+        color_map[-h:, col] = 1
+    game.SetWholeMap(color_map)
+    return game
+
+  def _CheckPlacements(self, game, piece, placements):
+    for p in placements:
+      another = game.copy()
+      another.SpawnPiece(piece)
+      another.ProcessActions(p.actions, post_processing=False)
+      self.assertEqual(
+        (another.current_piece.x, another.current_piece.y,
+         another.current_piece.state), (p.piece.x, p.piece.y, p.piece.state))
+
+  def test_MatchesHardDrops(self):
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+      game = self._Game(rng.integers(0, 12, size=10))
+      for piece_id in range(1, 8):
+        piece = shape.GetShapeFromId(piece_id, start_y=game._start_y)
+        placements = surface.GetPlacements(piece, game)
+        footprints = set(game.GetFootprint(p.piece) for p in placements)
+        self.assertEqual(len(footprints), len(placements))
+        self.assertEqual(
+          set(game.GetFootprint(p) for p in
+              reachability.Reachability(game, piece).Placements()),
+          footprints)
+        self._CheckPlacements(game, piece, placements)
+
+  def test_DeepWell(self):
+    game = self._Game([12, 12, 12, 12, 12, 12, 12, 12, 12, 0])
+    piece = shape.I(start_y=game._start_y)
+    placements = surface.GetPlacements(piece, game)
+    # The vertical I in the well, column 2 of its box.
+    (well,) = [p.piece for p in placements
+               if p.piece.state == 1 and p.piece.y == 7]
+    self.assertEqual(well.x, game.height + game.map_height_padding - 4)
+    self._CheckPlacements(game, piece, placements)
+
+  def test_Memoized(self):
+    surface._Table.cache_clear()
+    piece = shape.T(start_y=3)
+    first = surface.GetPlacements(piece, self._Game([1, 2, 3, 2, 1, 0, 0, 1, 2, 2]))
+    # The same profile, 3 rows higher.
+    game = self._Game([4, 5, 6, 5, 4, 3, 3, 4, 5, 5])
+    second = surface.GetPlacements(piece, game)
+    self.assertEqual(surface._Table.cache_info().hits, 1)
+    self.assertEqual([(p.piece.x + 3, p.piece.y, p.piece.state) for p in second],
+                     [(p.piece.x, p.piece.y, p.piece.state) for p in first])
+    self._CheckPlacements(game, piece, second)
+
+  def test_Fallback(self):
+    game = self._Game([2, 2, 2, 2, 2, 2, 2, 2, 2, 2])
+    piece = shape.T(start_y=3)
+    self.assertFalse(surface.HasOverhangs(game))
+    self.assertIsNotNone(surface.GetPlacements(piece, game))
+
+    # A hole.
+    game.SetMap((game.height + game.map_height_padding - 1, 4), 0)
+    self.assertTrue(surface.HasOverhangs(game))
+    self.assertIsNone(surface.GetPlacements(piece, game))
+    game.SpawnPiece(piece)
+    self.assertEqual(
+      [(p.x, p.y, p.state) for (p, _) in agent.GetPossiblePositionsSurface(piece, game)],
+      [(p.x, p.y, p.state) for (p, _) in
+       agent.GetPossiblePositionsFullSpin(piece, game)])
+
+    # The stack reaches the rows of the piece.
+    game = self._Game([2, 2, 2, 2, 2, 2, 2, 2, 2, 21])
+    self.assertIsNone(surface.GetPlacements(piece, game))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -3,11 +3,15 @@
 # With color_map this function is ~0.45
 import cProfile
 import pstats
+import timeit
 
 from agents import agent
+from agents import batch_reachability
 from benchmark import utils
 
 NUM_GAMES = 50
+# The batch sizes of the wall clock comparison.
+WALL_CLOCK_NUM_GAMES = (50, 500, 2000)
 
 def RunFunc(func, games):
   avg_sol = 0
@@ -17,6 +21,23 @@ def RunFunc(func, games):
   avg_sol /= len(games)
   print(func, " ", avg_sol)
 
+def RunBatch(games):
+  placements = batch_reachability.GetBatchPlacements(games)
+  print("batch ", sum(len(p) for p in placements) / len(games))
+
+def RunWallClock():
+  # cProfile's tt counts the python calls, not the time spent in NumPy, so the
+  # batch is compared by wall clock.
+  for num_games in WALL_CLOCK_NUM_GAMES:
+    games = utils.GenRandomGames(num_games, 25, 6)
+    per_board = lambda: [agent.GetPossiblePositionsFullSpin(g.current_piece, g) for g in games]
+    batch = lambda: batch_reachability.GetBatchPlacements(games)
+    (per_board_t, batch_t) = (
+      min(timeit.repeat(f, number=1, repeat=3)) * 1000 / num_games
+      for f in (per_board, batch))
+    print("%d games: full spin %f ms, batch %f ms per board" %
+          (num_games, per_board_t, batch_t))
+
 def RunBenchmark():
   games = utils.GenRandomGames(NUM_GAMES, 25, 6)
   profile_quick_version = cProfile.Profile()
@@ -34,9 +55,25 @@ def RunBenchmark():
                                     func=agent.GetPossiblePositionsQuickVersion2,
                                     games=games)
 
+  profile_bitboard_version = cProfile.Profile()
+  profile_bitboard_version.runcall(RunFunc,
+                                   func=agent.GetPossiblePositionsBitboard,
+                                   games=games)
+
+  profile_full_spin_version = cProfile.Profile()
+  profile_full_spin_version.runcall(RunFunc,
+                                    func=agent.GetPossiblePositionsFullSpin,
+                                    games=games)
+
+  profile_batch_version = cProfile.Profile()
+  profile_batch_version.runcall(RunBatch, games=games)
+
   stats_quick = pstats.Stats(profile_quick_version)
   stats_quick_dfs = pstats.Stats(profile_quick_version_dfs)
   stats_normal = pstats.Stats(profile_normal_version)
+  stats_bitboard = pstats.Stats(profile_bitboard_version)
+  stats_full_spin = pstats.Stats(profile_full_spin_version)
+  stats_batch = pstats.Stats(profile_batch_version)
 
   stats_quick.sort_stats("tottime").print_stats(0.2)
   stats_quick_dfs.sort_stats("tottime").print_stats(0.2)
@@ -47,6 +84,10 @@ def RunBenchmark():
   print("normal tt %f ms", (stats_normal.total_tt * 1000 / NUM_GAMES))
   print("quick %f%%" % (100 * stats_quick.total_tt / stats_normal.total_tt))
   print("quick dfs %f%%" % (100 * stats_quick_dfs.total_tt / stats_normal.total_tt))
+  print("bitboard tt %f ms" % (stats_bitboard.total_tt * 1000 / NUM_GAMES))
+  print("full spin tt %f ms" % (stats_full_spin.total_tt * 1000 / NUM_GAMES))
+  print("batch tt %f ms" % (stats_batch.total_tt * 1000 / NUM_GAMES))
+  RunWallClock()
 
 if __name__ == "__main__":
   RunBenchmark()
@@ -208,14 +208,19 @@ from benchmark import utils
 from agents import agent
 from agents import near_perfect_bot
 
-def RunAgent(n_games=20, n_moves=50):
+def RunAgent(n_games=20, n_moves=50, beam_width=1, beam_depth=0):
   games = utils.GenRandomGames(n_games, random_blocks=20, last_n_lines=6)
   for game in games:
     env = agent.Env(game=game)
-    bot = near_perfect_bot.TheNearPerfectAgent(env)
+    bot = near_perfect_bot.TheNearPerfectAgent(
+      env, beam_width=beam_width, beam_depth=beam_depth)
     for i in range(n_moves):
       decision = bot.MakeDecision()
       env.game.ProcessActions(decision)
+    stats = bot.search_stats
+    print(f"beam {beam_width}x{beam_depth}: "
+          f"{stats.nodes_per_second:.0f} nodes/s, "
+          f"{stats.seconds_per_decision * 1000:.1f} ms per decision")
 
 
 def RunBenchmark():
@@ -1,17 +1,21 @@
 import game_client
 import random
 
-def _GenOneRandomGame(random_blocks, last_n_lines):
-  game = game_client.GameClient(height=20, width=10)
+def _GenOneRandomGame(random_blocks, last_n_lines, seed=None):
+  game = game_client.GameClient(height=20, width=10, seed=seed)
+  rng = random.Random(seed)
 
   # Fills some random spots in the last 4 lines
   for i in range(random_blocks):
-    (x, y) = (random.randrange(game.height-last_n_lines, game.height-1), random.randrange(0, game.width))
-    game.color_map[x, y] = 1
+    (x, y) = (rng.randrange(game.height-last_n_lines, game.height-1), rng.randrange(0, game.width))
+    game.SetMap((x, y), 1)
   return game
 
-def GenRandomGames(n: int, random_blocks=15, last_n_lines=4):
+def GenRandomGames(n: int, random_blocks=15, last_n_lines=4, seed=None):
+  """If seed is set, game i is generated with seed + i so the benchmarks are
+  reproducible."""
   games = []
   for i in range(n):
-    games.append(_GenOneRandomGame(random_blocks, last_n_lines))
+    game_seed = None if seed is None else seed + i
+    games.append(_GenOneRandomGame(random_blocks, last_n_lines, game_seed))
   return games
@@ -0,0 +1,156 @@
+# Precomputed bitboard masks for the 7 tetrominoes.
+#
+# The game board keeps one integer per row (GameClient.bit_map).  Column j of
+# the board is stored at bit (width + side_padding - 1 - j) of its row, and the
+# side paddings are filled with 1s, so a piece overlapping the walls collides
+# with the padding bits.
+#
+# GetPieceMasks(width, side_padding) returns a table indexed by
+#   [piece id][state][y + side_padding]
+# Each entry is a tuple of (row offset, row mask) for the non-empty rows of
+# the piece placed at column y.  Checking a placement is then a few integer
+# ANDs against the board rows, without creating any temporary array.
+#
+# The masks are plain python ints and are built only once per board width.
+#
+# BOTTOM_PROFILES[piece id][state] is a tuple of (column, lowest row) of the
+# piece box, for the columns the piece occupies.  With the top of the stack of
+# each column (GameClient's column tops), it gives how far a piece can drop.
+#
+# PutPieces(...) stamps N pieces on N copies of a board and clears the lines in
+# one vectorized pass, so that candidates can be evaluated without creating a
+# game object per candidate.
+
+import functools
+from typing import Tuple
+
+import numpy as np
+
+import shape
+
+# Widest rows (width + 2 * side_padding) PutPieces supports: it stacks the rows
+# as np.int64, without the sign bit.
+MAX_PUT_PIECES_ROW_BITS = 63
+
+# Number of rows and columns of the box that contains a piece.
+PIECE_BOX_SIZE = 4
+NUM_PIECE_IDS = len(shape.BIT_SHAPES)
+NUM_STATES = 4
+
+
+def GetNumColumns(width: int, side_padding: int) -> int:
+  """Returns how many y positions the mask table covers.
+  Column index 0 is y = -side_padding.
+  """
+  return width + 2 * side_padding - PIECE_BOX_SIZE + 1
+
+
+def _BuildBottomProfiles() -> Tuple:
+  table = [None]
+  for piece_id in range(1, NUM_PIECE_IDS):
+    states = []
+    for cells in shape.SHAPES[piece_id]:
+      bottoms = {}
+      for (i, j) in cells.tolist():
+        bottoms[j] = max(i, bottoms.get(j, i))
+      states.append(tuple(sorted(bottoms.items())))
+    table.append(tuple(states))
+  return tuple(table)
+
+
+BOTTOM_PROFILES = _BuildBottomProfiles()
+
+
+@functools.lru_cache(maxsize=None)
+def GetPieceMasks(width: int, side_padding: int) -> Tuple:
+  """Builds the (piece id, state, column) -> ((row, mask), ...) table."""
+  table = [None]
+  for piece_id in range(1, NUM_PIECE_IDS):
+    states = []
+    for state in range(NUM_STATES):
+      rows = [int(v) for v in shape.BIT_SHAPES[piece_id][state]]
+      columns = []
+      for col in range(GetNumColumns(width, side_padding)):
+        y = col - side_padding
+        shift = width + side_padding - PIECE_BOX_SIZE - y
+        columns.append(tuple((r, v << shift) for (r, v) in enumerate(rows) if v))
+      states.append(tuple(columns))
+    table.append(tuple(states))
+  return tuple(table)
+
+
+@functools.lru_cache(maxsize=None)
+def GetPieceMaskArray(width: int, side_padding: int) -> np.ndarray:
+  """Same as GetPieceMasks but as an int64 array indexed by
+  [piece id, state, column, row offset].  Empty rows have a 0 mask.
+  """
+  n_columns = GetNumColumns(width, side_padding)
+  ret = np.zeros((NUM_PIECE_IDS, NUM_STATES, n_columns, PIECE_BOX_SIZE),
+                 dtype=np.int64)
+  for (piece_id, states) in enumerate(GetPieceMasks(width, side_padding)):
+    if states is None:
+      continue
+    for (state, columns) in enumerate(states):
+      for (col, rows) in enumerate(columns):
+        for (r, mask) in rows:
+          ret[piece_id, state, col, r] = mask
+  ret.flags.writeable = False
+  return ret
+
+
+def PutPieces(board: np.ndarray, pieces: np.ndarray, n_playfield_rows: int,
+              width: int, side_padding: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """Puts each piece on its own copy of the board and clears the lines.
+
+  :param board: Rows of one board, shape (rows,).
+  :param pieces: Shape (N, 4), each row is (id, x, y, state).
+  :param n_playfield_rows: Number of rows that can be cleared.  The rows
+         below are the bottom padding.
+  :return: (boards, lines_cleared, valid)
+    boards: Shape (N, rows).  Invalid placements leave the board unchanged.
+    lines_cleared: Shape (N,), number of rows cleared by each piece.
+    valid: Shape (N,), False if the piece doesn't fit on the board.
+  """
+  assert width + 2 * side_padding <= MAX_PUT_PIECES_ROW_BITS, (
+    "The rows of a board of width %d don't fit in an int64" % width)
+  pieces = np.asarray(pieces, dtype=np.int64).reshape(-1, 4)
+  n = len(pieces)
+  n_rows = len(board)
+  table = GetPieceMaskArray(width, side_padding)
+
+  cols = pieces[:, 2] + side_padding
+  valid = (cols >= 0) & (cols < table.shape[2])
+  masks = table[pieces[:, 0], pieces[:, 3], np.clip(cols, 0, table.shape[2] - 1)]
+  masks[~valid] = 0
+
+  rows = pieces[:, 1:2] + np.arange(PIECE_BOX_SIZE)
+  in_board = (rows >= 0) & (rows < n_rows)
+  valid &= ~np.any((masks != 0) & ~in_board, axis=1)
+  rows = np.clip(rows, 0, n_rows - 1)
+  masks[~in_board] = 0
+
+  boards = np.tile(np.asarray(board, dtype=np.int64), (n, 1))
+  index = np.arange(n)[:, None]
+  valid &= ~np.any(boards[index, rows] & masks, axis=1)
+  masks[~valid] = 0
+  boards[index, rows] |= masks
+
+  # Moves the full rows to the top in a stable way, then empties them.
+  full_row = (1 << (width + 2 * side_padding)) - 1
+  empty_row = full_row ^ (((1 << width) - 1) << side_padding)
+  playfield = boards[:, :n_playfield_rows]
+  full = playfield == full_row
+  lines_cleared = np.count_nonzero(full, axis=1)
+  order = np.argsort(~full, axis=1, kind="stable")
+  playfield = np.take_along_axis(playfield, order, axis=1)
+  playfield[np.arange(n_playfield_rows) < lines_cleared[:, None]] = empty_row
+  boards[:, :n_playfield_rows] = playfield
+
+  return (boards, lines_cleared, valid)
+
+
+def RowsToCells(rows: np.ndarray, width: int, side_padding: int) -> np.ndarray:
+  """Converts bitboard rows of shape (..., rows) to a bool array of shape
+  (..., rows, width) marking the occupied cells."""
+  shifts = width + side_padding - 1 - np.arange(width)
+  return ((np.asarray(rows)[..., None] >> shifts) & 1).astype(bool)
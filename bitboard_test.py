@@ -0,0 +1,126 @@
+import unittest
+
+import numpy as np
+
+import bitboard
+import game_client
+import shape
+
+
+class BitboardTest(unittest.TestCase):
+  def test_GetPieceMasks_MatchesShiftedBitShapes(self):
+    width = 10
+    masks = bitboard.GetPieceMasks(width, 4)
+    for piece_id in range(1, bitboard.NUM_PIECE_IDS):
+      for state in range(bitboard.NUM_STATES):
+        for y in range(-4, width + 1):
+          expected = [int(v) << (width - y)
+                      for v in shape.BIT_SHAPES[piece_id][state]]
+          got = 4 * [0]
+          for (r, mask) in masks[piece_id][state][y + 4]:
+            got[r] = mask
+          self.assertEqual(expected, got)
+
+  def test_GetPieceMasks_Cached(self):
+    self.assertIs(bitboard.GetPieceMasks(10, 4), bitboard.GetPieceMasks(10, 4))
+
+  def test_CheckValidity_OutOfBoard(self):
+    game = game_client.GameClient(height=6, width=5)
+
+    t = shape.T()
+    (t.x, t.y) = (0, -5)
+    self.assertFalse(game.CheckValidity(t))
+    (t.x, t.y) = (0, 6)
+    self.assertFalse(game.CheckValidity(t))
+    # Above the top of the map.
+    (t.x, t.y) = (-1, 0)
+    self.assertFalse(game.CheckValidity(t))
+    # Below the bottom padding.
+    (t.x, t.y) = (len(game.bit_map), 0)
+    self.assertFalse(game.CheckValidity(t))
+
+    # The first row of the I piece is empty, so it can stay at x = -1.
+    i = shape.I()
+    (i.x, i.y) = (-1, 0)
+    self.assertTrue(game.CheckValidity(i))
+
+  def test_CheckValidity_MatchesColorMap(self):
+    game = game_client.GameClient(height=8, width=6)
+    rng = np.random.default_rng(1)
+    v = (rng.random(game.color_map.shape) < 0.3).astype(int)
+    game.SetWholeMap(v)
+
+    for piece_id in range(1, bitboard.NUM_PIECE_IDS):
+      piece = shape.GetShapeFromId(piece_id)
+      for state in range(bitboard.NUM_STATES):
+        piece.state = state
+        for x in range(game.height + game.map_height_padding):
+          for y in range(-2, game.width):
+            (piece.x, piece.y) = (x, y)
+            expected = True
+            for (i, j) in piece.GetShape():
+              (i, j) = (i + x, j + y)
+              if (i >= v.shape[0] or j < 0 or j >= game.width or v[i, j]):
+                expected = False
+            self.assertEqual(expected, game.CheckValidity(piece))
+
+  def test_PutPieces_MatchesPutPiece(self):
+    game = game_client.GameClient(height=8, width=6)
+    game.SetWholeMap(np.array([
+      # 0  1  2  3  4  5
+      [0, 0, 0, 0, 0, 0],  # -4
+      [0, 0, 0, 0, 0, 0],  # -3
+      [0, 0, 0, 0, 0, 0],  # -2
+      [0, 0, 0, 0, 0, 0],  # -1
+      [0, 0, 0, 0, 0, 0],  # 0
+      [0, 0, 0, 0, 0, 0],  # 1
+      [0, 0, 0, 0, 0, 0],  # 2
+      [0, 0, 0, 0, 1, 0],  # 3
+      [1, 1, 0, 1, 1, 0],  # 4
+      [1, 1, 1, 0, 1, 0],  # 5
+      [1, 1, 1, 1, 1, 0],  # 6
+      [1, 1, 1, 1, 1, 0]]  # 7
+    ))
+
+    pieces = []
+    for piece_id in range(1, bitboard.NUM_PIECE_IDS):
+      for state in range(bitboard.NUM_STATES):
+        for x in range(-2, 14):
+          for y in range(-5, 8):
+            piece = shape.GetShapeFromId(piece_id)
+            (piece.x, piece.y, piece.state) = (x, y, state)
+            pieces.append(piece)
+
+    (boards, lines_cleared, valid) = game.PutPieces(pieces)
+    self.assertEqual(boards.shape, (len(pieces), len(game.bit_map)))
+    self.assertTrue(np.any(valid))
+    self.assertEqual(np.max(lines_cleared), 2)
+
+    for (n, piece) in enumerate(pieces):
+      another = game.SearchClone()
+      self.assertEqual(valid[n], another.PutPiece(piece))
+      self.assertEqual(boards[n].tolist(), another.bit_map)
+      self.assertEqual(lines_cleared[n], another.accumulated_lines_eliminated)
+      self.assertTrue(np.array_equal(
+        bitboard.RowsToCells(boards[n, :-4], game.width, 4),
+        another.color_map != 0))
+
+  def test_PutPieces_Empty(self):
+    game = game_client.GameClient(height=8, width=6)
+    (boards, lines_cleared, valid) = game.PutPieces([])
+    self.assertEqual(boards.shape, (0, len(game.bit_map)))
+    self.assertEqual(len(lines_cleared), 0)
+    self.assertEqual(len(valid), 0)
+
+
+  def test_PutPieces_TooWide(self):
+    side_padding = 4
+    width = bitboard.MAX_PUT_PIECES_ROW_BITS - 2 * side_padding
+    board = [(1 << (width + 2 * side_padding)) - 1] * 4
+    (_, lines_cleared, valid) = bitboard.PutPieces(board, [], 4, width, side_padding)
+    self.assertEqual((len(lines_cleared), len(valid)), (0, 0))
+    with self.assertRaises(AssertionError):
+      bitboard.PutPieces(board, [], 4, width + 1, side_padding)
+
+if __name__ == "__main__":
+  unittest.main()
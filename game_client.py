@@ -1,10 +1,10 @@
 # This file defines the back end of the Tetris game
 #
-# GameState is the base class of GameClient.
+# GameState is an immutable snapshot of a GameClient, see GameClient.GetState().
 #
-# GameClient.Run() will start two threads:
-#  - _ProcessActions:  Process the action list every x seconds
-#  - _AutoDrop:  Auto drops the current piece.
+# GameClient.Run() runs the game loop (scheduler.TickScheduler) in the calling
+# thread.  The loop processes the input actions and auto drops the current
+# piece (GravityTick) on time.
 #
 # GameClient:
 #  - current piece
@@ -16,8 +16,10 @@
 #       directly
 #  - ProcessAction(...): Lets the game client process one actions directly
 #  - PutPiece(...): Puts the current piece if the position is valid.
+#  - PutPieces(...): Puts a batch of candidate pieces on copies of the board.
 #  - GetState(...): Gets game state, useful to AI
 #  - CheckValidity(...): Checks if a move is valid
+#  - DropDistance(...): How many rows a piece can fall
 #  - SpawnPiece(...):  Sets the current piece.
 #  - Restart(...): Restarts the game.
 #  - Rotate(...): Alternatively, callers can directly call Rotate to rotate
@@ -27,22 +29,26 @@
 #
 import copy
 import queue
-import threading
-import time
 from threading import Lock
-from typing import Tuple, List
+from typing import Callable, List, Tuple
 
 import numpy as np
 
 import actions
+import bitboard
+import piece_generator
+import scheduler
 import shape
 
 # Some global settings
 DEFAULT_LENGTH = 20
 DEFAULT_WIDTH = 10
 MAP_PADDING_SIZE = 4
-# When there are less than threshold pieces, spawn a new bag.
+# When there are at most threshold pieces, add the next bag to the list, so
+# the list shows REFILL_THRESHOLD to REFILL_THRESHOLD + 6 pieces.
 REFILL_THRESHOLD = 5
+# Taken pieces kept at the front of the piece storage before it is trimmed.
+PIECE_LIST_TRIM = 64
 
 # Disable the auto drop in next few seconds
 MAXIMUM_LOCK_TIME = 4
@@ -68,19 +74,224 @@ ATTACK_TST = 6
 ATTACK_PC = 10
 
 
+# SRS wall kicks, SRS_KICKS[piece id][state][num_90rotations] is the tuple of
+# (dx, dy) offsets to try, in order.
+# Ref: https://tetris.fandom.com/wiki/SRS
+# The 180 rotation wall kick table is copied from
+# https://tetris.fandom.com/wiki/SRS#180.C2.B0_rotation
+# which is origined from
+# https://github.com/JoshuaWebb/nullpomino/blob/master/src/mu/nu/nullpo/game/subsystem/wallkick/StandardWallkick.java
+# Zero rotation retries the kicks of the 270 rotation.
+_KICKS_JLSTZ = (
+  # state 0
+  (((0, 0), (0, -1), (-1, -1), (2, 0), (2, -1)),  # 0>>1
+   # 0>>2, 180 rotation
+   ((0, 0), (1, 0), (2, 0), (1, 1), (2, 1), (-1, 0), (-2, 0), (-1, 1), (-2, 1), (0, -1), (3, 0), (-3, 0)),
+   ((0, 0), (0, 1), (-1, 1), (2, 0), (2, 1))),  # 0>>3
+
+  # state 1
+  (((0, 0), (0, 1), (1, 1), (-2, 0), (-2, 1)),  # 1>>2
+   # l>>3, 180 rotation
+   # ((0,0), (0, 1), (0, 2), (-1, 1), (-1, 2), (0, -1), (0, -2), (-1, -1), (-1, -2), (1, 0), (0, 3), (0, -3)),
+   ((0, 0),),
+   ((0, 0), (0, 1), (1, 1), (-2, 0), (-2, 1))),  # 1>>0
+
+  # state 2
+  (((0, 0), (0, 1), (-1, 1), (2, 0), (2, 1)),  # 2>>3
+   # ((0,0), (-1, 0), (-2, 0), (-1, -1), (-2, -1), (1, 0), (2, 0), (1, -1), (2, -1), (0, 1), (-3, 0), (3, 0)),  # 2>>0,
+   ((0, 0),),
+   ((0, 0), (0, -1), (-1, -1), (2, 0), (2, -1))),  # 2>>1
+
+  # state 3
+  (((0, 0), (0, -1), (1, -1), (2, 0), (-2, -1)),  # 3>>0
+   # 3>>1, 180 rotation
+   # ((0,0), (0, 1), (0, 2), (1, 1), (1, 2), (0, -1), (0, -2), (1, -1), (1, -2), (-1, 0), (0, 3), (0, -3)),
+   ((0, 0),),
+   ((0, 0), (0, -1), (1, -1), (2, 0), (-2, -1))),  # 3>>2
+)
+
+_KICKS_I = (
+  # state 0
+  (((0, 0), (0, -2), (0, 1), (1, -2), (-2, 1)),  # 0>>1
+   # ((0,0), (-1, 0), (-2, 0), (1, 0), (2, 0), (0, 1)),  # 0>>2, 180 rotation
+   ((0, 0),),
+   ((0, 0), (0, -1), (0, 2), (-2, -1), (1, 2))),  # 0>>3
+
+  # state 1
+  (((0, 0), (0, -1), (0, 2), (-2, -1), (1, 2)),  # 1>>2
+   # ((0,0), (0, 1), (0, 2), (0, -1), (0, -2), (-1, 0)),  # 1>>3, 180 rotation,
+   ((0, 0),),
+   ((0, 0), (0, 2), (0, -1), (-1, 2), (2, -1))),  # 1>>0
+
+  # state 2
+  (((0, 0), (0, 2), (0, -1), (-1, 2), (2, -1)),  # 2>>3
+   # ((0, 0), (1, 0), (2, 0), (-1, 0), (-2, 0), (0, -1)),  # 2>>0, 180 rotation
+   ((0, 0),),
+   ((0, 0), (0, 1), (0, -2), (2, 1), (-1, -2))),  # 2>>1
+
+  # state 3
+  (((0, 0), (0, 1), (0, -2), (2, 1), (-1, -2)),  # 3>>0
+   # ((0, 0), (0, 1), (0, 2), (0, -1), (0, -2), (1, 0)),  # 3>>1, 180 rotation
+   ((0, 0),),
+   ((0, 0), (0, -2), (0, 1), (1, -2), (2, 1))),  # 3>>2
+)
+
+
+def _ByRotation(kicks):
+  # kicks[state] is indexed by num_90rotations - 1.
+  return tuple((k[2], k[0], k[1], k[2]) for k in kicks)
+
+
+def _ReadOnly(values) -> np.ndarray:
+  ret = np.array(values)
+  ret.flags.writeable = False
+  return ret
+
+
+# I and O use the I table, the other pieces use the JLSTZ table.
+SRS_KICKS = (None,) + tuple(
+  _ByRotation(_KICKS_I if piece_id in (1, 4) else _KICKS_JLSTZ)
+  for piece_id in range(1, 8))
+
+# Board cells around (x, y) that decide which kick fits: rows x-3..x+6 and
+# columns y-2..y+5 cover every kick above with a 4x4 piece box.
+_KICK_WINDOW_FIRST_ROW = -3
+_KICK_WINDOW_ROWS = 10
+_KICK_WINDOW_FIRST_COLUMN = -2
+_KICK_WINDOW_LAST_COLUMN = 5
+_KICK_WINDOW_COLUMNS = _KICK_WINDOW_LAST_COLUMN - _KICK_WINDOW_FIRST_COLUMN + 1
+_KICK_WINDOW_MASK = (1 << _KICK_WINDOW_COLUMNS) - 1
+# (piece id, state, new state, window bits) -> (dx, dy) or None.
+KICK_CACHE_SIZE = 1 << 16
+_kick_cache = {}
+_KICK_CACHE_MISS = object()
+
+
 class InternalError(Exception):
   """Any internal errors."""
 
 
+class _NoLock:
+  """Stands in for threading.Lock in headless games, which are only used by
+  one thread."""
+
+  def acquire(self, blocking=True, timeout=-1):
+    return True
+
+  def release(self):
+    pass
+
+  def locked(self):
+    return False
+
+
 class GameState:
-  def __init__(self):
-    self.height = 0
-    self.width = 0
-    self.color_map = np.array([])
-    self.current_piece: shape.Shape|None = None
+  """An immutable and compact snapshot of a game, see GameClient.GetState().
+
+  The board is kept as the bit_map rows (ints) plus the color ids (bytes) and
+  the pieces as small ints, so a snapshot is cheap to create, compare, use as
+  a dict key, and send to another process.
+
+  current_piece: (id, x, y, state), or None.
+  held_piece: The piece id, 0 if there is no held piece.
+  piece_list: The piece ids of the piece list.
+  seed, piece_cursor: The piece stream and the position of the piece after the
+    piece list in it, see piece_generator.py.
+  """
+  # The arguments of __init__, in order.  The cached hash is not one of them.
+  _FIELDS = ("height", "width", "map_height_padding", "map_side_padding",
+             "rows", "colors", "current_piece", "held_piece", "piece_list",
+             "score", "is_gameover", "can_swap",
+             "accumulated_lines_eliminated", "piece_dropped", "level",
+             "line_sent", "line_received", "seed", "piece_cursor")
+  __slots__ = _FIELDS + ("_hash",)
+
+  def __init__(self, height: int, width: int, map_height_padding: int,
+               map_side_padding: int, rows: Tuple[int, ...], colors: bytes,
+               current_piece: Tuple[int, int, int, int] | None,
+               held_piece: int, piece_list: Tuple[int, ...], score: int = 0,
+               is_gameover: bool = False, can_swap: bool = True,
+               accumulated_lines_eliminated: int = 0, piece_dropped: int = 0,
+               level: int = 0, line_sent: int = 0, line_received: int = 0,
+               seed: int = None, piece_cursor: int = 0):
+    values = (height, width, map_height_padding, map_side_padding, rows,
+              colors, current_piece, held_piece, piece_list, score,
+              is_gameover, can_swap, accumulated_lines_eliminated,
+              piece_dropped, level, line_sent, line_received, seed,
+              piece_cursor)
+    for (name, value) in zip(self._FIELDS, values):
+      object.__setattr__(self, name, value)
+    object.__setattr__(self, "_hash", hash(
+      (rows, current_piece, held_piece, piece_list, can_swap)))
+
+  def _Values(self) -> Tuple:
+    return tuple(getattr(self, name) for name in self._FIELDS)
+
+  def __setattr__(self, name, value):
+    raise AttributeError("GameState is immutable")
+
+  def __delattr__(self, name):
+    raise AttributeError("GameState is immutable")
+
+  def __hash__(self):
+    return self._hash
+
+  def __eq__(self, other):
+    if not isinstance(other, GameState):
+      return False
+    return self._hash == other._hash and self._Values() == other._Values()
+
+  def __reduce__(self):
+    # Only the fields are pickled, not the cached hash: the hashes of bytes
+    # and str are salted per process, so the hash would be wrong in another
+    # process, e.g. the pool workers of mcts_agent.ParallelRollouts.
+    # __init__ computes it again there.
+    return (GameState, self._Values())
+
+
+class GameClient:
+  def __init__(self, height: int = DEFAULT_LENGTH, width: int = DEFAULT_WIDTH, map_height_padding=MAP_PADDING_SIZE,
+               map_side_padding=MAP_PADDING_SIZE, headless: bool = False,
+               seed: int = None):
+    """
+    :param headless: If True, the game doesn't print anything and doesn't
+           lock the current piece, so it can only be used by one thread.  See
+           simulator.py.
+    :param seed: Seed of the pieces.  Games with the same seed get the same
+           pieces.  If None, the pieces are random.
+    """
+    self._InitSettings(height, width, map_height_padding, map_side_padding,
+                       headless, seed)
+
+    self._RefillPieces()
+    self._TakePieceFromList()
+
+    # Must be put after the initializations above
+    self._InitMap()
+
+  def _InitSettings(self, height: int, width: int, map_height_padding: int,
+                    map_side_padding: int, headless: bool = False,
+                    seed: int = None):
+    """Initializes everything but the pieces and the maps."""
+    self.headless = headless
+    self.height = height
+    self.width = width
+    self.map_height_padding = map_height_padding
+    self.map_side_padding = map_side_padding
+
+    self.current_piece: shape.Shape | None = None
     self.held_piece = None
     self.score = 0
+    # The piece list is _pieces[_piece_head:_piece_end].  Taking a piece moves
+    # the head and a refill appends to _pieces, so the list isn't copied.
+    # _pieces is shared with the copies and the search clones: the entries
+    # past the end of a game are the next pieces of its bag, so a refill
+    # reuses them instead of appending.
     self.piece_list = []
+    # The piece ids stream and the position of the next piece to add to the
+    # piece list.
+    self._bag = piece_generator.GetSevenBag(seed)
+    self._piece_cursor = 0
     self.is_gameover = False
     self.can_swap = True
     self.accumulated_lines_eliminated = 0
@@ -90,47 +301,6 @@ class GameState:
     self.line_sent = 0
     self.line_received = 0
 
-  def __deepcopy__(self, memodict=None):
-    if memodict is None:
-      memodict = dict()
-    another = copy.copy(self)
-    another.color_map = self.color_map.copy()
-    if self.current_piece is not None:
-      another.current_piece = self.current_piece.copy()
-    if self.held_piece is not None:
-      another.held_piece = self.held_piece.copy()
-    another.piece_list = copy.deepcopy(self.piece_list.copy())
-    return another
-
-  def copy(self):
-    return self.__deepcopy__()
-
-  def __str__(self):
-    ret = ""
-    ret += f"""height: {self.height}
-width: {self.width}
-color_map: {self.color_map}
-current_piece: {self.current_piece}
-held_piece: {self.held_piece}
-score: {self.score}
-piece_list: {self.piece_list}
-is_gameover: {self.is_gameover}
-can_swap: {self.can_swap}
-piece_dropped: {self.piece_dropped}
-level: {self.level}
-    """
-
-
-class GameClient(GameState):
-  def __init__(self, height: int = DEFAULT_LENGTH, width: int = DEFAULT_WIDTH, map_height_padding=MAP_PADDING_SIZE,
-               map_side_padding=MAP_PADDING_SIZE):
-    super().__init__()
-
-    self.height = height
-    self.width = width
-    self.map_height_padding = map_height_padding
-    self.map_side_padding = map_side_padding
-
     self.dtype = np.uint8
     self.dtype_length = 8
     if self.width + 2 * map_side_padding > 8:
@@ -166,10 +336,25 @@ class GameClient(GameState):
     self.color_map = np.array([[]], dtype=self.dtype)
 
     # Bit map for a better performance in some calculation.
-    self.bit_map = np.array([], dtype=self.dtype)
+    # One python int per row, see bitboard.py for the layout.
+    self.bit_map = []
+    # Top of the stack of each column: the first occupied row, or the number
+    # of rows if the column is empty.  Maintained with the bit_map.
+    self._column_tops = []
+    # Occupied cells of each row of the playfield and of each column.
+    # Maintained with the bit_map, see column_heights and column_holes.
+    self._row_fills = []
+    self._column_fills = []
+    # Property name -> read-only array of column_heights, column_holes and
+    # row_fills, created on the first access.  Replaced by a new dict, never
+    # cleared, when the board changes, so the copies can share it.
+    self._board_arrays = {}
+    # (piece id, state, column) -> row masks, shared by all the games with the
+    # same width.
+    self._piece_masks = bitboard.GetPieceMasks(self.width, self.map_side_padding)
 
     # Lock for current_piece
-    self.mutex_current_piece = Lock()
+    self.mutex_current_piece = self._NewLock()
     self.last_put_piece = None
     # List of actions to process
     self.action_list = queue.Queue()
@@ -198,27 +383,30 @@ class GameClient(GameState):
        489.27651798, 489.76359062, 490.17722443, 490.52845671,
        490.82667585, 491.07986489, 491.2948099, 491.47727802])
 
-    self._RefillPieces()
-    self._TakePieceFromList()
-    self.accumulated_lines_eliminated = 0
-
     # When soft-dropping, temporarily disable auto-drop
     self.soft_drop = False
-    self.piece_dropped = 0
 
-    # Must be put after the initializations above
-    self._InitMap()
+    side_padding = (1 << self.map_side_padding) - 1
+    # A row with only the side paddings set, and a row with all the bits set.
+    self._empty_row = (side_padding << (self.map_side_padding + self.width)) | side_padding
+    self._full_row = (1 << (self.width + 2 * self.map_side_padding)) - 1
+    # Spawn column of the pieces.
+    self._start_y = int((self.width - 3) / 2)
+    assert self._start_y >= 0
 
   def _InitMap(self):
-    side_padding = (1 << self.map_side_padding) - 1
-    init_row = (side_padding << (self.map_side_padding + self.width)) | side_padding
-    bottom_padding = (1 << (self.width + 2 * self.map_side_padding)) - 1
-    self.bit_map = np.concatenate((
-      np.array((self.map_height_padding + self.height) * [init_row], dtype=self.dtype),
-      np.array(self.map_height_padding * [bottom_padding], dtype=self.dtype)), dtype=self.dtype)
+    self.bit_map = ((self.map_height_padding + self.height) * [self._empty_row] +
+                    self.map_height_padding * [self._full_row])
+
+    self._column_tops = self.width * [self.height + self.map_height_padding]
+    self._row_fills = (self.height + self.map_height_padding) * [0]
+    self._column_fills = self.width * [0]
+    self._board_arrays = {}
 
     self.color_map = np.array([[0 for i in range(self.width)] for x in range(self.height + self.map_height_padding)],
                               dtype=self.dtype)
+    # Scratch rows used by _LineClear to compact the color_map in place.
+    self._line_clear_buffer = np.empty_like(self.color_map)
 
   def Restart(self):
     self._InitMap()
@@ -226,11 +414,12 @@ class GameClient(GameState):
     self.held_piece = None
     self.current_piece = None
     # Lock of the game state
-    self.mutex_current_piece = Lock()
+    self.mutex_current_piece = self._NewLock()
     self.is_gameover = False
     self.last_put_piece = None
-    # List of actions to process
-    self.action_list = queue.Queue()
+    # The queue is cleared rather than replaced: a scheduler blocked on it
+    # keeps receiving the inputs of the new game.
+    self._ClearActions()
     self._init_spawn_interval = 500.0
     self._current_spawn_interval = 500.0
     # actions.Action
@@ -250,23 +439,40 @@ class GameClient(GameState):
     self._RefillPieces()
     self._TakePieceFromList()
 
-  def Run(self):
-    auto_drop_th = threading.Thread(target=self.AutoDrop, name="auto_drop", daemon=True)
-    process_input_th = threading.Thread(target=self._ProcessActionsThread, daemon=True)
-    if not self.disable_autodrop:
-      auto_drop_th.start()
-    process_input_th.start()
+  def _NewLock(self):
+    return _NoLock() if self.headless else Lock()
 
-    if not self.disable_autodrop:
-      auto_drop_th.join()
-    process_input_th.join()
-    print("game ends")
+  def _Log(self, *args):
+    if not self.headless:
+      print(*args)
 
-  def GetState(self) -> GameState:
-    """Gets game state.
-      Returns the objects ref instead of copy For better performance.
+  def Run(self, clock=None):
+    """Runs the game loop in the calling thread.
+    :param clock: scheduler.MonotonicClock (default) or scheduler.VirtualClock.
     """
-    return copy.deepcopy(super())
+    scheduler.TickScheduler(self, clock).Run()
+    self._Log("game ends")
+
+  def GetState(self) -> GameState:
+    """Gets an immutable snapshot of the game state."""
+    current_piece = None
+    if self.current_piece is not None:
+      p = self.current_piece
+      current_piece = (p.id, p.x, p.y, p.state)
+    return GameState(
+      height=self.height, width=self.width,
+      map_height_padding=self.map_height_padding,
+      map_side_padding=self.map_side_padding,
+      rows=tuple(self.bit_map),
+      colors=self.color_map.astype(np.uint8).tobytes(),
+      current_piece=current_piece,
+      held_piece=0 if self.held_piece is None else self.held_piece.id,
+      piece_list=tuple(p.id for p in self.piece_list),
+      score=self.score, is_gameover=self.is_gameover, can_swap=self.can_swap,
+      accumulated_lines_eliminated=self.accumulated_lines_eliminated,
+      piece_dropped=self.piece_dropped, level=self.level,
+      line_sent=self.line_sent, line_received=self.line_received,
+      seed=self._bag.seed, piece_cursor=self._piece_cursor)
 
   def GetCell(self, i: int, j: int) -> int:
     """Gets cell at [i,j].
@@ -293,25 +499,123 @@ class GameClient(GameState):
 
   def SetMap(self, pos: Tuple[int, int], v: int, map: np.array = None):
     """Sets the cell at [i,j] to value v."""
-    (i, j) = pos
-    bit_map = self.bit_map.copy()
-    if map is None or map is self.color_map:
+    # The piece cells are numpy ints, which must not leak into the bit_map.
+    (i, j) = (int(pos[0]), int(pos[1]))
+    is_game_map = map is None or map is self.color_map
+    if is_game_map:
       map = self.color_map
       bit_map = self.bit_map
+    else:
+      bit_map = self.bit_map.copy()
     map[i, j] = v
 
     # Set a bit to value: Clear to bit to 0 and then set to value
     bit_v = 0 if v == 0 else 1
     bit_j_pos = self.width + self.map_side_padding - 1 - j
+    old_bit_v = (bit_map[i] >> bit_j_pos) & 1
     bit_map[i] = (bit_map[i] & ~(1 << bit_j_pos)) | (bit_v << bit_j_pos)
 
+    if is_game_map:
+      self._board_arrays = {}
+      if bit_v != old_bit_v:
+        delta = bit_v - old_bit_v
+        self._row_fills[i] += delta
+        self._column_fills[j] += delta
+      tops = self._column_tops
+      if v != 0:
+        tops[j] = min(tops[j], i)
+      elif i == tops[j]:
+        # Looks for the next occupied cell below.
+        n_rows = self.height + self.map_height_padding
+        bit = 1 << bit_j_pos
+        top = i + 1
+        while top < n_rows and not bit_map[top] & bit:
+          top += 1
+        tops[j] = top
+
+  def _UpdateColumnTops(self, start_row: int = 0):
+    """Recomputes the column tops from the bit_map.
+    :param start_row: The rows above it must be empty.
+    """
+    n_rows = self.height + self.map_height_padding
+    tops = self.width * [n_rows]
+    remaining = self._full_row ^ self._empty_row
+    shift = self.width + self.map_side_padding - 1
+    bit_map = self.bit_map
+    for i in range(start_row, n_rows):
+      found = bit_map[i] & remaining
+      if found:
+        remaining ^= found
+        while found:
+          bit = found & -found
+          tops[shift - bit.bit_length() + 1] = i
+          found ^= bit
+        if not remaining:
+          break
+    self._column_tops = tops
+    self._board_arrays = {}
+
+  def _UpdateFillCounts(self):
+    """Recomputes the row and column fill counts from the bit_map."""
+    n_rows = self.height + self.map_height_padding
+    playfield = self._full_row ^ self._empty_row
+    rows = [row & playfield for row in self.bit_map[:n_rows]]
+    self._row_fills = [row.bit_count() for row in rows]
+    shift = self.width + self.map_side_padding - 1
+    self._column_fills = [sum((row >> (shift - j)) & 1 for row in rows)
+                          for j in range(self.width)]
+    self._board_arrays = {}
+
+  @property
+  def piece_list(self) -> List[shape.Shape]:
+    """The next pieces, the first one coming first.  Returns a new list:
+    assign piece_list to change the pieces."""
+    return self._pieces[self._piece_head:self._piece_end]
+
+  @piece_list.setter
+  def piece_list(self, pieces: List[shape.Shape]):
+    self._pieces = list(pieces)
+    self._piece_head = 0
+    self._piece_end = len(self._pieces)
+
+  def _BoardArray(self, name: str, values: Callable[[], List[int]]) -> np.ndarray:
+    ret = self._board_arrays.get(name)
+    if ret is None:
+      ret = self._board_arrays[name] = _ReadOnly(values())
+    return ret
+
+  @property
+  def column_heights(self) -> np.ndarray:
+    """Read-only (width,) heights of the columns: the number of rows from the
+    first occupied cell to the bottom of the playfield, 0 if empty.  The same
+    array is returned until the board changes."""
+    n_rows = self.height + self.map_height_padding
+    return self._BoardArray(
+      "column_heights", lambda: [n_rows - top for top in self._column_tops])
+
+  @property
+  def column_holes(self) -> np.ndarray:
+    """Read-only (width,) number of empty cells under the top of each
+    column.  The same array is returned until the board changes."""
+    n_rows = self.height + self.map_height_padding
+    return self._BoardArray(
+      "column_holes", lambda: [n_rows - top - fills for (top, fills)
+                               in zip(self._column_tops, self._column_fills)])
+
+  @property
+  def row_fills(self) -> np.ndarray:
+    """Read-only number of occupied cells of each row of the playfield.  The
+    same array is returned until the board changes."""
+    return self._BoardArray("row_fills", lambda: self._row_fills)
+
   def SetWholeMap(self, map: np.array):
     if map.shape != self.color_map.shape:
       raise InternalError(
         f"Map shape {map.shape}"
         f" must match the color_map shape: {self.color_map.shape}")
 
-    self.color_map = map
+    # Line clears modify the color_map, which must not be the caller's array.
+    self.color_map = map.copy()
 
     # Convert the map to Bollean map
     bit_color_map = map != 0
@@ -328,9 +632,11 @@ class GameClient(GameState):
                            "constant", constant_values=(0,))
 
     int_color_map = np.packbits(bit_color_map, bitorder="little").view(self.dtype)
-    self.bit_map[0:self.map_height_padding + self.height] = int_color_map
-    print(int_color_map)
-    print(self.bit_map)
+    self.bit_map[0:self.map_height_padding + self.height] = int_color_map.tolist()
+    self._UpdateColumnTops()
+    self._UpdateFillCounts()
+    self._Log(int_color_map)
+    self._Log(self.bit_map)
 
   def copy(self):
     another = copy.copy(self)
@@ -338,9 +644,13 @@ class GameClient(GameState):
     if self.last_put_piece is not None:
       another.last_put_piece = self.last_put_piece.copy()
     another.color_map = np.copy(self.color_map)
-    another.bit_map = np.copy(self.bit_map)
+    another.bit_map = self.bit_map.copy()
+    another._column_tops = self._column_tops.copy()
+    another._row_fills = self._row_fills.copy()
+    another._column_fills = self._column_fills.copy()
+    # The scratch buffer is allocated again on the first line clear.
+    another._line_clear_buffer = None
     another.action_list = copy.copy(self.action_list)
-    another.piece_list = self.piece_list.copy()
     another.current_piece = self.current_piece.copy()
     if self.held_piece is None:
       another.held_piece = None
@@ -348,29 +658,58 @@ class GameClient(GameState):
       another.held_piece = self.held_piece.copy()
     return another
 
-  def AutoDrop(self):
+  def SearchClone(self) -> "GameClient":
+    """Returns a lightweight copy of the game for searching.
+
+    Only the states that placing a piece mutates are copied: the color_map,
+    the bit_map and the current piece.  Everything else (piece storage, held
+    piece, action queue, lock, constant tables) is shared with this game.
+    This is safe because the game replaces the held piece instead of
+    modifying it in place, and only appends to the piece storage the pieces
+    the other games would append too.
+    """
+    another = self.__class__.__new__(self.__class__)
+    another.__dict__.update(self.__dict__)
+    another.color_map = self.color_map.copy()
+    another.bit_map = self.bit_map.copy()
+    another._column_tops = self._column_tops.copy()
+    another._row_fills = self._row_fills.copy()
+    another._column_fills = self._column_fills.copy()
+    another.current_piece = self.current_piece.copy()
+    another._line_clear_buffer = None
+    return another
+
+  def _ClearActions(self):
+    """Drops the queued inputs."""
     while True:
-      if self.soft_drop:
-        # If it is soft dropping, we don't perform auto drop.
-        self.soft_drop = False
+      try:
+        self.action_list.get_nowait()
+      except queue.Empty:
+        return
+      self.action_list.task_done()
+
+  def GravityTick(self):
+    """Auto drops the current piece by one row, or locks it at the bottom once
+    the lock time is used up."""
+    if self.soft_drop:
+      # If it is soft dropping, we don't perform auto drop.
+      self.soft_drop = False
+    else:
+      if self.CheckValidity(self.current_piece, offset=(1, 0)):
+        self.Move(actions.Action(down=True, source_user_or_ai=False))
       else:
-        if self.CheckValidity(self.current_piece, offset=(1, 0)):
-          self.Move(actions.Action(down=True, source_user_or_ai=False))
+        if (not self._enable_lock_time or
+            self.accumulate_lock_time >= self.current_maximum_lock_time):
+          self.PutPiece()
         else:
-          if (not self._enable_lock_time or
-              self.accumulate_lock_time >= self.current_maximum_lock_time):
-            self.PutPiece()
-          else:
-            self.accumulate_lock_time += self._current_spawn_interval / 1000
-
-      time.sleep(self._current_spawn_interval / 1000)
+          self.accumulate_lock_time += self._current_spawn_interval / 1000
 
   def InputActions(self, acts: List[actions.Action]):
     if self.is_gameover:
       return
 
     if len(acts) > 30:
-      print("len:", len(acts))
+      self._Log("len:", len(acts))
       acts = acts[-30:]
 
     for act in acts:
@@ -393,14 +732,6 @@ class GameClient(GameState):
     self.Rotate(action.rotation)
     self.Move(action, post_processing=post_processing)
 
-  def _ProcessActionsThread(self):
-    while True:
-      while not self.action_list.empty():
-        act = self.action_list.get()
-        self.ProcessAction(act)
-        self.action_list.task_done()
-      time.sleep(0.001)
-
   def SetLevel(self, level: int = 0):
     """Let the front end set!"""
     self.level = level
@@ -456,8 +787,9 @@ class GameClient(GameState):
     if action.direction == actions.HARD_DROP or action.direction == actions.SOFT_DROP:
       try:
         self.mutex_current_piece.acquire()
-        while self.CheckValidity(self.current_piece, (1, 0)):
-          self.current_piece.x += 1
+        distance = self.DropDistance(self.current_piece)
+        if distance > 0:
+          self.current_piece.x += distance
           moved = True
       finally:
         self.mutex_current_piece.release()
@@ -495,10 +827,13 @@ class GameClient(GameState):
       self.mutex_current_piece.acquire()
       t = self.held_piece
       self.held_piece = self.current_piece
-      self.current_piece = t
 
-      if not self.current_piece:
+      # The held piece might be shared with the game this one was cloned
+      # from, so it is copied before being modified.
+      if t is None:
         self._TakePieceFromList()
+      else:
+        self.current_piece = t.copy()
 
       self.current_piece.Init()
       self.held_piece.Init()
@@ -517,7 +852,7 @@ class GameClient(GameState):
     is_last_put_t = isinstance(self.last_put_piece, shape.T)
     if n_eliminate == 1:
       if (is_last_put_t and self.last_action and self.last_action.rotation != 0):
-        print("TSS")
+        self._Log("TSS")
         ret += TSS
         self.line_tobesent += ATTACK_TSS
       else:
@@ -526,7 +861,7 @@ class GameClient(GameState):
     if n_eliminate == 2:
       # TSD
       if (is_last_put_t and self.last_action and self.last_action.rotation != 0):
-        print("TSD")
+        self._Log("TSD")
         ret += TSD
         self.line_tobesent += ATTACK_TSD
       # Normal Double
@@ -536,7 +871,7 @@ class GameClient(GameState):
     if n_eliminate == 3:
       # TST
       if (is_last_put_t and self.last_action and self.last_action.rotation != 0):
-        print("TST")
+        self._Log("TST")
         ret += TST
         self.line_tobesent += ATTACK_TST
       else:
@@ -548,40 +883,69 @@ class GameClient(GameState):
       self.line_tobesent += ATTACK_QUAD
 
     # Checks for PC
-    if np.all(self.color_map == 0):
-      print("PC")
+    if not any(self._row_fills):
+      self._Log("PC")
       ret += PC
       self.line_tobesent += ATTACK_PC
 
     return ret * (self.level + 3)
 
   def _LineClear(self):
-    elimated_lines = []
-    elimated_cnt = 0
-    # Checks the 4 lines... This is not adapt to shape with higher than 4 lines
-    # but that's not a part of this game.  I don't have plan to support custom
-    # shapes.
-    for row in range(4):
-      if not (self.last_put_piece.x + row >= 0 and
-              self.last_put_piece.x + row < self.height + self.map_height_padding):
-        continue
-      if np.all(self.color_map[self.last_put_piece.x + row, :] != 0):
-        elimated_lines.append(row + self.last_put_piece.x)
-        elimated_cnt += 1
-
-    self.color_map = np.vstack((np.zeros((elimated_cnt, self.width),
-                                         dtype=self.dtype),
-                                np.delete(self.color_map, elimated_lines, axis=0)))
-
-    # Updates the bit_map
-    side_padding = (1 << self.map_side_padding) - 1
-    init_row = (side_padding << (self.map_side_padding + self.width)) | side_padding
-    self.bit_map = np.concatenate((elimated_cnt * [init_row],
-                                   np.delete(self.bit_map, elimated_lines))).astype(self.dtype)
+    # Only the 4 rows covered by the last put piece can be completed.  This is
+    # not adapt to shape with higher than 4 lines but that's not a part of
+    # this game.  I don't have plan to support custom shapes.
+    bit_map = self.bit_map
+    full_row = self._full_row
+    start = max(0, self.last_put_piece.x)
+    end = min(self.last_put_piece.x + 4, self.height + self.map_height_padding)
+    elimated_lines = [row for row in range(start, end) if bit_map[row] == full_row]
+    elimated_cnt = len(elimated_lines)
+
+    if elimated_cnt:
+      self._CompactRows(elimated_lines)
 
     self.accumulated_lines_eliminated += elimated_cnt
     self.score += self._AnalyzeElimination(n_eliminate=elimated_cnt)
 
+  def _CompactRows(self, rows: List[int]):
+    """Removes the rows from the color_map and bit_map.
+    The rows above the removed ones are moved down and empty rows are
+    inserted at the top.
+    :param rows: Row indices sorted in ascending order.
+    """
+    color_map = self.color_map
+    buffer = self._line_clear_buffer
+    if (buffer is None or buffer.shape != color_map.shape or
+        buffer.dtype != color_map.dtype):
+      buffer = np.empty_like(color_map)
+
+    # Builds the compacted map in the scratch buffer and swaps the two, so a
+    # reader (e.g. the UI thread) never sees a half-compacted map and no array
+    # is allocated.
+    n_rows = len(rows)
+    buffer[:n_rows] = 0
+    (dst, src) = (n_rows, 0)
+    for row in rows:
+      buffer[dst:dst + row - src] = color_map[src:row]
+      dst += row - src
+      src = row + 1
+    buffer[dst:] = color_map[src:]
+    (self.color_map, self._line_clear_buffer) = (buffer, color_map)
+
+    bit_map = self.bit_map
+    for row in reversed(rows):
+      del bit_map[row]
+    bit_map[0:0] = len(rows) * [self._empty_row]
+    self._UpdateColumnTops(min(self._column_tops))
+
+    # The removed rows were full.
+    row_fills = self._row_fills
+    for row in reversed(rows):
+      del row_fills[row]
+    row_fills[0:0] = len(rows) * [0]
+    self._column_fills = [n - len(rows) for n in self._column_fills]
+    self._board_arrays = {}
+
   def _SendAttack(self):
     """Send attack to target."""
     # This feature has not been implemented yet.
@@ -601,6 +965,22 @@ class GameClient(GameState):
     else:
       return False
 
+  def PutPieces(self, pieces) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Puts each candidate piece on its own copy of the board and clears the
+    lines, in one vectorized pass.  The game itself is not modified.
+
+    :param pieces: A list of shape.Shape, or an array of shape (N, 4) whose
+           rows are (id, x, y, state).
+    :returns: (boards, lines_cleared, valid), see bitboard.PutPieces.
+      boards are the bit_map rows after the line clears, use
+      bitboard.RowsToCells to get the occupied cells.
+    """
+    if len(pieces) and isinstance(pieces[0], shape.Shape):
+      pieces = [(p.id, p.x, p.y, p.state) for p in pieces]
+    return bitboard.PutPieces(self.bit_map, pieces,
+                              self.height + self.map_height_padding,
+                              self.width, self.map_side_padding)
+
   def _PrePutPiece(self, piece: shape.Shape = None, map: np.array = None):
     """ Puts a piece to color_map if it is a valid placement.
       Post put processing such as self._LineClear will not be executed
@@ -669,106 +1049,68 @@ class GameClient(GameState):
     if not piece:
       piece = self.current_piece
 
-    def _IsJLSTZ(piece: shape.Shape):
-      jlstz = [shape.J, shape.L, shape.S, shape.T, shape.Z]
-      for s in jlstz:
-        if isinstance(piece, s):
-          return True
-      return False
-
-    # The 180 rotation wall kick table is copied from
-    # https://tetris.fandom.com/wiki/SRS#180.C2.B0_rotation
-    # which is origined from
-    # https://github.com/JoshuaWebb/nullpomino/blob/master/src/mu/nu/nullpo/game/subsystem/wallkick/StandardWallkick.java
-    offset_map_jlstz = [
-      # state 0
-      ([(0, 0), (0, -1), (-1, -1), (2, 0), (2, -1)],  # 0>>1
-       # 0>>2, 180 rotation
-       # [(0, 0)],
-       [(0,0), (1, 0), (2, 0), (1, 1), (2, 1), (-1, 0), (-2, 0), (-1, 1), (-2, 1), (0, -1), (3, 0), (-3, 0)],
-       [(0, 0), (0, 1), (-1, 1), (2, 0), (2, 1)]),  # 0>>3
-
-      # state 1
-      ([(0, 0), (0, 1), (1, 1), (-2, 0), (-2, 1)],  # 1>>2
-       # l>>3, 180 rotation
-       # [(0,0), (0, 1), (0, 2), (-1, 1), (-1, 2), (0, -1), (0, -2), (-1, -1), (-1, -2), (1, 0), (0, 3), (0, -3)],
-       [(0, 0)],
-       [(0, 0), (0, 1), (1, 1), (-2, 0), (-2, 1)]),  # 1>>0
-
-      # state 2
-      ([(0, 0), (0, 1), (-1, 1), (2, 0), (2, 1)],  # 2>>3
-       # [(0,0), (-1, 0), (-2, 0), (-1, -1), (-2, -1), (1, 0), (2, 0), (1, -1), (2, -1), (0, 1), (-3, 0), (3, 0)],  # 2>>0,
-       [(0, 0)],
-       [(0, 0), (0, -1), (-1, -1), (2, 0), (2, -1)]),  # 2>>1
-
-      # state 3
-      ([(0, 0), (0, -1), (1, -1), (2, 0), (-2, -1)],  # 3>>0
-       # 3>>1, 180 rotation
-       # [(0,0), (0, 1), (0, 2), (1, 1), (1, 2), (0, -1), (0, -2), (1, -1), (1, -2), (-1, 0), (0, 3), (0, -3)],
-       [(0, 0)],
-       [(0, 0), (0, -1), (1, -1), (2, 0), (-2, -1)]),  # 3>>2
-    ]
-
-    offset_map_i = [
-      # state 0
-      [[(0, 0), (0, -2), (0, 1), (1, -2), (-2, 1), ],  # 0>>1
-       # [(0,0), (-1, 0), (-2, 0), (1, 0), (2, 0), (0, 1)],  # 0>>2, 180 rotation
-       [(0, 0)],
-       [(0, 0), (0, -1), (0, 2), (-2, -1), (1, 2)]],  # 0>>3
-
-      # state 1
-      [[(0, 0), (0, -1), (0, 2), (-2, -1), (1, 2)],  # 1>>2
-       # [(0,0), (0, 1), (0, 2), (0, -1), (0, -2), (-1, 0)],  # 1>>3, 180 rotation,
-       [(0, 0)],
-       [(0, 0), (0, 2), (0, -1), (-1, 2), (2, -1)]],  # 1>>0
-
-      # state 2
-      [[(0, 0), (0, 2), (0, -1), (-1, 2), (2, -1)],  # 2>>3
-       # [(0, 0), (1, 0), (2, 0), (-1, 0), (-2, 0), (0, -1)],  # 2>>0, 180 rotation
-       [(0, 0)],
-       [(0, 0), (0, 1), (0, -2), (2, 1), (-1, -2)]],  # 2>>1
-
-      # state 3
-      [[(0, 0), (0, 1), (0, -2), (2, 1), (-1, -2)],  # 3>>0
-       # [(0, 0), (0, 1), (0, 2), (0, -1), (0, -2), (1, 0)],  # 3>>1, 180 rotation
-       [(0, 0)],
-       [(0, 0), (0, -2), (0, 1), (1, -2), (2, 1)]],  # 3>>2
-    ]
-
-    state = piece.state
     num_90rotations %= 4
+    state = piece.state
     offset_piece = piece.copy()
-    ori_x = offset_piece.x
-    ori_y = offset_piece.y
-
-    for _ in range(num_90rotations):
-      offset_piece.Rotate90()
-
-    if num_90rotations == 0:
-      if self.CheckValidity(offset_piece):
-        return offset_piece
-    num_90rotations -= 1
-
-    if _IsJLSTZ(piece):
-      for (offset_x, offset_y) in offset_map_jlstz[state][num_90rotations]:
-        offset_piece.x = ori_x + offset_x
-        offset_piece.y = ori_y + offset_y
-        if (offset_piece.y >= self.width or
-            offset_piece.x >= self.height + self.map_height_padding):
-          continue
-        if self.CheckValidity(offset_piece):
-          return offset_piece
-    else:
-      for (offset_x, offset_y) in offset_map_i[state][num_90rotations]:
-        offset_piece.x = ori_x + offset_x
-        offset_piece.y = ori_y + offset_y
-        if (offset_piece.y >= self.width or
-            offset_piece.x >= self.height + self.map_height_padding):
-          continue
-        if self.CheckValidity(offset_piece):
-          return offset_piece
+    offset_piece.state = (state + num_90rotations) % 4
+    if self.CheckValidity(offset_piece):
+      return offset_piece
+
+    ori_x = piece.x
+    ori_y = piece.y
+    kick = self._FindKick(piece.id, state, offset_piece.state,
+                          SRS_KICKS[piece.id][state][num_90rotations],
+                          ori_x, ori_y)
+    if kick is None:
+      return None
+    offset_piece.x = ori_x + kick[0]
+    offset_piece.y = ori_y + kick[1]
+    return offset_piece
+
+  def _FindKick(self, piece_id: int, state: int, new_state: int,
+                kicks: Tuple, x: int, y: int):
+    """Returns the first (dx, dy) of kicks that fits the piece in new_state at
+    (x + dx, y + dy), or None.
+
+    The result only depends on the board cells around (x, y), so it is cached
+    on those cells when the whole neighbourhood is inside the board.
+    """
+    bit_map = self.bit_map
+    shift = (self.width + self.map_side_padding - 1 -
+             (y + _KICK_WINDOW_LAST_COLUMN))
+    top = x + _KICK_WINDOW_FIRST_ROW
+    bottom = top + _KICK_WINDOW_ROWS
+    key = None
+    if (shift >= 0 and y + _KICK_WINDOW_FIRST_COLUMN >= -self.map_side_padding
+        and top >= 0 and bottom <= len(bit_map)):
+      window = 0
+      for row in bit_map[top:bottom]:
+        window = (window << _KICK_WINDOW_COLUMNS) | ((row >> shift) & _KICK_WINDOW_MASK)
+      key = (piece_id, state, new_state, window)
+      kick = _kick_cache.get(key, _KICK_CACHE_MISS)
+      if kick is not _KICK_CACHE_MISS:
+        return kick
+
+    masks = self._piece_masks[piece_id][new_state]
+    n_rows = len(bit_map)
+    kick = None
+    for (dx, dy) in kicks:
+      col = y + dy + self.map_side_padding
+      if col < 0 or col >= len(masks):
+        continue
+      for (r, mask) in masks[col]:
+        row = x + dx + r
+        if row < 0 or row >= n_rows or bit_map[row] & mask:
+          break
+      else:
+        kick = (dx, dy)
+        break
 
-    return None
+    if key is not None:
+      if len(_kick_cache) >= KICK_CACHE_SIZE:
+        _kick_cache.clear()
+      _kick_cache[key] = kick
+    return kick
 
   def Rotate(self, n: int) -> bool:
     """Rotates the current piece.
@@ -795,61 +1137,116 @@ class GameClient(GameState):
     :param offset: The inital offset to the piece
     :return: True if the current state can fit into the color_map.  False otherwise.
     """
-    (ox, oy, os) = (piece.x, piece.y, piece.state)
-    piece.x += offset[0]
-    piece.y += offset[1]
-
-    a = self.bit_map[piece.x: piece.x + 4]
-    b = self.width - piece.y
-    c = piece.GetBitMap().astype(self.dtype)
-    d = c << b
-    e = a & d
-    check_rst = e == 0
-    (piece.x, piece.y, piece.state) = (ox, oy, os)
-    return np.all(check_rst)
-
-  def _GetNextBag(self):
-    start_y = int((self.width - 3) / 2)
-    assert start_y >= 0
-
-    bag = [shape.I(start_y=start_y),
-           shape.J(start_y=start_y),
-           shape.L(start_y=start_y),
-           shape.O(start_y=start_y),
-           shape.S(start_y=start_y),
-           shape.T(start_y=start_y),
-           shape.Z(start_y=start_y)]
-    np.random.shuffle(bag)
-    return bag
+    col = piece.y + offset[1] + self.map_side_padding
+    masks = self._piece_masks[piece.id][piece.state]
+    if col < 0 or col >= len(masks):
+      return False
+
+    x = piece.x + offset[0]
+    bit_map = self.bit_map
+    n_rows = len(bit_map)
+    for (r, mask) in masks[col]:
+      row = x + r
+      if row < 0 or row >= n_rows or bit_map[row] & mask:
+        return False
+    return True
+
+  def GetFootprint(self, piece: shape.Shape) -> Tuple[Tuple[int, int], ...]:
+    """Returns the cells covered by a valid piece as (row, bit_map row mask)
+    pairs.  Placements with the same footprint put the same cells, e.g. the
+    two horizontal states of I."""
+    masks = self._piece_masks[piece.id][piece.state][piece.y + self.map_side_padding]
+    x = piece.x
+    return tuple((x + r, mask) for (r, mask) in masks)
+
+  def DropDistance(self, piece: shape.Shape) -> int:
+    """Returns how many rows the piece can move down.  The piece must be at a
+    valid position.
+
+    When the piece is above the stack in all its columns, this is the gap
+    between its bottom and the column tops.  Otherwise (e.g. the piece is under
+    an overhang), the rows are checked one by one.
+    """
+    tops = self._column_tops
+    (x, y) = (piece.x, piece.y)
+    distance = self.height + self.map_height_padding
+    for (col, bottom) in bitboard.BOTTOM_PROFILES[piece.id][piece.state]:
+      col += y
+      if col < 0 or col >= self.width:
+        break
+      gap = tops[col] - x - bottom - 1
+      if gap < 0:
+        break
+      distance = min(distance, gap)
+    else:
+      return distance
+
+    distance = 0
+    while self.CheckValidity(piece, (distance + 1, 0)):
+      distance += 1
+    return distance
+
+  def _NewPiece(self, piece_id: int) -> shape.Shape:
+    """Creates a piece at the spawn position."""
+    return shape.GetShapeFromId(piece_id, start_y=self._start_y)
 
   def _RefillPieces(self):
     """
-    When there are less than REFILL_THRESHOLD pieces in the list,
-    refill it with a new bag.
+    When there are at most REFILL_THRESHOLD pieces in the list,
+    refill it with the next bag of the stream.
     """
-    if len(self.piece_list) <= REFILL_THRESHOLD:
-      self.piece_list.extend(self._GetNextBag())
+    if self._piece_end - self._piece_head <= REFILL_THRESHOLD:
+      n = piece_generator.NUM_PIECES
+      pieces = self._pieces
+      cursor = self._piece_cursor
+      for i in range(self._piece_end, self._piece_end + n):
+        # Another game sharing the storage might already have added it.
+        if i == len(pieces):
+          pieces.append(self._NewPiece(self._bag[cursor]))
+        cursor += 1
+      self._piece_end += n
+      self._piece_cursor = cursor
 
   def _TakePieceFromList(self):
     self._RefillPieces()
-    self.current_piece = self.piece_list[0].copy()
-    self.piece_list = self.piece_list[1:]
-
-
-def CreateGameFromState(state: GameState) -> GameClient:
-  game = GameClient(height=state.height, width=state.width)
-  game.color_map = np.copy(state.color_map)
-  game.current_piece = state.current_piece.copy()
-  if state.held_piece is not None:
-    game.held_piece = state.held_piece.copy()
-  else:
-    game.held_piece = None
+    self.current_piece = self._pieces[self._piece_head].copy()
+    self._piece_head += 1
+    if self._piece_head >= PIECE_LIST_TRIM:
+      # A new list since the storage might be shared.
+      self._pieces = self._pieces[self._piece_head:]
+      self._piece_end -= self._piece_head
+      self._piece_head = 0
+
+
+def CreateGameFromState(state: GameState, headless: bool = False) -> GameClient:
+  """Creates a game from a snapshot, skipping the bag and map setup."""
+  game = GameClient.__new__(GameClient)
+  game._InitSettings(state.height, state.width, state.map_height_padding,
+                     state.map_side_padding, headless, state.seed)
+  game._piece_cursor = state.piece_cursor
+
+  game.bit_map = list(state.rows)
+  game._UpdateColumnTops()
+  game._UpdateFillCounts()
+  game.color_map = np.frombuffer(state.colors, dtype=np.uint8).reshape(
+    (state.height + state.map_height_padding, state.width)).astype(game.dtype)
+  game._line_clear_buffer = np.empty_like(game.color_map)
+
+  if state.current_piece is not None:
+    (piece_id, x, y, piece_state) = state.current_piece
+    game.current_piece = game._NewPiece(piece_id)
+    (game.current_piece.x, game.current_piece.y) = (x, y)
+    game.current_piece.state = piece_state
+  if state.held_piece:
+    game.held_piece = game._NewPiece(state.held_piece)
+  game.piece_list = [game._NewPiece(piece_id) for piece_id in state.piece_list]
+
   game.score = state.score
-  game.piece_list = state.piece_list.copy()
   game.can_swap = state.can_swap
   game.is_gameover = state.is_gameover
   game.accumulated_lines_eliminated = state.accumulated_lines_eliminated
   game.piece_dropped = state.piece_dropped
+  game.SetLevel(state.level)
   game.line_sent = state.line_sent
   game.line_received = state.line_received
   return game
@@ -1,3 +1,4 @@
+import pickle
 import unittest
 
 import numpy as np
@@ -125,6 +126,39 @@ class TestGameClient(unittest.TestCase):
     self.assertTrue(self.game.SpawnPiece(i))
     self.assertFalse(self.game.Rotate(1))
 
+  def test_FindFittedPiece_MatchesKickTable(self):
+    self.game = game_client.GameClient(height=8, width=6)
+    rng = np.random.default_rng(3)
+    for _ in range(3):
+      self.game.SetWholeMap(
+        (rng.random(self.game.color_map.shape) < 0.3).astype(int))
+      # The second pass is served from the kick cache.
+      for _ in range(2):
+        for piece_id in range(1, 8):
+          for state in range(4):
+            for n in range(4):
+              for x in range(-1, 13):
+                for y in range(-3, 7):
+                  piece = shape.GetShapeFromId(piece_id)
+                  (piece.x, piece.y, piece.state) = (x, y, state)
+
+                  rotated = piece.copy()
+                  rotated.Rotate(n)
+                  expected = None
+                  kicks = ((0, 0),) + game_client.SRS_KICKS[piece_id][state][n]
+                  for (dx, dy) in kicks:
+                    (rotated.x, rotated.y) = (x + dx, y + dy)
+                    if self.game.CheckValidity(rotated):
+                      expected = rotated
+                      break
+
+                  got = self.game._FindFittedPiece(piece, n)
+                  if expected is None:
+                    self.assertIsNone(got)
+                  else:
+                    self.assertEqual((got.x, got.y, got.state),
+                                     (expected.x, expected.y, expected.state))
+
   def test_I_Spin1(self):
     i = shape.I()
     i.Rotate90()
@@ -402,22 +436,88 @@ class TestGameClient(unittest.TestCase):
     o = shape.O()
     o.x = 4
 
-    self.game.color_map = np.array([
+    self.game.SetWholeMap(np.array([
       # 0  1  2  3  4  5  6  7  8  9
-      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # 0
-      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # 1
+      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # -4
+      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # -3
+      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # -2
+      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # -1
+      [2, 2, 2, 2, 0, 0, 2, 2, 2, 2],  # 0
+      [2, 2, 2, 2, 0, 0, 2, 2, 2, 2],  # 1
       [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # 2
       [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # 3
-      [2, 2, 2, 2, 0, 0, 2, 2, 2, 2],  # 4
-      [2, 2, 2, 2, 0, 0, 2, 2, 2, 2],  # 5
+      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # 4
+      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # 5
       [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],  # 6
       [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]]  # 7
-    )
+    ))
 
     self.game.SpawnPiece(o)
     self.game.PutPiece()
     self.assertTrue(np.all(self.game.color_map == 0))
-    self.assertEqual(self.game.color_map.shape, (self.game.height, self.game.width))
+    self.assertEqual(self.game.color_map.shape,
+                     (self.game.height + self.game.map_height_padding, self.game.width))
+    self.assertEqual(self.game.bit_map[:12], 12 * [0b1111_0000000000_1111])
+
+  def test_LineClear_NonAdjacentRows(self):
+    game = game_client.GameClient(height=4, width=4)
+    game.SetWholeMap(np.array([
+      # 0  1  2  3
+      [0, 0, 0, 0],  # -4
+      [0, 0, 0, 0],  # -3
+      [0, 0, 0, 0],  # -2
+      [0, 3, 0, 0],  # -1
+      [1, 1, 1, 0],  # 0
+      [2, 0, 2, 0],  # 1
+      [1, 1, 1, 0],  # 2
+      [0, 5, 0, 0]]  # 3
+    ))
+
+    i = shape.I()
+    i.Rotate90()
+    (i.x, i.y) = (4, 1)
+    game.SpawnPiece(i)
+    game.PutPiece()
+
+    self.assertEqual(game.accumulated_lines_eliminated, 2)
+    self.assertTrue(np.array_equal(game.color_map, np.array([
+      [0, 0, 0, 0],
+      [0, 0, 0, 0],
+      [0, 0, 0, 0],
+      [0, 0, 0, 0],
+      [0, 0, 0, 0],
+      [0, 3, 0, 0],
+      [2, 0, 2, 1],
+      [0, 5, 0, 1]])))
+    self.assertEqual(game.bit_map[:8], [
+      0b1111_0000_1111,
+      0b1111_0000_1111,
+      0b1111_0000_1111,
+      0b1111_0000_1111,
+      0b1111_0000_1111,
+      0b1111_0100_1111,
+      0b1111_1011_1111,
+      0b1111_0101_1111])
+
+  def test_LineClear_KeepsCallerMap(self):
+    game = game_client.GameClient(height=4, width=4)
+    color_map = np.zeros(game.color_map.shape, dtype=int)
+    color_map[-1, :3] = 1
+    original = color_map.copy()
+    game.SetWholeMap(color_map)
+    before_clear = game.color_map
+
+    i = shape.I()
+    i.Rotate90()
+    (i.x, i.y) = (4, 1)
+    game.SpawnPiece(i)
+    game.PutPiece()
+    self.assertEqual(game.accumulated_lines_eliminated, 1)
+    self.assertTrue(np.array_equal(color_map, original))
+    # The compacted map is swapped in, the previous one is left whole.
+    self.assertIsNot(game.color_map, before_clear)
+    self.assertEqual(np.count_nonzero(before_clear), 7)
+    self.assertEqual(np.count_nonzero(game.color_map), 3)
 
 
   def test_LineClear2(self):
@@ -473,6 +573,250 @@ class TestGameClient(unittest.TestCase):
       for g in v:
         self.assertEqual(g.current_piece, self.game.current_piece)
 
+  def test_SearchClone(self):
+    game = game_client.GameClient(height=6, width=5)
+    game.SpawnPiece(shape.O(start_x=2, start_y=0))
+    game.Swap()
+    game.PutPiece()
+
+    clone = game.SearchClone()
+    self.assertIs(clone._pieces, game._pieces)
+    self.assertIs(clone.held_piece, game.held_piece)
+    self.assertIs(clone.mutex_current_piece, game.mutex_current_piece)
+
+    held_piece = game.held_piece.copy()
+    color_map = game.color_map.copy()
+    bit_map = list(game.bit_map)
+    current_piece = game.current_piece.copy()
+    piece_list = list(game.piece_list)
+
+    clone.Move(actions.Action(dir=actions.LEFT))
+    clone.ProcessActions([actions.Action(dir=actions.HARD_DROP)])
+    clone.Swap()
+    for _ in range(10):
+      clone.ProcessActions([actions.Action(dir=actions.HARD_DROP)])
+
+    self.assertTrue(np.array_equal(color_map, game.color_map))
+    self.assertEqual(bit_map, game.bit_map)
+    self.assertEqual(current_piece, game.current_piece)
+    self.assertEqual(held_piece, game.held_piece)
+    self.assertEqual(held_piece.state, game.held_piece.state)
+    self.assertEqual(piece_list, game.piece_list)
+
+  def test_GetState(self):
+    game = game_client.GameClient(height=6, width=5)
+    game.SetMap((8, 1), 3)
+    game.Swap()
+    state = game.GetState()
+
+    self.assertEqual(state.rows, tuple(game.bit_map))
+    self.assertEqual(state.held_piece, game.held_piece.id)
+    self.assertEqual(state.piece_list, tuple(p.id for p in game.piece_list))
+    p = game.current_piece
+    self.assertEqual(state.current_piece, (p.id, p.x, p.y, p.state))
+
+    with self.assertRaises(AttributeError):
+      state.score = 1
+
+    self.assertEqual(state, game.GetState())
+    self.assertEqual(hash(state), hash(game.GetState()))
+    self.assertEqual(len({state, game.GetState()}), 1)
+
+    game.Move(actions.Action(dir=actions.LEFT))
+    self.assertNotEqual(state, game.GetState())
+
+  def test_GetState_Pickle(self):
+    state = self.game.GetState()
+    another = pickle.loads(pickle.dumps(state))
+    self.assertEqual(state, another)
+    self.assertEqual(hash(state), hash(another))
+    # The cached hash is not pickled.
+    (_, args) = state.__reduce__()
+    self.assertEqual(len(args), len(game_client.GameState._FIELDS))
+    self.assertNotIn(state._hash, args)
+
+  def test_CreateGameFromState(self):
+    game = game_client.GameClient(height=6, width=5)
+    game.SetMap((8, 1), 3)
+    game.SetMap((9, 0), 2)
+    game.Swap()
+    game.Move(actions.Action(dir=actions.LEFT))
+    game.SetLevel(3)
+
+    another = game_client.CreateGameFromState(game.GetState())
+    self.assertEqual(game.GetState(), another.GetState())
+    self.assertTrue(np.array_equal(game.color_map, another.color_map))
+    self.assertEqual(game.color_map.dtype, another.color_map.dtype)
+    self.assertEqual(game.current_piece, another.current_piece)
+    self.assertEqual(game._current_spawn_interval,
+                     another._current_spawn_interval)
+
+    another.ProcessActions([actions.Action(dir=actions.HARD_DROP)])
+    self.assertEqual(another.piece_dropped, game.piece_dropped + 1)
+
+  def _AssertColumnTops(self, game):
+    n_rows = game.height + game.map_height_padding
+    for j in range(game.width):
+      occupied = np.nonzero(game.color_map[:, j])[0]
+      self.assertEqual(game._column_tops[j],
+                       occupied[0] if len(occupied) else n_rows)
+
+  def test_ColumnTops(self):
+    game = game_client.GameClient(height=8, width=6, seed=2)
+    rng = np.random.default_rng(2)
+    game.SetWholeMap((rng.random(game.color_map.shape) < 0.2).astype(int))
+    self._AssertColumnTops(game)
+
+    game.SetMap((2, 3), 1)
+    self._AssertColumnTops(game)
+    game.SetMap((2, 3), 0)
+    self._AssertColumnTops(game)
+
+    clone = game.SearchClone()
+    while not clone.is_gameover:
+      clone.ProcessAction(actions.Action(dir=actions.HARD_DROP))
+      self._AssertColumnTops(clone)
+    self._AssertColumnTops(game)
+
+  def _AssertBoardStats(self, game):
+    occupied = game.color_map != 0
+    heights = [0 if not np.any(col) else len(col) - np.argmax(col)
+               for col in occupied.T]
+    self.assertEqual(game.column_heights.tolist(), heights)
+    self.assertEqual(game.column_holes.tolist(),
+                     [h - np.sum(col) for (h, col) in zip(heights, occupied.T)])
+    self.assertEqual(game.row_fills.tolist(), np.sum(occupied, axis=1).tolist())
+
+  def test_BoardStats(self):
+    game = game_client.GameClient(height=8, width=6, seed=2)
+    self._AssertBoardStats(game)
+    rng = np.random.default_rng(2)
+    game.SetWholeMap((rng.random(game.color_map.shape) < 0.2).astype(int))
+    self._AssertBoardStats(game)
+
+    game.SetMap((2, 3), 1)
+    game.SetMap((2, 3), 1)
+    self._AssertBoardStats(game)
+    game.SetMap((2, 3), 0)
+    self._AssertBoardStats(game)
+    with self.assertRaises(ValueError):
+      game.column_heights[0] = 1
+
+    clone = game.SearchClone()
+    while not clone.is_gameover:
+      clone.ProcessAction(actions.Action(dir=actions.HARD_DROP))
+      self._AssertBoardStats(clone)
+    self._AssertBoardStats(game)
+    self._AssertBoardStats(game_client.CreateGameFromState(clone.GetState()))
+
+    # Line clears.
+    color_map = np.zeros(game.color_map.shape, dtype=int)
+    color_map[-3:, 1:] = 1
+    color_map[-4, 2] = 1
+    game.SetWholeMap(color_map)
+    i = shape.I(start_x=game.height, start_y=-2)
+    i.state = 1
+    self.assertTrue(game.PutPiece(i))
+    self.assertEqual(game.accumulated_lines_eliminated, 3)
+    self._AssertBoardStats(game)
+    self.assertEqual(game.column_heights.tolist(), [1, 0, 1, 0, 0, 0])
+
+  def test_BoardStats_Cached(self):
+    game = game_client.GameClient(height=8, width=6)
+    heights = game.column_heights
+    self.assertIs(game.column_heights, heights)
+
+    clone = game.SearchClone()
+    clone.SetMap((9, 2), 1)
+    self.assertIs(game.column_heights, heights)
+    self.assertIsNot(clone.column_heights, heights)
+    self.assertEqual(clone.column_heights.tolist(), [0, 0, 3, 0, 0, 0])
+    self.assertEqual(clone.column_holes.tolist(), [0, 0, 2, 0, 0, 0])
+
+    game.ProcessAction(actions.Action(dir=actions.HARD_DROP))
+    self.assertIsNot(game.column_heights, heights)
+    self._AssertBoardStats(game)
+
+  def test_DropDistance(self):
+    game = game_client.GameClient(height=8, width=6)
+    rng = np.random.default_rng(4)
+    for _ in range(3):
+      game.SetWholeMap((rng.random(game.color_map.shape) < 0.3).astype(int))
+      for piece_id in range(1, 8):
+        for state in range(4):
+          for x in range(-1, 12):
+            for y in range(-3, 6):
+              piece = shape.GetShapeFromId(piece_id)
+              (piece.x, piece.y, piece.state) = (x, y, state)
+              if not game.CheckValidity(piece):
+                continue
+              expected = 0
+              while game.CheckValidity(piece, (expected + 1, 0)):
+                expected += 1
+              self.assertEqual(game.DropDistance(piece), expected)
+
+  def test_Seed(self):
+    game = game_client.GameClient(height=8, width=6, seed=7)
+    another = game_client.GameClient(height=8, width=6, seed=7)
+    for _ in range(20):
+      self.assertEqual(game.current_piece.id, another.current_piece.id)
+      game._TakePieceFromList()
+      another._TakePieceFromList()
+
+  def test_PieceListLength(self):
+    game = game_client.GameClient(height=8, width=6, seed=7)
+    lengths = []
+    for _ in range(14):
+      lengths.append(len(game.piece_list))
+      game._TakePieceFromList()
+    # A bag is added when there are at most REFILL_THRESHOLD pieces left.
+    self.assertEqual(lengths, [6, 5, 11, 10, 9, 8, 7, 6, 5, 11, 10, 9, 8, 7])
+
+  def test_TakePiece_NoCopy(self):
+    game = game_client.GameClient(height=8, width=6, seed=3)
+    another = game_client.GameClient(height=8, width=6, seed=3)
+    clone = game.SearchClone()
+    pieces = game._pieces
+    # Pieces to take before the storage is trimmed.
+    n = game_client.PIECE_LIST_TRIM - 1 - game._piece_head
+    for _ in range(n):
+      clone._TakePieceFromList()
+    for _ in range(n):
+      game._TakePieceFromList()
+      another._TakePieceFromList()
+      self.assertIs(game._pieces, pieces)
+      self.assertEqual(game.current_piece.id, another.current_piece.id)
+      self.assertEqual([p.id for p in game.piece_list],
+                       [p.id for p in another.piece_list])
+    # The clone added the pieces first, the game reused them.
+    self.assertIs(clone._pieces, pieces)
+    self.assertEqual(len(pieces), game._piece_end)
+
+    game._TakePieceFromList()
+    another._TakePieceFromList()
+    self.assertIsNot(game._pieces, pieces)
+    self.assertEqual(game._piece_head, 0)
+    self.assertEqual([p.id for p in game.piece_list],
+                     [p.id for p in another.piece_list])
+
+  def test_SetPieceList(self):
+    game = game_client.GameClient(height=8, width=6)
+    next_ids = [p.id for p in game.piece_list]
+    game.piece_list = [shape.T()] + game.piece_list
+    self.assertEqual([p.id for p in game.piece_list], [shape.T().id] + next_ids)
+    game._TakePieceFromList()
+    self.assertEqual(game.current_piece.id, shape.T().id)
+    self.assertEqual([p.id for p in game.piece_list], next_ids)
+
+  def test_CreateGameFromState_SamePieces(self):
+    game = game_client.GameClient(height=8, width=6)
+    another = game_client.CreateGameFromState(game.GetState())
+    for _ in range(20):
+      game._TakePieceFromList()
+      another._TakePieceFromList()
+      self.assertEqual([p.id for p in game.piece_list],
+                       [p.id for p in another.piece_list])
+
   def test_SetMap_BitMap_OK(self):
     self.game = game_client.GameClient(height=5, width=5)
 
@@ -0,0 +1,60 @@
+# Seeded 7-bag piece generator.
+#
+# SevenBag is an endless stream of piece ids made of shuffled bags of the 7
+# pieces.  The stream is generated in chunks of bags with NumPy, and chunk k
+# only depends on (seed, k):
+#  - Two games with the same seed get the same pieces, and games with different
+#    seeds get independent sequences.
+#  - A stream never changes once generated, so it is shared by any number of
+#    games (e.g. search clones), each one reading it with its own cursor.
+import functools
+
+import numpy as np
+
+NUM_PIECES = 7
+BAGS_PER_CHUNK = 64
+CHUNK_SIZE = NUM_PIECES * BAGS_PER_CHUNK
+
+
+class SevenBag:
+  def __init__(self, seed: int = None):
+    """
+    :param seed: Non negative int.  If None, a random seed is drawn, see
+           self.seed.
+    """
+    if seed is None:
+      seed = np.random.SeedSequence().entropy
+    self.seed = seed
+    # Chunk index -> read-only array of CHUNK_SIZE piece ids.
+    self._chunks = {}
+
+  def _GetChunk(self, k: int) -> np.ndarray:
+    chunk = self._chunks.get(k)
+    if chunk is None:
+      rng = np.random.default_rng([self.seed, k])
+      bags = np.tile(np.arange(1, NUM_PIECES + 1, dtype=np.int8),
+                     (BAGS_PER_CHUNK, 1))
+      chunk = rng.permuted(bags, axis=1).ravel()
+      chunk.flags.writeable = False
+      # Another thread might have generated the same chunk meanwhile, which is
+      # fine since both are equal.
+      chunk = self._chunks.setdefault(k, chunk)
+    return chunk
+
+  def __getitem__(self, i: int) -> int:
+    """Returns the i-th piece id of the stream."""
+    (k, j) = divmod(i, CHUNK_SIZE)
+    return self._GetChunk(k).item(j)
+
+
+def GetSevenBag(seed: int = None) -> SevenBag:
+  """Returns the stream of the seed, shared by all the callers with the same
+  seed.  If seed is None, returns a new random stream."""
+  if seed is None:
+    return SevenBag()
+  return _GetSharedSevenBag(seed)
+
+
+@functools.lru_cache(maxsize=128)
+def _GetSharedSevenBag(seed: int) -> SevenBag:
+  return SevenBag(seed)
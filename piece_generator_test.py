@@ -0,0 +1,42 @@
+import unittest
+
+import piece_generator
+
+
+class SevenBagTest(unittest.TestCase):
+  def test_Bags(self):
+    bag = piece_generator.SevenBag(seed=1)
+    n = 3 * piece_generator.CHUNK_SIZE
+    ids = [bag[i] for i in range(n)]
+    for i in range(0, n, piece_generator.NUM_PIECES):
+      self.assertEqual(sorted(ids[i:i + piece_generator.NUM_PIECES]),
+                       list(range(1, 8)))
+
+  def test_SameSeed(self):
+    bag1 = piece_generator.SevenBag(seed=5)
+    bag2 = piece_generator.SevenBag(seed=5)
+    # Reads the second chunk first.
+    ids = [bag2[i] for i in reversed(range(1000))][::-1]
+    self.assertEqual([bag1[i] for i in range(1000)], ids)
+
+  def test_DifferentSeeds(self):
+    bag1 = piece_generator.SevenBag(seed=5)
+    bag2 = piece_generator.SevenBag(seed=6)
+    self.assertNotEqual([bag1[i] for i in range(100)],
+                        [bag2[i] for i in range(100)])
+
+  def test_RandomSeed(self):
+    bag = piece_generator.SevenBag()
+    another = piece_generator.SevenBag(seed=bag.seed)
+    self.assertEqual([bag[i] for i in range(100)],
+                     [another[i] for i in range(100)])
+
+  def test_GetSevenBag(self):
+    self.assertIs(piece_generator.GetSevenBag(3),
+                  piece_generator.GetSevenBag(3))
+    self.assertIsNot(piece_generator.GetSevenBag(),
+                     piece_generator.GetSevenBag())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,138 @@
+# Single threaded game loop.
+#
+# TickScheduler runs the gravity, the lock delay and the queued inputs of a
+# GameClient on one loop.  Instead of polling, the loop blocks on the action
+# queue until either an input arrives or the next gravity deadline is reached,
+# so an idle game doesn't use any CPU.
+#
+# Deadlines are measured with a clock:
+#  - MonotonicClock: Real time based on time.monotonic().
+#  - VirtualClock: Waiting for an input doesn't block, the time jumps to the
+#       deadline instead.  Headless simulations use it to advance the gravity
+#       as fast as the CPU allows, and the results are deterministic.
+import queue
+import time
+from typing import Callable
+
+# Most gravity ticks Run() fires back to back once the loop is late, e.g.
+# after a slow input or a stall of the process.  The older missed ticks are dropped
+# and the next one is scheduled from the current time, so a stall doesn't drop
+# the piece several rows at once.
+MAX_CATCH_UP_TICKS = 2
+# Queued by Stop() to wake up a Run() blocked on the action queue.
+_WAKE_UP = object()
+
+
+class MonotonicClock:
+  def Now(self) -> float:
+    return time.monotonic()
+
+  def WaitForInput(self, action_list: queue.Queue, timeout: float | None):
+    """Waits for the next input.
+    :param timeout: Seconds to wait.  None to wait until an input arrives.
+    :return: The input, or None if the timeout is reached.
+    """
+    try:
+      if timeout is None:
+        return action_list.get()
+      return action_list.get(timeout=max(0.0, timeout))
+    except queue.Empty:
+      return None
+
+
+class VirtualClock:
+  def __init__(self, start: float = 0.0):
+    self.now = start
+
+  def Now(self) -> float:
+    return self.now
+
+  def Advance(self, seconds: float):
+    self.now += seconds
+
+  def WaitForInput(self, action_list: queue.Queue, timeout: float | None):
+    """Returns a queued input if there is one, otherwise advances the time by
+    timeout and returns None."""
+    try:
+      return action_list.get_nowait()
+    except queue.Empty:
+      if timeout is not None:
+        self.now += max(0.0, timeout)
+      return None
+
+
+class TickScheduler:
+  def __init__(self, game, clock=None):
+    """
+    :param game: The game_client.GameClient to run.
+    :param clock: MonotonicClock (default) or VirtualClock.
+    """
+    self.game = game
+    self.clock = clock if clock is not None else MonotonicClock()
+    # Time of the next gravity tick, None if the auto drop is disabled.
+    self.next_gravity = None
+    self._stopped = False
+
+  def _GravityInterval(self) -> float:
+    return self.game._current_spawn_interval / 1000
+
+  def _ScheduleGravity(self):
+    if self.game.disable_autodrop:
+      self.next_gravity = None
+    elif self.next_gravity is None:
+      self.next_gravity = self.clock.Now() + self._GravityInterval()
+
+  def AdvanceTo(self, t: float, max_ticks: int = None):
+    """Fires the gravity ticks whose deadlines are not later than t.
+    :param max_ticks: Most ticks to fire.  The remaining missed ticks are
+           dropped and the next one is scheduled an interval after t.  None to
+           fire all of them, e.g. to simulate a span of virtual time.
+    """
+    self._ScheduleGravity()
+    fired = 0
+    while self.next_gravity is not None and self.next_gravity <= t:
+      if fired == max_ticks:
+        self.next_gravity = t + self._GravityInterval()
+        break
+      self.game.GravityTick()
+      fired += 1
+      self.next_gravity += self._GravityInterval()
+      self._ScheduleGravity()
+
+  def Stop(self):
+    """Makes Run() return, right away even if it is waiting for an input.
+    Can be called from another thread."""
+    self._stopped = True
+    self.game.action_list.put(_WAKE_UP)
+
+  def Run(self, until: Callable[[], bool] = None):
+    """Runs the loop until Stop() is called or until() returns True.
+    With a VirtualClock, the loop also returns when there is nothing left to
+    do: no queued input and the auto drop disabled.  A Stop() called before
+    Run() starts makes it return right away.
+    """
+    try:
+      self._Loop(until)
+    finally:
+      self._stopped = False
+
+  def _Loop(self, until: Callable[[], bool] | None):
+    self._ScheduleGravity()
+    while not self._stopped and not (until is not None and until()):
+      timeout = None
+      if self.next_gravity is not None:
+        timeout = self.next_gravity - self.clock.Now()
+
+      act = self.clock.WaitForInput(self.game.action_list, timeout)
+      if act is _WAKE_UP:
+        # Also left by the Stop() of a previous Run(), then ignored.
+        self.game.action_list.task_done()
+        continue
+      if act is not None:
+        self.game.ProcessAction(act)
+        self.game.action_list.task_done()
+      elif timeout is None:
+        # Only a VirtualClock returns without an input here.
+        return
+
+      self.AdvanceTo(self.clock.Now(), MAX_CATCH_UP_TICKS)
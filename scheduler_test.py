@@ -0,0 +1,138 @@
+import queue
+import threading
+import unittest
+
+import actions
+import game_client
+import scheduler
+import shape
+
+
+class TickSchedulerTest(unittest.TestCase):
+  def setUp(self):
+    self.game = game_client.GameClient(height=8, width=6)
+    self.game.SpawnPiece(shape.O(start_x=2, start_y=1))
+    self.clock = scheduler.VirtualClock()
+    self.scheduler = scheduler.TickScheduler(self.game, self.clock)
+
+  def test_GravityInVirtualTime(self):
+    interval = self.game._current_spawn_interval / 1000
+    x = self.game.current_piece.x
+
+    self.scheduler.AdvanceTo(interval / 2)
+    self.assertEqual(self.game.current_piece.x, x)
+
+    self.scheduler.AdvanceTo(interval)
+    self.assertEqual(self.game.current_piece.x, x + 1)
+
+    self.scheduler.Run(until=lambda: self.game.piece_dropped == 1)
+    self.assertEqual(self.game.piece_dropped, 1)
+    self.assertEqual(self.game.last_put_piece.x, 10)
+    self.assertGreater(self.clock.Now(), interval)
+
+  def test_Deterministic(self):
+    self.scheduler.Run(until=lambda: self.game.piece_dropped == 1)
+
+    another = game_client.GameClient(height=8, width=6)
+    another.SpawnPiece(shape.O(start_x=2, start_y=1))
+    clock = scheduler.VirtualClock()
+    scheduler.TickScheduler(another, clock).Run(
+      until=lambda: another.piece_dropped == 1)
+    self.assertEqual(self.clock.Now(), clock.Now())
+
+  def test_InputProcessedBeforeGravity(self):
+    self.game.InputActions([actions.Action(dir=actions.LEFT),
+                            actions.Action(dir=actions.HARD_DROP)])
+    self.scheduler.Run(until=lambda: self.game.piece_dropped == 1)
+
+    self.assertEqual(self.clock.Now(), 0)
+    self.assertEqual(self.game.last_put_piece.y, 0)
+    self.assertTrue(self.game.action_list.empty())
+
+  def test_LockDelay(self):
+    interval = self.game._current_spawn_interval / 1000
+    self.game.current_piece.x = 10
+    # Moving at the bottom enables the lock time.
+    self.game.Move(actions.Action(dir=actions.LEFT))
+    self.game.current_maximum_lock_time = 2 * interval
+
+    self.scheduler.AdvanceTo(2 * interval)
+    self.assertEqual(self.game.piece_dropped, 0)
+    self.scheduler.AdvanceTo(3 * interval)
+    self.assertEqual(self.game.piece_dropped, 1)
+
+  def test_CatchUpCapped(self):
+    interval = self.game._current_spawn_interval / 1000
+    ticks = []
+    self.game.GravityTick = lambda: ticks.append(self.clock.Now())
+
+    # A stall of 5 intervals only fires MAX_CATCH_UP_TICKS ticks.
+    self.scheduler.AdvanceTo(5 * interval, scheduler.MAX_CATCH_UP_TICKS)
+    self.assertEqual(len(ticks), scheduler.MAX_CATCH_UP_TICKS)
+    self.assertEqual(self.scheduler.next_gravity, 6 * interval)
+
+  def test_InputAfterRestart(self):
+    self.game.disable_autodrop = True
+    action_list = self.game.action_list
+    self.game.InputActions([actions.Action(dir=actions.LEFT)])
+    self.game.Restart()
+    self.assertIs(self.game.action_list, action_list)
+    self.assertTrue(action_list.empty())
+
+    self.game.SpawnPiece(shape.O(start_x=2, start_y=1))
+    self.game.InputActions([actions.Action(dir=actions.HARD_DROP)])
+    self.scheduler.Run(until=lambda: self.game.piece_dropped == 1)
+    self.assertEqual(self.game.piece_dropped, 1)
+    self.assertTrue(action_list.empty())
+
+  def test_ReturnsWhenIdle(self):
+    self.game.disable_autodrop = True
+    self.scheduler.Run()
+    self.assertEqual(self.clock.Now(), 0)
+    self.assertEqual(self.game.piece_dropped, 0)
+
+  def test_StopBeforeRun(self):
+    self.scheduler.Stop()
+    self.scheduler.Run()
+    self.assertEqual(self.game.piece_dropped, 0)
+    # The next Run() ignores the wake up left in the queue.
+    self.scheduler.Run(until=lambda: self.game.piece_dropped == 1)
+    self.assertEqual(self.game.piece_dropped, 1)
+
+  def test_Stop(self):
+    def _StopAfterFirstPiece():
+      if self.game.piece_dropped == 1:
+        self.scheduler.Stop()
+      return False
+
+    self.scheduler.Run(until=_StopAfterFirstPiece)
+    self.assertEqual(self.game.piece_dropped, 1)
+
+
+  def test_StopWakesUpRun(self):
+    self.game.disable_autodrop = True
+    runner = scheduler.TickScheduler(self.game, scheduler.MonotonicClock())
+    # Without gravity, Run() waits for an input with no timeout.
+    thread = threading.Thread(target=runner.Run)
+    thread.start()
+    runner.Stop()
+    thread.join(timeout=1)
+    self.assertFalse(thread.is_alive())
+    self.assertEqual(self.game.piece_dropped, 0)
+
+class MonotonicClockTest(unittest.TestCase):
+  def test_WaitForInput(self):
+    clock = scheduler.MonotonicClock()
+    action_list = queue.Queue()
+
+    start = clock.Now()
+    self.assertIsNone(clock.WaitForInput(action_list, 0.01))
+    self.assertGreaterEqual(clock.Now() - start, 0.01)
+
+    act = actions.Action(dir=actions.LEFT)
+    action_list.put(act)
+    self.assertIs(clock.WaitForInput(action_list, 10), act)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -4,7 +4,6 @@
 # Shapes: https://tetris.fandom.com/wiki/SRS
 
 
-import copy
 import abc
 
 import numpy as np
@@ -94,6 +93,12 @@ _BIT_SHAPES_Z = np.array([[12, 6, 0, 0],
                           [0, 12, 6, 0],
                           [4, 12, 8, 0]], dtype=np.uint8)
 
+# Indexed by the piece id.
+SHAPES = (None, _SHAPES_I, _SHAPES_J, _SHAPES_L, _SHAPES_O, _SHAPES_S,
+          _SHAPES_T, _SHAPES_Z)
+BIT_SHAPES = (None, _BIT_SHAPES_I, _BIT_SHAPES_J, _BIT_SHAPES_L,
+              _BIT_SHAPES_O, _BIT_SHAPES_S, _BIT_SHAPES_T, _BIT_SHAPES_Z)
+
 class Shape:
   def __init__(self, start_x: int = 2, start_y: int = 3):
     self.shape = None
@@ -137,19 +142,8 @@ class Shape:
     self.x = self._start_x
     self.y = self._start_y
     self.state = 0
-    self.shape = [None,
-                  _SHAPES_I, _SHAPES_J, _SHAPES_L,
-                  _SHAPES_O, _SHAPES_S, _SHAPES_T,
-                  _SHAPES_Z][self.id]
-
-    self.bit_map = [None,
-                    _BIT_SHAPES_I,
-                    _BIT_SHAPES_J,
-                    _BIT_SHAPES_L,
-                    _BIT_SHAPES_O,
-                    _BIT_SHAPES_S,
-                    _BIT_SHAPES_T,
-                    _BIT_SHAPES_Z][self.id]
+    self.shape = SHAPES[self.id]
+    self.bit_map = BIT_SHAPES[self.id]
 
   def GetShape(self):
     return self.shape[self.state]
@@ -188,7 +182,11 @@ class Shape:
       return hash(self.state) ^ hash(self.x) ^ hash(self.y)
 
   def copy(self):
-    return copy.copy(self)
+    # Faster than copy.copy: the attributes are either ints or shared constant
+    # tables.
+    another = self.__class__.__new__(self.__class__)
+    another.__dict__.update(self.__dict__)
+    return another
 
 class I(Shape):
   def __init__(self, start_x: int = 2, start_y: int = 3):
@@ -232,5 +230,8 @@ class Z(Shape):
     self.id = 7
     self.Init()
 
-def GetShapeFromId(id: int) -> Shape:
-  return [None, I(), J(), L(), O(), S(), T(), Z()][id]
+# Indexed by the piece id.
+SHAPE_CLASSES = (None, I, J, L, O, S, T, Z)
+
+def GetShapeFromId(id: int, start_x: int = 2, start_y: int = 3) -> Shape:
+  return SHAPE_CLASSES[id](start_x=start_x, start_y=start_y)
@@ -0,0 +1,100 @@
+# Headless simulation of a game.
+#
+# Simulator drives a headless GameClient with an explicit Step() call instead of
+# the input queue and the game loop:
+#  - No threads, no locks, no prints and no sleeps.
+#  - The gravity and the lock delay run on a scheduler.VirtualClock, so the
+#    same rules as GameClient.Run() apply, but as fast as the CPU allows.
+#  - The actions are processed directly, InputActions' caps don't apply.
+#
+# Example:
+#   sim = simulator.Simulator(seed_game)
+#   result = sim.Step(placement)         # A shape.Shape where the piece lands.
+#   result = sim.Step([actions.Action(dir=actions.HARD_DROP)])
+import collections
+from typing import List
+
+import actions
+import game_client
+import scheduler
+import shape
+
+# Result of one Step, all the counts are increments made by the step.
+#  - pieces_put: Number of pieces put on the board, 0 if the move is invalid.
+#  - lines_cleared: Number of lines cleared.
+#  - score: Score earned.
+#  - is_gameover: True if the game is over after the step.
+StepResult = collections.namedtuple(
+  "StepResult", ["pieces_put", "lines_cleared", "score", "is_gameover"])
+
+
+class Simulator:
+  def __init__(self, game: game_client.GameClient = None,
+               action_interval: float = 0.0):
+    """
+    :param game: The game to simulate.  If None, a new headless game with the
+           default size is created.  The game is used in place.
+    :param action_interval: Virtual seconds between two actions, the gravity
+           ticks in between are applied.  0 means the inputs are instant, as
+           for a bot.
+    """
+    if game is None:
+      game = game_client.GameClient(headless=True)
+    self.game = game
+    self.action_interval = action_interval
+    self.clock = scheduler.VirtualClock()
+    self._scheduler = scheduler.TickScheduler(game, self.clock)
+
+  def Step(self, move) -> StepResult:
+    """Applies a move.
+    :param move: Either a shape.Shape, the final position of the current (or
+           the swapped) piece, or a list of actions.Action.
+    """
+    game = self.game
+    (pieces, lines, score) = (game.piece_dropped,
+                              game.accumulated_lines_eliminated, game.score)
+    if not game.is_gameover:
+      if isinstance(move, shape.Shape):
+        self._Place(move)
+      else:
+        self._ProcessActions(move)
+    return StepResult(game.piece_dropped - pieces,
+                      game.accumulated_lines_eliminated - lines,
+                      game.score - score, game.is_gameover)
+
+  def AdvanceTime(self, seconds: float):
+    """Lets the gravity run for some virtual seconds without any input."""
+    self._scheduler.AdvanceTo(self.clock.Now() + seconds)
+
+  def _ProcessActions(self, acts: List[actions.Action]):
+    for act in acts:
+      if self.game.is_gameover:
+        return
+      self.game.ProcessAction(act)
+      if self.action_interval:
+        self.AdvanceTime(self.action_interval)
+
+  def _Place(self, piece: shape.Shape):
+    """Puts the piece if it fits and rests on the stack.  Swaps first if the
+    piece is the held one, or the next one when nothing is held.
+
+    The path to the placement is not checked, use a list of actions when the
+    path matters (e.g. for T-spins).
+    """
+    game = self.game
+    if not game.CheckValidity(piece) or game.CheckValidity(piece, (1, 0)):
+      return
+
+    if piece.id != game.current_piece.id:
+      if not game.can_swap:
+        return
+      swapped_id = (game.held_piece.id if game.held_piece is not None
+                    else game.piece_list[0].id)
+      if piece.id != swapped_id:
+        return
+      game.Swap()
+
+    (game.current_piece.x, game.current_piece.y,
+     game.current_piece.state) = (piece.x, piece.y, piece.state)
+    game.last_action = actions.Action(dir=actions.HARD_DROP)
+    game.PutPiece()
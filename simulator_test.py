@@ -0,0 +1,110 @@
+import contextlib
+import io
+import unittest
+
+import numpy as np
+
+import actions
+import game_client
+import shape
+import simulator
+
+
+class SimulatorTest(unittest.TestCase):
+  def setUp(self):
+    self.game = game_client.GameClient(height=8, width=6, headless=True)
+    self.game.SpawnPiece(shape.O(start_x=2, start_y=1))
+    self.sim = simulator.Simulator(self.game)
+
+  def test_StepPlacement(self):
+    o = shape.O()
+    (o.x, o.y) = (10, 0)
+    self.assertEqual(self.sim.Step(o), (1, 0, 0, False))
+    self.assertEqual(self.game.piece_dropped, 1)
+    self.assertEqual(self.game.last_put_piece.y, 0)
+    self.assertTrue(np.all(self.game.color_map[11:, 1:3] == o.id))
+
+  def test_StepPlacement_Invalid(self):
+    o = shape.O()
+    # Floating
+    (o.x, o.y) = (5, 0)
+    self.assertEqual(self.sim.Step(o).pieces_put, 0)
+    # Out of the board
+    (o.x, o.y) = (10, 5)
+    self.assertEqual(self.sim.Step(o).pieces_put, 0)
+    # Not the current piece nor the swapped one
+    t = shape.T()
+    (t.x, t.y) = (10, 0)
+    if self.game.piece_list[0].id != t.id:
+      self.assertEqual(self.sim.Step(t).pieces_put, 0)
+    self.assertEqual(self.game.piece_dropped, 0)
+    self.assertTrue(np.all(self.game.color_map == 0))
+
+  def test_StepPlacement_Swap(self):
+    piece = self.game.piece_list[0].copy()
+    current = shape.T() if piece.id == shape.O().id else shape.O()
+    self.game.SpawnPiece(current)
+    piece.x = 0
+    while self.game.CheckValidity(piece, (1, 0)):
+      piece.x += 1
+    self.assertEqual(self.sim.Step(piece).pieces_put, 1)
+    self.assertEqual(self.game.held_piece.id, current.id)
+    self.assertEqual(self.game.last_put_piece.id, piece.id)
+
+  def test_StepActions(self):
+    result = self.sim.Step([actions.Action(dir=actions.LEFT),
+                            actions.Action(dir=actions.HARD_DROP)])
+    self.assertEqual(result.pieces_put, 1)
+    self.assertEqual(self.game.last_put_piece.y, 0)
+    self.assertEqual(self.sim.clock.Now(), 0)
+
+  def test_StepActions_NotCapped(self):
+    acts = 60 * [actions.Action(dir=actions.LEFT)]
+    acts += [actions.Action(dir=actions.HARD_DROP)]
+    self.assertEqual(self.sim.Step(acts).pieces_put, 1)
+
+  def test_StepActions_Gravity(self):
+    interval = self.game._current_spawn_interval / 1000
+    self.sim.action_interval = interval
+    x = self.game.current_piece.x
+    self.sim.Step([actions.Action(dir=actions.LEFT)])
+    self.assertEqual(self.game.current_piece.x, x + 1)
+
+  def test_AdvanceTime(self):
+    self.sim.AdvanceTime(100)
+    self.assertGreater(self.game.piece_dropped, 0)
+
+  def test_LineClear(self):
+    self.game.SetWholeMap(np.array([
+      # 0  1  2  3  4  5
+      [0, 0, 0, 0, 0, 0],  # -4
+      [0, 0, 0, 0, 0, 0],  # -3
+      [0, 0, 0, 0, 0, 0],  # -2
+      [0, 0, 0, 0, 0, 0],  # -1
+      [0, 0, 0, 0, 0, 0],  # 0
+      [0, 0, 0, 0, 0, 0],  # 1
+      [0, 0, 0, 0, 0, 0],  # 2
+      [0, 0, 0, 0, 0, 0],  # 3
+      [0, 0, 0, 0, 0, 0],  # 4
+      [0, 0, 0, 0, 0, 0],  # 5
+      [1, 1, 1, 1, 0, 0],  # 6
+      [1, 1, 1, 1, 0, 0]]  # 7
+    ))
+    o = shape.O()
+    (o.x, o.y) = (10, 3)
+    result = self.sim.Step(o)
+    self.assertEqual(result.lines_cleared, 2)
+    self.assertGreater(result.score, 0)
+    self.assertTrue(np.all(self.game.color_map == 0))
+
+  def test_NoOutput(self):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      sim = simulator.Simulator(game_client.GameClient(headless=True))
+      while not sim.game.is_gameover:
+        sim.Step([actions.Action(dir=actions.HARD_DROP)])
+    self.assertEqual(output.getvalue(), "")
+
+
+if __name__ == "__main__":
+  unittest.main()
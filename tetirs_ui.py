@@ -127,8 +127,7 @@ class TetrisUI:
 
   def _GetShadowPiece(self) -> shape.Shape:
     piece = self.game.current_piece.copy()
-    while self.game.CheckValidity(piece, (1, 0)):
-      piece.x += 1
+    piece.x += self.game.DropDistance(piece)
     return piece
 
   def _DrawPiece(self, piece: shape.Shape, color=None, offset_i: int = 0,